@@ -1,9 +1,31 @@
 import os
 import json
-from flask import Flask, render_template, request, send_file, redirect, url_for, flash, jsonify, session
-from planner.generator import generate_planner, get_quote
+import datetime
+import io
+import shutil
+import tempfile
+import time
+import uuid
+from urllib.parse import quote
+from flask import Flask, render_template, request, send_file, redirect, url_for, flash, jsonify, session, g
+from planner.generator import generate_planner, get_planner_days, get_quote
 from planner.config import Config
+from planner.settings_store import VersionConflictError
+from planner.jobs import RenderQueue, QueueFullError
+from planner.cache import PlannerCache, make_planner_key
+from planner.batch import parse_batch_file, iter_batch_zip
+from planner.chat_sessions import ChatSessionStore
+from planner.extraction import iter_planner_items
+from planner.llm_cache import llm_cache
+from planner.providers import ProviderRouter, ProviderError, latency_tracker
+from planner.suggestions import (SuggestionRequestError, select_providers, fetch_suggestions,
+                                 keyword_suggestions)
+from planner.suggestion_cache import SuggestionCache
+from planner.metrics import registry as metrics_registry, register_cache, render_stage_seconds, bytes_emitted, count_bytes
+from planner.profiling import profile_store, profile_mode
+from planner.artifacts import generated_files
 from flask_babel import Babel
+from werkzeug.wsgi import ClosingIterator
 
 app = Flask(__name__, 
             template_folder='planner/templates',
@@ -23,12 +45,33 @@ def get_locale():
 # Initialize Babel for internationalization
 babel = Babel(app, locale_selector=get_locale)
 
+# Background render queue for the job API
+render_queue = RenderQueue()
+
+# Cache of finished planners, shared by identical requests
+planner_cache = PlannerCache() if Config.PLANNER_CACHE_ENABLED else None
+
+# Size and age limits for PDFs left in the generated folder
+generated_files.start()
+
+# Parsed AI suggestions for repeated prompts
+suggestion_cache = SuggestionCache()
+
+# Conversation history of chat sessions, shared by all requests
+chat_sessions = ChatSessionStore()
+
+# Cache hit and miss counters exported at /metrics
+if planner_cache is not None:
+    register_cache('planner', planner_cache.stats)
+register_cache('llm', llm_cache.stats)
+register_cache('suggestions', suggestion_cache.stats)
+
 # Make Config class available to all templates
 @app.context_processor
 def inject_config():
     # Create masked_keys dictionary for all templates
     masked_keys = {}
-    api_keys = Config.get_api_keys()
+    api_keys = Config.key_store().snapshot()
     
     for provider, config in Config.AI_MODELS.items():
         key_name = config.get('key_name')
@@ -51,6 +94,52 @@ def inject_config():
     
     return dict(config=Config, masked_keys=masked_keys)
 
+@app.before_request
+def start_profiling():
+    """Run the request under the profiler when profiling is enabled and the request asks for it."""
+    if not Config.PROFILING_ENABLED:
+        return
+    profile_store.release_abandoned()
+    if request.path.startswith('/admin/profiles'):
+        return
+    mode = profile_mode(request.headers.get('X-Profile') or request.args.get('profile'))
+    if mode is None:
+        return
+    capture = profile_store.begin(memory=mode == 'memory')
+    if capture is None:
+        g.profile_busy = True
+    else:
+        g.profile_capture = capture
+
+def profile_info(status):
+    """Request details stored with a profile capture; the query string is left out."""
+    return {'method': request.method, 'path': request.path, 'endpoint': request.endpoint, 'status': status}
+
+@app.after_request
+def finish_profiling(response):
+    capture = g.pop('profile_capture', None)
+    if capture is None:
+        if g.pop('profile_busy', False):
+            response.headers['X-Profile-Capture'] = 'busy'
+        return response
+    
+    info = profile_info(response.status_code)
+    response.headers['X-Profile-Capture'] = capture.id
+    if response.is_streamed:
+        # Streamed bodies are produced after the view returns, so the capture
+        # ends once the server has read the whole body or closed it
+        response.response = after_body(response.response, lambda: profile_store.finish(capture, info))
+    else:
+        profile_store.finish(capture, info)
+    return response
+
+@app.teardown_request
+def abort_profiling(exc):
+    # Reached with a running capture only if after_request was skipped by an unhandled error
+    capture = g.pop('profile_capture', None)
+    if capture is not None:
+        profile_store.finish(capture, profile_info(500))
+
 @app.route('/language/<language>')
 def set_language(language):
     """Set the language for the session"""
@@ -63,48 +152,324 @@ def index():
     """Render the home page with the planner customization form."""
     return render_template('index.html')
 
-@app.route('/generate', methods=['POST'])
-def generate():
-    """Generate a personalized planner based on form data."""
-    # Get form data
-    name = request.form.get('name', '')
-    time_range = request.form.get('time_range', 'week')
-    quote = request.form.get('quote', '')
-    theme = request.form.get('theme', 'Productivity')
-    style = request.form.get('style', 'minimalist')
-    
-    # Get selected components
-    components = {
-        'todo': 'todo' in request.form,
-        'habit_tracker': 'habit_tracker' in request.form,
-        'notes': 'notes' in request.form,
-        'schedule': 'schedule' in request.form,
-        'mood_tracker': 'mood_tracker' in request.form,
-        'goal_setting': 'goal_setting' in request.form,
-        'reflection': 'reflection' in request.form,
-        'gratitude': 'gratitude' in request.form,
-        'water_tracker': 'water_tracker' in request.form
-    }
+# Planner components that can be toggled on the customization form
+PLANNER_COMPONENTS = [
+    'todo', 'habit_tracker', 'notes', 'schedule', 'mood_tracker',
+    'goal_setting', 'reflection', 'gratitude', 'water_tracker'
+]
+
+def get_planner_options(data):
+    """Build generate_planner keyword arguments from form or JSON data."""
+    # JSON clients send components as a list or dict, the HTML form as checkbox fields
+    selected = data.get('components')
+    if isinstance(selected, dict):
+        selected = [component for component, enabled in selected.items() if enabled]
+    elif not isinstance(selected, list):
+        selected = data
+    components = {component: component in selected for component in PLANNER_COMPONENTS}
     
     # Get habits if habit tracker is selected
     habits = []
     if components['habit_tracker']:
-        habits = request.form.get('habits', '').split(',')
+        habits = data.get('habits', '')
+        if isinstance(habits, str):
+            habits = habits.split(',')
+        if not isinstance(habits, list) or not all(isinstance(habit, str) for habit in habits):
+            raise ValueError('Habits must be a list of strings or a comma-separated string')
         habits = [habit.strip() for habit in habits if habit.strip()]
     
+    # Optional explicit span of days (YYYY-MM-DD), overrides time_range
+    dates = {}
+    for field in ('start_date', 'end_date'):
+        value = data.get(field)
+        if value:
+            if not isinstance(value, str):
+                raise ValueError(f'{field} must be a date string (YYYY-MM-DD)')
+            dates[field] = datetime.date.fromisoformat(value)
+    
+    options = {
+        **dates,
+        'name': data.get('name', ''),
+        'time_range': data.get('time_range', 'week'),
+        'quote': data.get('quote', ''),
+        'theme': data.get('theme', 'Productivity'),
+        'style': data.get('style', 'minimalist'),
+        'components': components,
+        'habits': habits
+    }
+    # JSON clients can send any type; the renderer expects text
+    for field in ('name', 'time_range', 'quote', 'theme', 'style'):
+        if not isinstance(options[field], str):
+            raise ValueError(f'{field} must be a string')
+    return options
+
+def get_download_name(options):
+    """File name offered to the browser for a generated planner."""
+    return f"{options['name'].lower().replace(' ', '_')}_planner.pdf"
+
+def stream_pdf(buffer, download_name):
+    """Stream a rendered PDF from a file object in chunks, closing it afterwards."""
+    size = buffer.tell()
+    buffer.seek(0)
+    
+    def generate_chunks():
+        try:
+            while True:
+                chunk = buffer.read(Config.PDF_STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            buffer.close()
+    
+    response = app.response_class(generate_chunks(), mimetype='application/pdf')
+    response.headers['Content-Length'] = str(size)
+    # Same encoding send_file uses, so non-Latin names survive the header
+    try:
+        download_name.encode('latin-1')
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    return response
+
+def after_body(body, callback):
+    """
+    Wrap a response body so that callback runs once the body is used up or closed.
+    
+    Servers that read the whole body but never close it still get the
+    callback, on the thread that produced the body; whichever happens
+    first, the callback runs only once.
+    
+    Args:
+        body: Response body iterable
+        callback: Function to call without arguments
+    
+    Returns:
+        The wrapped body
+    """
+    done = []
+    
+    def finish():
+        if not done:
+            done.append(True)
+            callback()
+    
+    def chunks():
+        yield from body
+        finish()
+    
+    closers = [body.close] if hasattr(body, 'close') else []
+    return ClosingIterator(chunks(), closers + [finish])
+
+def track_sent_pdf(response):
+    """Record the send stage and the size of a PDF response once the server has sent it."""
+    start = time.perf_counter()
+    
+    def record():
+        render_stage_seconds.observe(time.perf_counter() - start, stage='send')
+        bytes_emitted.inc(response.content_length or 0, kind='pdf')
+    
+    # send_file responses are passed through to the server without the
+    # response's close callbacks, so the body iterable itself is wrapped
+    response.response = after_body(response.response, record)
+    return response
+
+def send_pdf_file(pdf_file, download_name):
+    """Send a PDF from an open file, which stays readable even if its path is removed meanwhile."""
+    response = send_file(pdf_file, mimetype='application/pdf', as_attachment=True, download_name=download_name)
+    # send_file only knows the size of paths and in-memory buffers
+    response.content_length = os.fstat(pdf_file.fileno()).st_size
+    return track_sent_pdf(response)
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    """Generate a personalized planner based on form data.
+    
+    Rendered inline on purpose: the HTML form expects the PDF as the response
+    to its POST. API clients that should not hold a connection open while a
+    planner renders use the job queue (/api/jobs) instead.
+    """
+    try:
+        options = get_planner_options(request.form)
+        get_planner_days(options['time_range'], options.get('start_date'), options.get('end_date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    download_name = get_download_name(options)
+    
+    # Serve an identical earlier planner without rendering
+    cache_key = None
+    if planner_cache is not None:
+        cache_key = make_planner_key(options)
+        pdf_file = planner_cache.get(cache_key)
+        if pdf_file is not None:
+            return send_pdf_file(pdf_file, download_name)
+    
+    # Render into memory (spilling to a temp file only past PDF_SPOOL_MAX_SIZE)
+    if Config.PDF_OUTPUT_MODE == 'stream':
+        buffer = tempfile.SpooledTemporaryFile(max_size=Config.PDF_SPOOL_MAX_SIZE)
+        generate_planner(output=buffer, **options)
+        if cache_key is not None:
+            size = buffer.tell()
+            planner_cache.put(cache_key, buffer)
+            buffer.seek(size)
+        return track_sent_pdf(stream_pdf(buffer, download_name))
+    
     # Generate the planner
-    pdf_path = generate_planner(
-        name=name,
-        time_range=time_range,
-        quote=quote,
-        theme=theme,
-        style=style,
-        components=components,
-        habits=habits
-    )
+    pdf_path = generate_planner(**options)
+    if cache_key is not None:
+        # Opened before the cache takes it over, since another request may evict it at any time
+        pdf_file = open(pdf_path, 'rb')
+        try:
+            planner_cache.put(cache_key, pdf_path)
+        except Exception:
+            pdf_file.close()
+            raise
+        return send_pdf_file(pdf_file, download_name)
+    generated_files.track(pdf_path)
     
     # Send the generated PDF file
-    return send_file(pdf_path, as_attachment=True, download_name=f"{name.lower().replace(' ', '_')}_planner.pdf")
+    return track_sent_pdf(send_file(pdf_path, as_attachment=True, download_name=download_name))
+
+@app.route('/api/jobs', methods=['POST'])
+def create_render_job():
+    """Queue a planner for background rendering and return its job id."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        options = get_planner_options(data)
+        get_planner_days(options['time_range'], options.get('start_date'), options.get('end_date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Resolve the quote here so render workers never start their own quote pool
+    if not options['quote']:
+        options['quote'] = get_quote()
+    
+    try:
+        job = render_queue.submit(options, get_download_name(options))
+    except QueueFullError as e:
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    
+    response = jsonify(dict(job.to_dict(),
+                            status_url=url_for('render_job_status', job_id=job.id),
+                            download_url=url_for('download_render_job', job_id=job.id)))
+    response.status_code = 202
+    response.headers['Location'] = url_for('render_job_status', job_id=job.id)
+    return response
+
+@app.route('/api/batch', methods=['POST'])
+def generate_batch():
+    """Generate many planners at once and stream them back as a ZIP archive."""
+    # Specs come as a JSON list (or {"planners": [...]}) or an uploaded CSV/JSONL file
+    upload = request.files.get('file')
+    try:
+        if upload:
+            specs = parse_batch_file(upload.stream, upload.filename or '')
+        else:
+            specs = request.get_json(silent=True)
+            if isinstance(specs, dict):
+                specs = specs.get('planners')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'No planner specs provided'}), 400
+    if len(specs) > Config.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'A batch can contain at most {Config.BATCH_MAX_ITEMS} planners'}), 400
+    
+    # Invalid specs are reported in the manifest instead of failing the batch
+    items = []
+    shared_quote = None
+    for spec in specs:
+        try:
+            if not isinstance(spec, dict):
+                raise ValueError('Planner spec must be an object')
+            options = get_planner_options(spec)
+            get_planner_days(options['time_range'], options.get('start_date'), options.get('end_date'))
+        except (ValueError, TypeError, AttributeError) as e:
+            # One malformed spec must not fail the whole batch
+            items.append({'error': str(e)})
+            continue
+        
+        # Fetch one quote for the whole batch rather than one per planner
+        if not options['quote']:
+            shared_quote = shared_quote or get_quote()
+            options['quote'] = shared_quote
+        items.append({'options': options})
+    
+    response = app.response_class(count_bytes(iter_batch_zip(items), 'zip'), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename="planners.zip"'
+    return response
+
+@app.route('/api/extract', methods=['POST'])
+def extract_items():
+    """Extract planner items from an uploaded text file and stream them back as JSON lines."""
+    upload = request.files.get('file')
+    if upload:
+        # Flask closes the upload when the view returns, so stream from a copy
+        buffer = tempfile.SpooledTemporaryFile(max_size=Config.PDF_SPOOL_MAX_SIZE)
+        shutil.copyfileobj(upload.stream, buffer)
+        buffer.seek(0)
+        lines = io.TextIOWrapper(buffer, encoding='utf-8-sig', errors='replace')
+    elif request.get_data():
+        lines = request.get_data(as_text=True).splitlines()
+    else:
+        return jsonify({'error': 'No text provided'}), 400
+    
+    def generate_lines():
+        try:
+            for record in iter_planner_items(lines):
+                yield json.dumps(record, ensure_ascii=False) + '\n'
+        finally:
+            if upload:
+                lines.close()
+    
+    return app.response_class(generate_lines(), mimetype='application/x-ndjson')
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def render_job_status(job_id):
+    """API endpoint to check the status of a render job."""
+    job = render_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def download_render_job(job_id):
+    """Send the PDF produced by a finished render job."""
+    job = render_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    status = job.status
+    if status == 'failed':
+        return jsonify(job.to_dict()), 500
+    if status != 'done':
+        # Not ready yet: tell the client to poll again
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Retry-After'] = str(render_queue.retry_after())
+        return response
+    
+    if not os.path.exists(job.path):
+        # Removed by the generated files sweeper
+        return jsonify({'error': 'The PDF of this job has expired'}), 410
+    
+    return track_sent_pdf(send_file(job.path, as_attachment=True, download_name=job.download_name))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """API endpoint to get planner cache counters."""
+    if planner_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(planner_cache.stats(), enabled=True))
+
+@app.route('/api/generated/stats', methods=['GET'])
+def generated_stats():
+    """API endpoint to get the usage of the generated PDF folder."""
+    return jsonify(generated_files.stats())
 
 @app.route('/api/quote', methods=['GET'])
 def api_quote():
@@ -118,218 +483,31 @@ def ai_suggestions():
     data = request.get_json()
     prompt = data.get('prompt', '')
     model_provider = data.get('provider', 'openai')
-    model_name = data.get('model', 'gpt-3.5-turbo')
     
     if not prompt:
         return jsonify({'error': 'No prompt provided'}), 400
     
-    # Check if API key is set for the provider
-    if not Config.is_api_key_set(model_provider) and model_provider != 'lmstudio':
-        return jsonify({'error': f'API key not set for {model_provider}'}), 401
+    try:
+        providers = select_providers(model_provider, data.get('model'))
+    except SuggestionRequestError as e:
+        return jsonify({'error': str(e)}), e.status
+    router = ProviderRouter(providers)
     
-    # If using LM Studio, use the basic chat completion API
-    if model_provider == 'lmstudio':
-        try:
-            from planner.lmstudio_tools import LMStudioToolsClient
-            
-            # Get the base URL and API key for LM Studio
-            base_url = Config.get_base_url('lmstudio')
-            api_key = Config.get_api_key('lmstudio')
-            
-            # Get the selected model
-            model = Config.get_model('lmstudio')
-            
-            # Create the LM Studio client
-            client = LMStudioToolsClient(base_url=base_url, api_key=api_key)
-            
-            # Create a system message that instructs the model to generate planner suggestions
-            system_message = """You are an AI assistant that helps users create personalized planners. 
-            Your task is to suggest additional components or features that would enhance their planner.
-            Provide 3-5 specific suggestions based on the user's current planner configuration.
-            Each suggestion should have a clear title and a brief description explaining its benefits.
-            Format your response as a JSON array of objects with 'title' and 'description' fields."""
-            
-            # Send a chat completion request
-            response = client.chat_completion(
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                model=model,
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            # Check if we got a valid response
-            if "choices" in response and len(response["choices"]) > 0 and "message" in response["choices"][0]:
-                message_content = response["choices"][0]["message"]["content"]
-                
-                # Try to extract JSON from the response
-                try:
-                    # Look for JSON array in the response
-                    import re
-                    import json
-                    
-                    # Try to find JSON array in the text
-                    json_match = re.search(r'\[\s*\{.*\}\s*\]', message_content, re.DOTALL)
-                    
-                    if json_match:
-                        suggestions_json = json_match.group(0)
-                        suggestions = json.loads(suggestions_json)
-                    else:
-                        # If no JSON array found, try to parse the entire response as JSON
-                        suggestions = json.loads(message_content)
-                    
-                    # Ensure we have the expected format
-                    if isinstance(suggestions, list):
-                        formatted_suggestions = []
-                        for suggestion in suggestions:
-                            if isinstance(suggestion, dict) and 'title' in suggestion and 'description' in suggestion:
-                                formatted_suggestions.append({
-                                    'title': suggestion['title'],
-                                    'description': suggestion['description']
-                                })
-                        
-                        if formatted_suggestions:
-                            return jsonify({'suggestions': formatted_suggestions})
-                except (json.JSONDecodeError, ValueError) as e:
-                    # If JSON parsing fails, create suggestions from the text
-                    lines = message_content.split('\n')
-                    suggestions = []
-                    
-                    current_title = None
-                    current_description = []
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                            
-                        # Check if this line looks like a title (numbered or with a special prefix)
-                        if re.match(r'^(\d+[\.\):]|[\-\*]|\*\*|#)', line) or line.isupper():
-                            # If we have a previous title and description, add it to suggestions
-                            if current_title and current_description:
-                                suggestions.append({
-                                    'title': current_title,
-                                    'description': ' '.join(current_description)
-                                })
-                                current_description = []
-                            
-                            # Extract the new title
-                            current_title = re.sub(r'^(\d+[\.\):]|[\-\*]|\*\*|#)\s*', '', line)
-                            current_title = current_title.strip('*').strip()
-                        else:
-                            # This is part of the description
-                            if current_title:
-                                current_description.append(line)
-                    
-                    # Add the last suggestion if there is one
-                    if current_title and current_description:
-                        suggestions.append({
-                            'title': current_title,
-                            'description': ' '.join(current_description)
-                        })
-                    
-                    # If we couldn't parse structured suggestions, create a generic one
-                    if not suggestions:
-                        suggestions = [{
-                            'title': 'AI Recommendation',
-                            'description': message_content
-                        }]
-                    
-                    return jsonify({'suggestions': suggestions})
-            
+    try:
+        model = None if model_provider == 'auto' else providers[0].model
+        result, status = suggestion_cache.get_or_fetch(model_provider, model, prompt,
+                                                       lambda: fetch_suggestions(router, prompt))
+        response = jsonify(result)
+        response.headers['X-Cache'] = status.upper()
+        return response
+    except ProviderError as e:
+        if model_provider == 'lmstudio':
             # If we couldn't get a valid response, return an error
-            return jsonify({'error': 'Failed to get suggestions from LM Studio'}), 500
-            
-        except ImportError:
-            return jsonify({'error': 'LM Studio tools module not available'}), 500
-        except Exception as e:
-            return jsonify({'error': f'Error using LM Studio: {str(e)}'}), 500
-    
-    # For other providers, use the existing keyword-based approach
-    suggestions = []
-    
-    # Check for keywords and add relevant suggestions
-    if any(keyword in prompt.lower() for keyword in ['student', 'class', 'study', 'school', 'college']):
-        suggestions.append({
-            'title': 'Add Class Schedule Component',
-            'description': 'Include a dedicated section for tracking classes with time slots and locations.'
-        })
-        suggestions.append({
-            'title': 'Add Assignment Tracker',
-            'description': 'Include a special to-do section specifically for tracking assignments and due dates.'
-        })
-        suggestions.append({
-            'title': 'Add Study Timer',
-            'description': 'Include a Pomodoro-style study timer section to track focused study sessions.'
-        })
-    
-    if any(keyword in prompt.lower() for keyword in ['work', 'job', 'professional', 'career', 'business']):
-        suggestions.append({
-            'title': 'Add Meeting Notes Section',
-            'description': 'Include a dedicated area for taking notes during meetings.'
-        })
-        suggestions.append({
-            'title': 'Add Project Timeline',
-            'description': 'Include a project tracking section with milestones and deadlines.'
-        })
-        suggestions.append({
-            'title': 'Add Work/Life Balance Tracker',
-            'description': 'Track overtime hours and ensure you maintain a healthy work/life balance.'
-        })
-    
-    if any(keyword in prompt.lower() for keyword in ['fitness', 'workout', 'exercise', 'gym', 'health']):
-        suggestions.append({
-            'title': 'Add Workout Log',
-            'description': 'Include a section to track exercises, sets, reps, and weights.'
-        })
-        suggestions.append({
-            'title': 'Add Nutrition Tracker',
-            'description': 'Track daily water intake, meals, and calories.'
-        })
-        suggestions.append({
-            'title': 'Add Body Measurements Log',
-            'description': 'Track progress with weight, measurements, and other fitness metrics.'
-        })
+            message = e.responses.get('lmstudio', str(e))
+            return jsonify({'error': f'Failed to get suggestions from LM Studio: {message}'}), 500
     
-    # Add some general suggestions if we don't have enough specific ones
-    if len(suggestions) < 3:
-        general_suggestions = [
-            {
-                'title': 'Enhanced Habit Tracker',
-                'description': 'Track multiple habits with color coding and streak counting.'
-            },
-            {
-                'title': 'Goal Setting Framework',
-                'description': 'Include a structured approach to setting and tracking weekly and monthly goals.'
-            },
-            {
-                'title': 'Daily Reflection Prompts',
-                'description': 'Add guided reflection questions for end-of-day journaling.'
-            },
-            {
-                'title': 'Priority Matrix',
-                'description': 'Include a quadrant-based priority system for tasks (urgent/important matrix).'
-            },
-            {
-                'title': 'Mood Tracker',
-                'description': 'Track your daily mood and emotional well-being.'
-            },
-            {
-                'title': 'Gratitude Journal',
-                'description': 'Include a section to write down things you\'re grateful for each day.'
-            }
-        ]
-        
-        # Add general suggestions until we have at least 3
-        for suggestion in general_suggestions:
-            if len(suggestions) >= 3:
-                break
-            if not any(s['title'] == suggestion['title'] for s in suggestions):
-                suggestions.append(suggestion)
-    
-    return jsonify({'suggestions': suggestions})
+    # If no provider could answer, fall back to keyword-based suggestions
+    return jsonify({'suggestions': keyword_suggestions(prompt)})
 
 @app.route('/settings', methods=['GET'])
 def settings():
@@ -339,7 +517,8 @@ def settings():
     return render_template('settings.html', 
                           ai_models=ai_models,
                           languages=Config.LANGUAGES,
-                          current_language=session.get('language', Config.DEFAULT_LANGUAGE))
+                          current_language=session.get('language', Config.DEFAULT_LANGUAGE),
+                          settings_version=Config.key_store().get_version())
 
 @app.route('/api/settings/save-key', methods=['POST'])
 def save_api_key():
@@ -357,11 +536,23 @@ def save_api_key():
     if provider not in Config.AI_MODELS:
         return jsonify({'success': False, 'message': 'Invalid provider'}), 400
     
-    # Save the API key
-    success = Config.save_api_key(provider, api_key, base_url, model)
+    # Save the API key; a client that sends the version it read gets a 409 if it is stale
+    expected_version = data.get('version')
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Invalid settings version'}), 400
+    try:
+        version = Config.save_api_key(provider, api_key, base_url, model,
+                                      expected_version=expected_version)
+    except VersionConflictError as e:
+        return jsonify({'success': False, 'message': str(e), 'version': e.actual}), 409
     
-    if success:
-        return jsonify({'success': True, 'message': f'API key for {provider} saved successfully'})
+    # The version of this write, not a fresh read that may include someone else's
+    if version is not None:
+        return jsonify({'success': True, 'message': f'API key for {provider} saved successfully',
+                        'version': version})
     else:
         return jsonify({'success': False, 'message': 'Failed to save API key'}), 500
 
@@ -536,6 +727,22 @@ def chat():
     """Render the chat page for AI-assisted planner creation."""
     return render_template('chat.html')
 
+def get_chat_session_id(data, cookie_session=None):
+    """
+    Get the chat session id from the request or the cookie session, creating one if needed.
+    
+    Args:
+        data: The request JSON
+        cookie_session: Session dict to read and update (defaults to Flask's session)
+    """
+    if cookie_session is None:
+        cookie_session = session
+    session_id = data.get('session_id') or cookie_session.get('chat_session_id')
+    if not isinstance(session_id, str) or not 0 < len(session_id) <= 64:
+        session_id = uuid.uuid4().hex
+    cookie_session['chat_session_id'] = session_id
+    return session_id
+
 @app.route('/api/chat', methods=['POST'])
 def api_chat():
     """API endpoint for chat with AI."""
@@ -552,28 +759,24 @@ def api_chat():
     
     # Currently only LM Studio is supported for chat
     if provider == 'lmstudio':
+        session_id = get_chat_session_id(data)
         try:
-            from planner.lmstudio_chat import LMStudioChat
-            
-            # Get the base URL and API key for LM Studio
-            base_url = Config.get_base_url('lmstudio')
-            api_key = Config.get_api_key('lmstudio')
-            
-            # Get the selected model
-            model = Config.get_model('lmstudio')
-            
-            # Create the LM Studio chat client
-            chat_client = LMStudioChat(base_url=base_url, api_key=api_key, model=model)
-            
-            # Process the message
-            planner_items, response = chat_client.process_message(message)
+            # One turn at a time per session, so concurrent messages do not interleave
+            with chat_sessions.lock(session_id):
+                chat_client = chat_sessions.get(session_id,
+                                                base_url=Config.get_base_url('lmstudio'),
+                                                api_key=Config.get_api_key('lmstudio'),
+                                                model=Config.get_model('lmstudio'))
+                
+                # Process the message
+                planner_items, response = chat_client.process_message(message)
+                chat_sessions.save(session_id, chat_client)
             
             return jsonify({
                 'response': response,
-                'planner_items': planner_items
+                'planner_items': planner_items,
+                'session_id': session_id
             })
-        except ImportError:
-            return jsonify({'error': 'LM Studio chat module not available'}), 500
         except Exception as e:
             return jsonify({'error': f'Error using LM Studio chat: {str(e)}'}), 500
     else:
@@ -583,6 +786,104 @@ def api_chat():
             'planner_items': []
         })
 
+@app.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """Streaming variant of /api/chat that sends the reply as server-sent events."""
+    data = request.get_json()
+    message = data.get('message', '')
+    provider = data.get('provider', 'lmstudio')
+    
+    if not message:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    if provider != 'lmstudio' and not Config.is_api_key_set(provider):
+        return jsonify({'error': f'API key not set for {provider}'}), 401
+    
+    def sse(event):
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    if provider != 'lmstudio':
+        text = f'Чат с {provider} пока не поддерживается. Пожалуйста, используйте LM Studio.'
+        return app.response_class(sse({'type': 'done', 'response': text, 'planner_items': []}),
+                                  mimetype='text/event-stream')
+    
+    session_id = get_chat_session_id(data)
+    base_url = Config.get_base_url('lmstudio')
+    api_key = Config.get_api_key('lmstudio')
+    model = Config.get_model('lmstudio')
+    
+    def generate_events():
+        # The session lock is held until the stream ends or the client disconnects
+        with chat_sessions.lock(session_id):
+            chat_client = chat_sessions.get(session_id, base_url=base_url, api_key=api_key, model=model)
+            # Closing this generator on client disconnect closes the upstream stream too
+            events = chat_client.stream_message(message)
+            try:
+                for event in events:
+                    if event['type'] == 'done':
+                        ttft = event.pop('ttft')
+                        if ttft is not None:
+                            print(f"Chat stream ({chat_client.model}): first token after {ttft * 1000:.0f} ms")
+                        event['session_id'] = session_id
+                        chat_sessions.save(session_id, chat_client)
+                    yield sse(event)
+            except Exception as e:
+                yield sse({'type': 'error', 'error': f'Error using LM Studio chat: {str(e)}'})
+            finally:
+                events.close()
+    
+    response = app.response_class(generate_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies such as nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/chat/cache/stats', methods=['GET'])
+def chat_cache_stats():
+    """API endpoint reporting how many chat messages were answered from the LLM result cache."""
+    return jsonify(llm_cache.stats())
+
+@app.route('/api/providers/stats', methods=['GET'])
+def provider_stats():
+    """API endpoint reporting the average latency and failures of each AI provider."""
+    return jsonify(latency_tracker.stats())
+
+@app.route('/api/ai-suggestions/cache/stats', methods=['GET'])
+def suggestion_cache_stats():
+    """API endpoint reporting how often AI suggestions were served from the cache."""
+    return jsonify(suggestion_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Render stage timings, model calls and cache counters in the Prometheus text format."""
+    if not Config.METRICS_ENABLED:
+        return render_template('404.html'), 404
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles', methods=['GET'])
+def profile_captures():
+    """List the stored per-request profiles."""
+    if not Config.PROFILING_ENABLED:
+        return render_template('404.html'), 404
+    return render_template('profiles.html', captures=profile_store.list())
+
+@app.route('/admin/profiles/<capture_id>/<kind>', methods=['GET'])
+def download_profile_capture(capture_id, kind):
+    """Send the pstats dump ('prof') or the folded stacks ('folded') of a profile."""
+    path = profile_store.file_path(capture_id, kind) if Config.PROFILING_ENABLED else None
+    if path is None:
+        return render_template('404.html'), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/api/chat/session', methods=['DELETE'])
+def reset_chat_session():
+    """Forget the conversation of the current chat session."""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id') or session.pop('chat_session_id', None)
+    if isinstance(session_id, str) and session_id:
+        chat_sessions.delete(session_id)
+    return jsonify({'success': True})
+
 @app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors."""
@@ -0,0 +1,507 @@
+import asyncio
+import contextlib
+import functools
+import json
+import weakref
+from urllib.parse import parse_qs
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from werkzeug.http import dump_cookie, parse_cookie
+from app import app as flask_app, chat_sessions, suggestion_cache, get_chat_session_id
+from planner.config import Config
+from planner.lmstudio_async import AsyncLMStudioToolsClient, close_async_clients
+from planner.profiling import profile_mode
+from planner.providers import ProviderRouter, ProviderError
+from planner.suggestions import (SuggestionRequestError, select_providers, fetch_suggestions_async,
+                                 keyword_suggestions)
+
+# ASGI entry point: the AI endpoints run as coroutines on the event loop, so
+# a single process can wait on hundreds of model calls, and every other
+# route is passed to the Flask app. Run it with an ASGI server, e.g.
+#
+#     uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+# Largest request body accepted by the async endpoints
+MAX_BODY_SIZE = 1024 * 1024  # bytes
+
+# One lock per chat session, so async requests for a session queue on the event
+# loop rather than in threads; a lock disappears once no request holds it
+_session_locks = weakref.WeakValueDictionary()
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before the response is complete."""
+
+
+class AsyncRequest:
+    """The parts of an HTTP request the async views need."""
+
+    def __init__(self, scope, body: bytes, cookie_session: dict):
+        self.scope = scope
+        self.body = body
+        # Flask's cookie session, decoded; changes are sent back as a new cookie
+        self.session = cookie_session
+        self.original_session = dict(cookie_session)
+
+    def get_json(self):
+        """Return the JSON body as a dict, or None if it is not a JSON object."""
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+class JSONResponse:
+    def __init__(self, data, status: int = 200, headers=None):
+        self.data = data
+        self.status = status
+        self.headers = headers or []
+
+
+class EventStreamResponse:
+    """Server-sent events produced by an async generator of event dicts."""
+
+    def __init__(self, events, headers=None):
+        self.events = events
+        self.headers = headers or []
+
+
+def closing_wsgi(wsgi_app):
+    """
+    Wrap a WSGI app so the body iterables it returns are always closed.
+
+    WsgiToAsgi never calls close() on the body and stops reading it once
+    Content-Length bytes are sent, so the Flask app's close callbacks (send
+    metrics, profile captures) would never run. The body is closed on the
+    thread that reads it: when it is used up, or just before its last chunk
+    when Content-Length is known.
+    """
+    @functools.wraps(wsgi_app)
+    def app(environ, start_response):
+        content_length = []
+
+        def start(status, headers, exc_info=None):
+            for name, value in headers:
+                if name.lower() == 'content-length' and value.isdigit():
+                    content_length.append(int(value))
+            return start_response(status, headers, exc_info)
+
+        body = wsgi_app(environ, start)
+
+        def chunks():
+            sent = 0
+            last = None
+            try:
+                for chunk in body:
+                    sent += len(chunk)
+                    if content_length and sent >= content_length[0]:
+                        last = chunk
+                        break
+                    yield chunk
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            if last is not None:
+                yield last
+
+        return chunks()
+
+    return app
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = _session_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+@contextlib.asynccontextmanager
+async def session_turn(session_id: str):
+    """
+    Hold a chat session for one turn.
+
+    Besides the event loop's own lock, the turn takes chat_sessions.lock(),
+    which the Flask views hold too, so a turn served by them (profiled
+    requests) never interleaves with an async one.
+    """
+    async with _session_lock(session_id):
+        lock = chat_sessions.lock(session_id)
+        acquired = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # The thread still gets the lock eventually; hand it back right away
+            acquired.add_done_callback(lambda future: lock.release())
+            raise
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking call, such as a SQLite write, in the default thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def lmstudio_client() -> AsyncLMStudioToolsClient:
+    return AsyncLMStudioToolsClient(base_url=Config.get_base_url('lmstudio'),
+                                    api_key=Config.get_api_key('lmstudio'))
+
+
+async def ai_suggestions(request):
+    """Async variant of app.ai_suggestions."""
+    data = request.get_json()
+    prompt = data.get('prompt', '')
+    model_provider = data.get('provider', 'openai')
+
+    if not prompt:
+        return JSONResponse({'error': 'No prompt provided'}, 400)
+
+    try:
+        providers = select_providers(model_provider, data.get('model'))
+    except SuggestionRequestError as e:
+        return JSONResponse({'error': str(e)}, e.status)
+    router = ProviderRouter(providers)
+
+    try:
+        model = None if model_provider == 'auto' else providers[0].model
+        result, status = await suggestion_cache.get_or_fetch_async(
+            model_provider, model, prompt, lambda: fetch_suggestions_async(router, prompt))
+        return JSONResponse(result, headers=[('X-Cache', status.upper())])
+    except ProviderError as e:
+        if model_provider == 'lmstudio':
+            message = e.responses.get('lmstudio', str(e))
+            return JSONResponse({'error': f'Failed to get suggestions from LM Studio: {message}'}, 500)
+
+    return JSONResponse({'suggestions': keyword_suggestions(prompt)})
+
+
+async def api_chat(request):
+    """Async variant of app.api_chat."""
+    data = request.get_json()
+    message = data.get('message', '')
+    provider = data.get('provider', 'lmstudio')
+
+    if not message:
+        return JSONResponse({'error': 'No message provided'}, 400)
+
+    if provider != 'lmstudio' and not Config.is_api_key_set(provider):
+        return JSONResponse({'error': f'API key not set for {provider}'}, 401)
+
+    if provider != 'lmstudio':
+        return JSONResponse({
+            'response': f'Чат с {provider} пока не поддерживается. Пожалуйста, используйте LM Studio.',
+            'planner_items': []
+        })
+
+    session_id = get_chat_session_id(data, request.session)
+    try:
+        async with session_turn(session_id):
+            chat_client = await run_sync(chat_sessions.get, session_id,
+                                         base_url=Config.get_base_url('lmstudio'),
+                                         api_key=Config.get_api_key('lmstudio'),
+                                         model=Config.get_model('lmstudio'))
+            planner_items, response = await chat_client.process_message_async(message, lmstudio_client())
+            await run_sync(chat_sessions.save, session_id, chat_client)
+
+        return JSONResponse({
+            'response': response,
+            'planner_items': planner_items,
+            'session_id': session_id
+        })
+    except Exception as e:
+        return JSONResponse({'error': f'Error using LM Studio chat: {str(e)}'}, 500)
+
+
+async def api_chat_stream(request):
+    """Async variant of app.api_chat_stream."""
+    data = request.get_json()
+    message = data.get('message', '')
+    provider = data.get('provider', 'lmstudio')
+
+    if not message:
+        return JSONResponse({'error': 'No message provided'}, 400)
+
+    if provider != 'lmstudio' and not Config.is_api_key_set(provider):
+        return JSONResponse({'error': f'API key not set for {provider}'}, 401)
+
+    if provider != 'lmstudio':
+        text = f'Чат с {provider} пока не поддерживается. Пожалуйста, используйте LM Studio.'
+
+        async def unsupported():
+            yield {'type': 'done', 'response': text, 'planner_items': []}
+        return EventStreamResponse(unsupported())
+
+    session_id = get_chat_session_id(data, request.session)
+
+    async def generate_events():
+        # The session lock is held until the stream ends or the client disconnects
+        async with session_turn(session_id):
+            chat_client = await run_sync(chat_sessions.get, session_id,
+                                         base_url=Config.get_base_url('lmstudio'),
+                                         api_key=Config.get_api_key('lmstudio'),
+                                         model=Config.get_model('lmstudio'))
+            events = chat_client.stream_message_async(message, lmstudio_client())
+            try:
+                async for event in events:
+                    if event['type'] == 'done':
+                        ttft = event.pop('ttft')
+                        if ttft is not None:
+                            print(f"Chat stream ({chat_client.model}): first token after {ttft * 1000:.0f} ms")
+                        event['session_id'] = session_id
+                        await run_sync(chat_sessions.save, session_id, chat_client)
+                    yield event
+            except Exception as e:
+                yield {'type': 'error', 'error': f'Error using LM Studio chat: {str(e)}'}
+            finally:
+                await events.aclose()
+
+    return EventStreamResponse(generate_events())
+
+
+async def test_api_key(request):
+    """Async variant of app.test_api_key."""
+    data = request.get_json()
+    provider = data.get('provider')
+    api_key = data.get('api_key')
+
+    if not provider:
+        return JSONResponse({'success': False, 'message': 'Provider is required'}, 400)
+
+    if provider not in Config.AI_MODELS:
+        return JSONResponse({'success': False, 'message': 'Invalid provider'}, 400)
+
+    if provider == 'lmstudio':
+        base_url = data.get('base_url') or Config.get_base_url('lmstudio')
+        api_key = api_key or Config.get_api_key('lmstudio')
+        model = data.get('model') or Config.get_model('lmstudio') or 'local-model'
+        try:
+            client = AsyncLMStudioToolsClient(base_url=base_url, api_key=api_key)
+            response = await client.chat_completion(
+                messages=[{"role": "user", "content": "Hello"}],
+                model=model,
+                max_tokens=10
+            )
+        except Exception as e:
+            return JSONResponse({'success': False, 'message': f'Error testing LM Studio connection: {str(e)}'}, 500)
+
+        if "error" in response:
+            return JSONResponse({'success': False,
+                                 'message': f'Error connecting to LM Studio: {response["message"]}'}, 500)
+        return JSONResponse({'success': True, 'message': 'Successfully connected to LM Studio'})
+
+    if not Config.is_api_key_set(provider) and not api_key:
+        return JSONResponse({'success': False, 'message': f'API key not set for {provider}'}, 401)
+
+    return JSONResponse({'success': True, 'message': f'API key for {provider} is valid'})
+
+
+# Routes served on the event loop; everything else goes to Flask
+ROUTES = {
+    ('POST', '/api/ai-suggestions'): ai_suggestions,
+    ('POST', '/api/chat'): api_chat,
+    ('POST', '/api/chat/stream'): api_chat_stream,
+    ('POST', '/api/settings/test-key'): test_api_key,
+}
+
+
+async def _read_body(receive):
+    """Read the request body; None if the client disconnected or sent too much."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _race(coro, disconnect: asyncio.Future, deadline: float):
+    """
+    Await coro unless the client disconnects or the deadline passes first.
+
+    The losing coroutine is cancelled and awaited, so its cleanup, such as
+    closing the connection to the model server, is done before returning.
+
+    Raises:
+        ClientDisconnected: If the client disconnected
+        asyncio.TimeoutError: If the deadline passed
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(coro)
+    done, _ = await asyncio.wait({task, disconnect}, timeout=max(0.0, deadline - loop.time()),
+                                 return_when=asyncio.FIRST_COMPLETED)
+    if task in done:
+        return task.result()
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    if disconnect in done:
+        raise ClientDisconnected()
+    raise asyncio.TimeoutError()
+
+
+class AsyncAIApp:
+    """ASGI app serving ROUTES itself and passing other requests to a Flask app.
+
+    Each async request runs as a task that is cancelled when the client
+    disconnects or Config.AI_REQUEST_TIMEOUT passes, which in turn cancels
+    the model call it is waiting on.
+    """
+
+    def __init__(self, wsgi_app):
+        self.flask_app = wsgi_app
+        self.wsgi = WsgiToAsgi(closing_wsgi(wsgi_app))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        handler = ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is not None and Config.PROFILING_ENABLED and self._profile_requested(scope):
+            # cProfile cannot follow a coroutine across the event loop, so profiled
+            # requests are served by the equivalent Flask view on a thread instead
+            handler = None
+        if handler is None:
+            # A thread per request; by default asgiref runs all of them on one thread
+            async with ThreadSensitiveContext():
+                await self.wsgi(scope, receive, send)
+            return
+        await self._handle(handler, scope, receive, send)
+
+    @staticmethod
+    def _profile_requested(scope) -> bool:
+        headers = dict(scope.get('headers') or [])
+        value = headers.get(b'x-profile', b'').decode('latin-1')
+        if not value:
+            value = (parse_qs(scope.get('query_string', b'').decode('latin-1')).get('profile') or [''])[0]
+        return profile_mode(value) is not None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_async_clients()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle(self, handler, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.AI_REQUEST_TIMEOUT
+        body = await _read_body(receive)
+        if body is None:
+            await self._send_json(send, {'error': 'Request body too large'}, 413)
+            return
+
+        request = AsyncRequest(scope, body, self._load_session(scope))
+        if request.get_json() is None:
+            await self._send_json(send, {'error': 'Invalid JSON'}, 400)
+            return
+
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            try:
+                response = await _race(handler(request), disconnect, deadline)
+            except ClientDisconnected:
+                return
+            except asyncio.TimeoutError:
+                await self._send_json(send, {'error': 'The AI provider did not answer in time'}, 504)
+                return
+
+            headers = response.headers + self._session_headers(request)
+            if isinstance(response, EventStreamResponse):
+                await self._send_events(send, response.events, headers, disconnect, deadline)
+            else:
+                await self._send_json(send, response.data, response.status, headers)
+        finally:
+            disconnect.cancel()
+
+    async def _send_json(self, send, data, status: int = 200, headers=()):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': self._encode_headers([('Content-Type', 'application/json'),
+                                                     ('Content-Length', str(len(body)))] + list(headers))})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_events(self, send, events, headers, disconnect, deadline):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': self._encode_headers([('Content-Type', 'text/event-stream'),
+                                                     ('Cache-Control', 'no-cache'),
+                                                     # Keep reverse proxies such as nginx from buffering the stream
+                                                     ('X-Accel-Buffering', 'no')] + headers)})
+        try:
+            while True:
+                try:
+                    event = await _race(events.__anext__(), disconnect, deadline)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    event = {'type': 'error', 'error': 'The AI provider did not answer in time'}
+                    await send({'type': 'http.response.body', 'body': self._sse(event), 'more_body': True})
+                    break
+                await send({'type': 'http.response.body', 'body': self._sse(event), 'more_body': True})
+        except ClientDisconnected:
+            return
+        finally:
+            await events.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    def _sse(event) -> bytes:
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')
+
+    @staticmethod
+    def _encode_headers(headers):
+        return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    def _load_session(self, scope) -> dict:
+        """Decode Flask's signed session cookie, so both halves share one session."""
+        interface = self.flask_app.session_interface
+        serializer = interface.get_signing_serializer(self.flask_app)
+        cookie_header = b'; '.join(value for name, value in scope.get('headers', []) if name == b'cookie')
+        value = parse_cookie(cookie_header.decode('latin-1')).get(interface.get_cookie_name(self.flask_app))
+        if not value or serializer is None:
+            return {}
+        try:
+            max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+            return dict(serializer.loads(value, max_age=max_age))
+        except BadSignature:
+            return {}
+
+    def _session_headers(self, request: AsyncRequest):
+        """Return a Set-Cookie header if the view changed the session."""
+        if request.session == request.original_session:
+            return []
+        app = self.flask_app
+        interface = app.session_interface
+        value = interface.get_signing_serializer(app).dumps(request.session)
+        cookie = dump_cookie(interface.get_cookie_name(app), value,
+                             domain=interface.get_cookie_domain(app), path=interface.get_cookie_path(app),
+                             secure=interface.get_cookie_secure(app), httponly=interface.get_cookie_httponly(app),
+                             samesite=interface.get_cookie_samesite(app))
+        return [('Set-Cookie', cookie)]
+
+
+application = AsyncAIApp(flask_app)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+Benchmark planner rendering.
+
+Times planner.generator.generate_planner over every time range, style,
+combination of the components that change the page and habit list size,
+and generate_day_page over the same styles and components. Results are
+written as JSON and can be compared against a baseline saved earlier on
+the same machine; the script exits with status 1 if any case got slower,
+used more memory or produced a larger PDF than the threshold allows.
+
+    python benchmark.py --save-baseline           # record a baseline
+    python benchmark.py                           # compare against it
+    python benchmark.py --time-range day --style minimalist --repeat 1
+"""
+
+import argparse
+import datetime
+import gc
+import io
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import reportlab
+from reportlab import rl_config
+from pypdf import PdfReader
+
+from planner import generator
+from planner.config import Config
+from planner.styles import get_planner_styles
+
+# Components that add sections to a day page; the other checkboxes of the
+# form do not change the rendered PDF, so they are left out of the matrix
+RENDERED_COMPONENTS = ('schedule', 'todo', 'habit_tracker', 'notes')
+
+TIME_RANGES = ('day', 'week', 'month')
+HABIT_SIZES = (1, 5, 15)
+
+# Fixed dates, so the number of days of a month planner does not depend on today
+START_DATE = datetime.date(2025, 1, 6)
+TIME_RANGE_SPANS = {
+    'day': (START_DATE, START_DATE),
+    'week': (START_DATE, START_DATE + datetime.timedelta(days=6)),
+    'month': (datetime.date(2025, 1, 1), datetime.date(2025, 1, 31))
+}
+
+BENCHMARK_QUOTE = '"The future depends on what you do today." - Mahatma Gandhi'
+
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# Metrics compared against the baseline; smaller is better for all of them
+COMPARED_METRICS = ('seconds', 'peak_memory', 'bytes')
+
+
+@contextmanager
+def stubbed_quotes():
+    """Replace get_quote so no case waits on or varies with the quote API."""
+    original = generator.get_quote
+    generator.get_quote = lambda: BENCHMARK_QUOTE
+    try:
+        yield
+    finally:
+        generator.get_quote = original
+
+
+def component_sets():
+    """Yield every combination of RENDERED_COMPONENTS as a components dict."""
+    for size in range(len(RENDERED_COMPONENTS) + 1):
+        for enabled in itertools.combinations(RENDERED_COMPONENTS, size):
+            yield {component: component in enabled for component in RENDERED_COMPONENTS}
+
+
+def habit_lists(components, habit_sizes):
+    """Habit lists to try: one per size with the habit tracker, none without it."""
+    if not components['habit_tracker']:
+        return [[]]
+    return [[f"Habit {i + 1}" for i in range(size)] for size in habit_sizes]
+
+
+def case_id(*parts, components, habits):
+    enabled = '+'.join(name for name, on in components.items() if on) or 'none'
+    return '/'.join(parts + (enabled, f"h{len(habits)}"))
+
+
+def measure(func, repeat):
+    """
+    Run func repeat times for timing and once more under tracemalloc.
+
+    Returns:
+        The best and median wall time, the peak traced memory in bytes and
+        the result of the last timed call
+    """
+    times = []
+    result = None
+    # Like timeit, keep garbage collection pauses of earlier cases out of the timings
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    # Tracing slows allocation down, so memory is measured in a separate run
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak, result
+
+
+def bench_planner(time_range, style, components, habits, renderer, repeat):
+    """Benchmark one generate_planner call rendering into memory."""
+    start_date, end_date = TIME_RANGE_SPANS[time_range]
+
+    def render():
+        buffer = io.BytesIO()
+        # An empty quote goes through the (stubbed) get_quote like a form without one
+        generator.generate_planner('Benchmark', time_range, '', 'Productivity', style, components,
+                                   habits, output=buffer, renderer=renderer,
+                                   start_date=start_date, end_date=end_date)
+        return buffer.getvalue()
+
+    best, median, peak, pdf = measure(render, repeat)
+    pages = len(PdfReader(io.BytesIO(pdf)).pages)
+    return {
+        'time_range': time_range,
+        'style': style,
+        'components': [name for name, on in components.items() if on],
+        'habits': len(habits),
+        'pages': pages,
+        'seconds': round(best, 6),
+        'median_seconds': round(median, 6),
+        'pages_per_sec': round(pages / best, 2),
+        'peak_memory': peak,
+        'bytes': len(pdf)
+    }
+
+
+def bench_day_page(style, components, habits, iterations, repeat):
+    """Benchmark building the flowables of a day page without a shared template."""
+    styles = get_planner_styles(style)
+
+    def build():
+        for _ in range(iterations):
+            generator.generate_day_page(START_DATE, styles, components, habits)
+
+    best, median, peak, _ = measure(build, repeat)
+    return {
+        'style': style,
+        'components': [name for name, on in components.items() if on],
+        'habits': len(habits),
+        'iterations': iterations,
+        'seconds': round(best / iterations, 9),
+        'median_seconds': round(median / iterations, 9),
+        'pages_per_sec': round(iterations / best, 2),
+        'peak_memory': peak
+    }
+
+
+def run_benchmarks(args):
+    """Run the benchmark matrix and return the results document."""
+    # Reproducible PDFs: no timestamps or random document ids in the output
+    rl_config.invariant = 1
+    results = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'reportlab': reportlab.Version,
+            'platform': platform.platform(),
+            'renderer': args.renderer,
+            'repeat': args.repeat
+        },
+        'planner': {},
+        'day_page': {}
+    }
+
+    with stubbed_quotes():
+        # Warm up imports, fonts and the style registry before anything is timed
+        bench_planner('day', args.styles[0], next(component_sets()), [], args.renderer, 1)
+
+        for time_range, style, components in itertools.product(args.time_ranges, args.styles, component_sets()):
+            for habits in habit_lists(components, args.habit_sizes):
+                key = case_id(args.renderer, time_range, style, components=components, habits=habits)
+                result = bench_planner(time_range, style, components, habits, args.renderer, args.repeat)
+                results['planner'][key] = result
+                print(f"{key:60} {result['seconds'] * 1000:9.1f} ms {result['pages_per_sec']:8.1f} pages/s "
+                      f"{result['peak_memory'] / 1024:9.0f} KiB {result['bytes'] / 1024:8.1f} KiB")
+
+        if args.day_iterations:
+            for style, components in itertools.product(args.styles, component_sets()):
+                for habits in habit_lists(components, args.habit_sizes):
+                    key = case_id(style, components=components, habits=habits)
+                    result = bench_day_page(style, components, habits, args.day_iterations, args.repeat)
+                    results['day_page'][key] = result
+                    print(f"day page {key:51} {result['seconds'] * 1e6:9.1f} us "
+                          f"{result['pages_per_sec']:8.1f} pages/s {result['peak_memory'] / 1024:9.0f} KiB")
+
+    planner_results = results['planner'].values()
+    total_seconds = sum(r['seconds'] for r in planner_results)
+    total_pages = sum(r['pages'] for r in planner_results)
+    results['totals'] = {
+        'cases': len(results['planner']) + len(results['day_page']),
+        'planner_seconds': round(total_seconds, 6),
+        'planner_pages': total_pages,
+        'pages_per_sec': round(total_pages / total_seconds, 2) if total_seconds else 0.0,
+        'bytes': sum(r['bytes'] for r in planner_results)
+    }
+    return results
+
+
+def compare(results, baseline, threshold, min_seconds, min_memory):
+    """
+    Find cases that regressed against the baseline.
+
+    A metric regresses when it grew by more than threshold (a fraction)
+    over the baseline. Timings must also have grown by more than
+    min_seconds and peak memory by more than min_memory bytes, so noise in
+    small cases is ignored. Cases missing from either side are skipped.
+
+    Returns:
+        A list of (section, case, metric, baseline value, new value)
+    """
+    regressions = []
+    for section in ('planner', 'day_page'):
+        old_cases = baseline.get(section, {})
+        for key, new in results.get(section, {}).items():
+            old = old_cases.get(key)
+            if old is None:
+                continue
+            for metric in COMPARED_METRICS:
+                if metric not in new or not old.get(metric):
+                    continue
+                limit = old[metric] * (1 + threshold)
+                if metric == 'seconds':
+                    limit = max(limit, old[metric] + min_seconds / new.get('iterations', 1))
+                elif metric == 'peak_memory':
+                    limit = max(limit, old[metric] + min_memory)
+                if new[metric] > limit:
+                    regressions.append((section, key, metric, old[metric], new[metric]))
+    return regressions
+
+
+def parse_sizes(value):
+    return tuple(int(size) for size in value.split(',') if size.strip())
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Benchmark planner PDF rendering.')
+    parser.add_argument('--time-range', dest='time_ranges', action='append', choices=TIME_RANGES,
+                        help='time range to benchmark, may be repeated (default: all)')
+    parser.add_argument('--style', dest='styles', action='append', choices=sorted(Config.STYLES),
+                        help='style to benchmark, may be repeated (default: all)')
+    parser.add_argument('--habit-sizes', type=parse_sizes, default=HABIT_SIZES,
+                        help='comma-separated habit list sizes (default: %(default)s)')
+    parser.add_argument('--renderer', choices=('platypus', 'canvas'), default=Config.PDF_RENDERER,
+                        help='PDF engine (default: Config.PDF_RENDERER)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case, the best counts (default: 5)')
+    parser.add_argument('--day-iterations', type=int, default=50,
+                        help='generate_day_page calls per timed run, 0 to skip (default: 50)')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='results file (default: %(default)s)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed growth of any metric over the baseline, as a fraction (default: 0.10)')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='timing differences below this are never regressions (default: 0.005)')
+    parser.add_argument('--min-memory', type=int, default=64 * 1024,
+                        help='peak memory differences in bytes below this are never regressions (default: 65536)')
+    args = parser.parse_args(argv)
+    args.time_ranges = args.time_ranges or list(TIME_RANGES)
+    args.styles = args.styles or list(Config.STYLES)
+    args.repeat = max(1, args.repeat)
+
+    results = run_benchmarks(args)
+    totals = results['totals']
+    print(f"\n{totals['cases']} cases, {totals['planner_pages']} pages in {totals['planner_seconds']:.2f} s "
+          f"({totals['pages_per_sec']:.1f} pages/s)")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, args.min_seconds, args.min_memory)
+    for section, key, metric, old, new in regressions:
+        print(f"REGRESSION {section} {key} {metric}: {old} -> {new} ({(new / old - 1) * 100:+.1f}%)")
+    if regressions:
+        print(f"{len(regressions)} regressions above {args.threshold * 100:.0f}%")
+        return 1
+    print(f"No regressions above {args.threshold * 100:.0f}% against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import datetime
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from .config import Config
+
+
+class ArtifactManager:
+    """Size and age limits for the PDFs written to Config.GENERATED_FOLDER.
+
+    Files are indexed when they are handed over with track(), so the folder
+    is only scanned once, on start(), to adopt files left by an earlier run.
+    A background thread deletes expired files and, oldest first, files over
+    the size cap, a batch at a time so deleting a large backlog never holds
+    the index lock for long. Files that cannot be deleted yet (e.g. held
+    open by a download on Windows) stay counted and are retried on the
+    next sweeps.
+    """
+
+    def __init__(self, folder: str = None, max_bytes: int = None, max_age: int = None,
+                 sweep_interval: int = None, sweep_batch: int = None, grace_period: int = None):
+        """
+        Initialize the manager.
+
+        Args:
+            folder: Folder holding generated PDFs (defaults to Config.GENERATED_FOLDER)
+            max_bytes: Total size cap (defaults to Config.GENERATED_MAX_BYTES)
+            max_age: Seconds a file is kept (defaults to Config.GENERATED_MAX_AGE)
+            sweep_interval: Seconds between sweeps (defaults to Config.GENERATED_SWEEP_INTERVAL)
+            sweep_batch: Files deleted per sweep step (defaults to Config.GENERATED_SWEEP_BATCH)
+            grace_period: Seconds a new file is safe from the size cap
+                (defaults to Config.GENERATED_GRACE_PERIOD)
+        """
+        self.folder = folder or Config.GENERATED_FOLDER
+        self.max_bytes = max_bytes if max_bytes is not None else Config.GENERATED_MAX_BYTES
+        self.max_age = max_age if max_age is not None else Config.GENERATED_MAX_AGE
+        self.sweep_interval = sweep_interval or Config.GENERATED_SWEEP_INTERVAL
+        self.sweep_batch = sweep_batch or Config.GENERATED_SWEEP_BATCH
+        self.grace_period = grace_period if grace_period is not None else Config.GENERATED_GRACE_PERIOD
+        self.removed = 0
+        self.total_bytes = 0
+        # path -> (size, created_at), oldest first
+        self._entries = OrderedDict()
+        # path -> size of victims whose deletion failed, retried on each sweep
+        self._retry = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def new_path(self, name: str, time_range: str) -> str:
+        """
+        Create an empty file with a unique name for a planner and return its path.
+
+        Names follow name_time_range_YYYYmmddHHMMSS.pdf, with _2, _3, ...
+        appended when the same planner is generated again within a second.
+        The file is created exclusively, so neither concurrent requests nor
+        render processes can end up writing to the same file.
+
+        Args:
+            name: Name on the planner
+            time_range: Time range of the planner
+
+        Returns:
+            Path of the new file
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        stem = f"{name.lower().replace(' ', '_')}_{time_range}_{timestamp}"
+        for attempt in itertools.count(1):
+            filename = f"{stem}.pdf" if attempt == 1 else f"{stem}_{attempt}.pdf"
+            path = os.path.join(self.folder, filename)
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                continue
+            os.close(fd)
+            return path
+
+    def track(self, path: str):
+        """
+        Add a finished PDF to the index so the sweeper manages it.
+
+        Args:
+            path: Path returned by new_path, once the PDF has been written
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            if path in self._entries:
+                self.total_bytes -= self._entries.pop(path)[0]
+            self._entries[path] = (size, time.time())
+            self.total_bytes += size
+            over_cap = self.total_bytes > self.max_bytes
+        if over_cap:
+            self._wake.set()
+
+    def _load_index(self):
+        # The only scan of the folder: files left by an earlier run, by age
+        try:
+            found = [(entry.stat().st_mtime, entry.path, entry.stat().st_size)
+                     for entry in os.scandir(self.folder)
+                     if entry.is_file() and entry.name.endswith('.pdf')]
+        except FileNotFoundError:
+            return
+        with self._lock:
+            known = [(created_at, path, size) for path, (size, created_at) in self._entries.items()]
+            entries = {path: (size, created_at) for created_at, path, size in found}
+            entries.update({path: (size, created_at) for created_at, path, size in known})
+            self._entries = OrderedDict(sorted(entries.items(), key=lambda item: item[1][1]))
+            self.total_bytes = sum(size for size, _ in self._entries.values())
+
+    def _next_victim(self, now: float) -> Optional[str]:
+        if not self._entries:
+            return None
+        path, (_, created_at) = next(iter(self._entries.items()))
+        if created_at < now - self.max_age:
+            return path
+        if self.total_bytes > self.max_bytes and created_at < now - self.grace_period:
+            return path
+        return None
+
+    def sweep(self, limit: int = None) -> int:
+        """
+        Retry files that could not be deleted before, then delete expired
+        files and the oldest files while over the size cap.
+
+        Args:
+            limit: Most deletions to attempt in this call (defaults to sweep_batch)
+
+        Returns:
+            Number of files deleted
+        """
+        limit = limit or self.sweep_batch
+        now = time.time()
+        with self._lock:
+            retries = list(self._retry.items())[:limit]
+            for path, _ in retries:
+                del self._retry[path]
+        removed = sum(self._remove(path, size) for path, size in retries)
+        attempts = len(retries)
+        while attempts < limit:
+            with self._lock:
+                path = self._next_victim(now)
+                if path is None:
+                    break
+                size, _ = self._entries.pop(path)
+            removed += self._remove(path, size)
+            attempts += 1
+        return removed
+
+    def _remove(self, path: str, size: int) -> bool:
+        # Unlinked outside the lock; a download already in progress keeps its open file
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing generated file {path}: {e}")
+            # Still on disk, so it stays counted until a later sweep manages to delete it
+            with self._lock:
+                self._retry[path] = size
+            return False
+        with self._lock:
+            self.total_bytes -= size
+            self.removed += 1
+        return True
+
+    def _run(self):
+        self._load_index()
+        while True:
+            self._wake.clear()
+            try:
+                removed = self.sweep()
+            except Exception as e:
+                print(f"Error sweeping generated files: {e}")
+                removed = 0
+            # A full batch means more is due; go on right away without hogging the lock
+            if removed < self.sweep_batch:
+                self._wake.wait(self.sweep_interval)
+
+    def start(self):
+        """Index the folder and start the background sweeper if it is not running yet."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='generated-sweeper', daemon=True)
+                self._thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current usage and the number of files deleted so far."""
+        with self._lock:
+            return {
+                'files': len(self._entries) + len(self._retry),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'removed': self.removed
+            }
+
+
+generated_files = ArtifactManager()
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import re
+import time
+import zipfile
+from concurrent.futures import as_completed
+from typing import Dict, Any, List, Iterator, Tuple
+from .cache import make_planner_key
+from .config import Config
+from .metrics import render_stage_seconds, worker_samples, merge_worker_samples
+from .pools import WorkerPool
+from .quotes import quote_provider
+
+# Render processes shared by all batches
+_pool = WorkerPool(Config.BATCH_WORKERS)
+
+
+def _render_to_bytes(options: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """Render one planner in a worker process and return the PDF bytes and the render metrics."""
+    from .generator import generate_planner
+    buffer = io.BytesIO()
+    generate_planner(output=buffer, **options)
+    return buffer.getvalue(), worker_samples()
+
+
+def parse_batch_file(stream, filename: str = '') -> List[Dict[str, Any]]:
+    """
+    Read planner specs from an uploaded CSV or JSONL file.
+
+    CSV files need a header row with the same field names as the JSON API
+    (name, time_range, theme, style, quote, components, habits, start_date,
+    end_date); components are separated by ';' or spaces.
+
+    Args:
+        stream: Binary file object
+        filename: Original file name, used to tell CSV from JSONL
+
+    Returns:
+        A list of raw spec dictionaries
+
+    Raises:
+        ValueError: If a JSONL line is not a JSON object
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    if filename.lower().endswith('.csv'):
+        specs = []
+        for row in csv.DictReader(text):
+            spec = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+            if spec.get('components'):
+                spec['components'] = [c for c in re.split(r'[;\s]+', spec['components']) if c]
+            specs.append(spec)
+        return specs
+
+    specs = []
+    for line_number, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            spec = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_number}: {e}")
+        if not isinstance(spec, dict):
+            raise ValueError(f"Line {line_number}: expected a JSON object")
+        specs.append(spec)
+    return specs
+
+
+def entry_name(index: int, options: Dict[str, Any]) -> str:
+    """File name of a planner inside the batch ZIP."""
+    name = re.sub(r'[^\w-]+', '_', options.get('name', '').strip().lower()).strip('_') or 'planner'
+    return f"{index + 1:03d}_{name}_planner.pdf"
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink that lets zipfile produce output in pieces."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_batch_zip(items: List[Dict[str, Any]], workers: int = None) -> Iterator[bytes]:
+    """
+    Render a batch of planners in parallel and stream them as a ZIP archive.
+
+    Identical specs are rendered once. Specs without a quote get theirs
+    here, from this process's quote pool, before they are handed to the
+    workers. Entries are written in the order renders finish, and a
+    manifest.json with the per-item status is written last, so one failing
+    planner does not fail the batch.
+
+    Args:
+        items: One dict per requested planner with either 'options'
+            (generate_planner keyword arguments) or 'error' (why the spec
+            could not be parsed)
+        workers: Number of render processes; other than Config.BATCH_WORKERS,
+            a pool of that size is started for this batch only
+
+    Yields:
+        Chunks of the ZIP file
+    """
+    manifest = [{'index': i, 'status': 'failed', 'error': item['error']} if 'error' in item
+                else {'index': i, 'status': 'pending'} for i, item in enumerate(items)]
+
+    # Dedupe on the same canonical key the planner cache uses
+    unique = {}
+    for i, item in enumerate(items):
+        if 'options' in item:
+            unique.setdefault(make_planner_key(item['options']), []).append(i)
+
+    sink = _ZipStream()
+    archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED)
+    pool = _pool if workers in (None, _pool.max_workers) else WorkerPool(workers)
+    futures = {}
+    try:
+        for key, indexes in unique.items():
+            options = items[indexes[0]]['options']
+            if not options.get('quote'):
+                # Workers only have a stale copy of the pool, so they would repeat the same quotes
+                with render_stage_seconds.time(stage='quote'):
+                    options = dict(options, quote=quote_provider.get())
+            futures[pool.submit(_render_to_bytes, options)] = indexes
+
+        for future in as_completed(futures):
+            indexes = futures[future]
+            try:
+                data, samples = future.result()
+            except Exception as e:
+                for i in indexes:
+                    manifest[i].update(status='failed', error=str(e))
+                continue
+            merge_worker_samples(samples)
+
+            for i in indexes:
+                name = entry_name(i, items[i]['options'])
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(info, data)
+                manifest[i].update(status='done', file=name)
+            yield sink.drain()
+
+        archive.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        archive.close()
+        yield sink.drain()
+    finally:
+        # Also runs when the client disconnects and the generator is closed early
+        for future in futures:
+            future.cancel()
+        if pool is not _pool:
+            pool.shutdown()
@@ -0,0 +1,185 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, BinaryIO, Optional
+from .config import Config
+
+
+def make_planner_key(options: Dict[str, Any], start_date: Optional[datetime.date] = None) -> str:
+    """
+    Build a canonical hash of everything that affects a rendered planner.
+
+    Args:
+        options: Keyword arguments for generate_planner
+        start_date: First day of the planner when options has none (defaults to today)
+
+    Returns:
+        A hex SHA-256 digest
+    """
+    start_date = options.get('start_date') or start_date or datetime.date.today()
+    end_date = options.get('end_date')
+    components = options.get('components') or {}
+    canonical = {
+        'name': options.get('name', ''),
+        'time_range': options.get('time_range', ''),
+        'quote': options.get('quote', ''),
+        'theme': options.get('theme', ''),
+        'style': options.get('style', ''),
+        # Only enabled components matter, in a stable order
+        'components': sorted(name for name, enabled in components.items() if enabled),
+        'habits': list(options.get('habits') or []),
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat() if end_date else None
+    }
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PlannerCache:
+    """On-disk LRU cache of finished planner PDFs with TTL eviction."""
+
+    def __init__(self, directory: str = None, max_bytes: int = None, ttl: int = None):
+        """
+        Initialize the cache and index any PDFs already on disk.
+
+        Args:
+            directory: Folder holding cached PDFs
+            max_bytes: Total size cap; least recently used files go first
+            ttl: Seconds a cached PDF stays valid
+        """
+        self.directory = directory or Config.PLANNER_CACHE_FOLDER
+        self.max_bytes = max_bytes if max_bytes is not None else Config.PLANNER_CACHE_MAX_BYTES
+        self.ttl = ttl if ttl is not None else Config.PLANNER_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        # key -> (path, size, created_at), oldest access first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def _load_index(self):
+        # Last access time is kept in the file's atime so LRU order survives restarts
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                found.append((stat.st_atime, entry.name[:-4], entry.path, stat.st_size, stat.st_mtime))
+        for _, key, path, size, created_at in sorted(found):
+            self._entries[key] = (path, size, created_at)
+            self.total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _remove(self, key: str):
+        path, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+        self.evictions += 1
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        # Expired entries first, then least recently used until under the cap
+        cutoff = time.time() - self.ttl
+        for key in [key for key, (_, _, created_at) in self._entries.items() if created_at < cutoff]:
+            self._remove(key)
+        # The newest entry is always kept so put() never returns a deleted path
+        while len(self._entries) > 1 and self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key: str) -> Optional[BinaryIO]:
+        """
+        Look up a cached PDF.
+
+        The file is opened while the cache is locked, so a concurrent put()
+        evicting it can only unlink the name; the open file stays readable.
+
+        Args:
+            key: Key from make_planner_key
+
+        Returns:
+            The cached PDF opened for binary reading (the caller closes it),
+            or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.time() - self.ttl:
+                self._remove(key)
+                entry = None
+            pdf_file = None
+            if entry is not None:
+                try:
+                    pdf_file = open(entry[0], 'rb')
+                except OSError:
+                    self._remove(key)
+            if pdf_file is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            path = entry[0]
+
+        try:
+            os.utime(path, (time.time(), entry[2]))
+        except OSError:
+            pass
+        return pdf_file
+
+    def put(self, key: str, source) -> str:
+        """
+        Store a freshly rendered PDF in the cache.
+
+        Args:
+            key: Key from make_planner_key
+            source: Path of the rendered PDF, which is moved rather than
+                copied, or a readable file object, which is copied from the
+                start and left open
+
+        Returns:
+            Path of the cached PDF
+        """
+        path = self._path(key)
+        if hasattr(source, 'read'):
+            # Write next to the final name and rename so readers never see a partial file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            source.seek(0)
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(source, f)
+            os.replace(tmp_path, path)
+        else:
+            shutil.move(source, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (path, size, time.time())
+            self.total_bytes += size
+            self._evict()
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters plus current usage."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
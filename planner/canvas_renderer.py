@@ -0,0 +1,135 @@
+from typing import List, Callable
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Frame, Flowable, Spacer
+from reportlab.platypus.doctemplate import LayoutError
+
+# Same page geometry as the SimpleDocTemplate in generate_planner
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 2*cm
+
+
+def _new_frame() -> Frame:
+    return Frame(MARGIN, MARGIN, PAGE_WIDTH - 2*MARGIN, PAGE_HEIGHT - 2*MARGIN, id='normal')
+
+
+def _flow(canv: canvas.Canvas, flowables: List[Flowable], next_page: Callable[[], None]):
+    """
+    Lay flowables out page by page the way SimpleDocTemplate.build does.
+
+    Args:
+        canv: Canvas (or open form) the flowables are drawn on
+        flowables: Flowables to place, consumed in order
+        next_page: Called whenever the current page is full
+    """
+    flowables = list(flowables)
+    frame = _new_frame()
+    while flowables:
+        flowable = flowables.pop(0)
+        if frame.add(flowable, canv, trySplit=1):
+            continue
+
+        parts = frame.split(flowable, canv)
+        if parts:
+            if not frame.add(parts[0], canv, trySplit=0):
+                raise LayoutError(f"Splitting error for {flowable.identity()}")
+            flowables[0:0] = parts[1:]
+        elif frame._atTop:
+            raise LayoutError(f"Flowable {flowable.identity()} too large for an empty page")
+        else:
+            next_page()
+            frame = _new_frame()
+            flowables.insert(0, flowable)
+
+
+class _HeaderSlot(Flowable):
+    """Reserves the date header's space in the day layout and records where it lands."""
+
+    def __init__(self, header):
+        super().__init__()
+        self.header = header
+        self.position = None
+
+    def wrap(self, availWidth, availHeight):
+        self.width, self.height = self.header.wrap(availWidth, availHeight)
+        return self.width, self.height
+
+    def getSpaceBefore(self):
+        return self.header.getSpaceBefore()
+
+    def getSpaceAfter(self):
+        return self.header.getSpaceAfter()
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self.position = (x, y)
+
+    def draw(self):
+        pass
+
+
+def render_planner_canvas(output, cover, days, template):
+    """
+    Render a planner directly on a canvas.
+
+    The cover is flowed once. The static part of a day page (everything but
+    the date) is laid out once with the same frame geometry platypus uses and
+    recorded as one Form XObject per physical page; every day then stamps
+    those forms and draws its date string at the precomputed position.
+
+    Args:
+        output: File path or writable file object
+        cover: Flowables for the cover page, or an empty list for none
+        days: Dates to generate day pages for
+        template: DayPageTemplate holding the static day page flowables
+
+    Returns:
+        The number of pages rendered
+    """
+    canv = canvas.Canvas(output, pagesize=A4)
+
+    # Cover page, left out for chunks that continue a sharded planner
+    if cover:
+        _flow(canv, cover, canv.showPage)
+        if not days:
+            canv.save()
+            return 1
+        canv.showPage()
+
+    # Record the static day layout into forms, one per physical page
+    forms = []
+
+    def begin_form():
+        forms.append(f"day_page_{len(forms)}")
+        canv.beginForm(forms[-1], 0, 0, PAGE_WIDTH, PAGE_HEIGHT)
+
+    def next_form():
+        canv.endForm()
+        begin_form()
+
+    slot = _HeaderSlot(template.build_header(days[0]))
+    begin_form()
+    _flow(canv, [slot, Spacer(1, 12)] + template.build_sections(), next_form)
+    canv.endForm()
+
+    # The header is a single centred line whose baseline sits one font size below its top
+    style = template.styles['PlannerTitle']
+    header_x = slot.position[0] + slot.width / 2
+    header_y = slot.position[1] + slot.height - style.fontSize
+    text_color = colors.toColor(style.textColor)
+
+    for i, day in enumerate(days):
+        if i:
+            canv.showPage()
+        canv.setFont(style.fontName, style.fontSize, style.leading)
+        canv.setFillColor(text_color)
+        canv.drawCentredString(header_x, header_y, day.strftime("%A, %B %d, %Y"))
+        for j, form in enumerate(forms):
+            if j:
+                canv.showPage()
+            canv.doForm(form)
+
+    pages = canv.getPageNumber()
+    canv.save()
+    return pages
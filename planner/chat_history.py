@@ -0,0 +1,170 @@
+from typing import Dict, List, Any, Optional
+from .config import Config
+
+# Tokens every message costs on top of its text (role and separators)
+MESSAGE_OVERHEAD = 4
+
+# Planner items listed at most in the summary of folded turns
+SUMMARY_MAX_ITEMS = 30
+
+# Summary message replacing folded turns
+SUMMARY_FOLDED = "Начало разговора сокращено."
+SUMMARY_HEADER = SUMMARY_FOLDED + " Уже добавлено в ежедневник:\n"
+
+ITEM_LABELS = {
+    'event': 'событие',
+    'task': 'задача',
+    'note': 'заметка'
+}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Estimate the number of tokens a text takes in the model's context.
+
+    BPE tokenizers produce roughly one token per four bytes of UTF-8, which
+    also holds for Cyrillic text (two bytes per letter) far better than a
+    per-character estimate.
+
+    Args:
+        text: The message text
+
+    Returns:
+        The estimated token count, including per-message overhead
+    """
+    return len((text or "").encode("utf-8")) // 4 + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Shorten a text so that its estimate fits into max_tokens."""
+    limit = max(0, (max_tokens - MESSAGE_OVERHEAD) * 4)
+    data = text.encode("utf-8")
+    if len(data) <= limit:
+        return text
+    # Cut on a character boundary and mark the cut
+    return data[:max(0, limit - 3)].decode("utf-8", errors="ignore") + "…"
+
+
+class ChatHistory:
+    """Conversation history that fits a token budget.
+
+    Each message's token estimate is computed once when it is added. When
+    the history grows past the budget, the oldest turns are folded away and
+    the planner items extracted in them are kept as one short summary
+    message, so the model still knows what is already in the planner.
+    """
+
+    def __init__(self, system_prompt: str, max_tokens: Optional[int] = None):
+        """
+        Initialize the history.
+
+        Args:
+            system_prompt: The system message sent first in every request
+            max_tokens: Token budget of the whole prompt history (defaults to
+                Config.CHAT_SESSION_TOKEN_BUDGET)
+        """
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens or Config.CHAT_SESSION_TOKEN_BUDGET
+        # Entries are dicts with role, content, tokens and items
+        self.entries = []
+        self.summary_items = []
+        self.summary = ""
+        self._system_tokens = estimate_tokens(system_prompt)
+        self._summary_tokens = 0
+        self._tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        """Estimated tokens of the prompt built by messages()."""
+        return self._system_tokens + self._summary_tokens + self._tokens
+
+    def add(self, role: str, content: str, items: Optional[List[Dict[str, Any]]] = None):
+        """
+        Add a message and compact the history if it is over budget.
+
+        Args:
+            role: "user" or "assistant"
+            content: The message text
+            items: Planner items extracted in this turn, kept for the summary
+        """
+        entry = {"role": role, "content": content, "tokens": estimate_tokens(content), "items": items or []}
+        self.entries.append(entry)
+        self._tokens += entry["tokens"]
+        self._compact()
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Return the messages to send to the model."""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": self.summary})
+        messages.extend({"role": entry["role"], "content": entry["content"]} for entry in self.entries)
+        return messages
+
+    def _compact(self):
+        # Fold the oldest turns until the history fits, always keeping the newest message
+        while self.total_tokens > self.max_tokens and len(self.entries) > 1:
+            self._fold(self.entries.pop(0))
+            # Never start the remaining history with an orphaned assistant reply
+            if self.entries and self.entries[0]["role"] == "assistant" and len(self.entries) > 1:
+                self._fold(self.entries.pop(0))
+            self._update_summary()
+
+        # A single message larger than the whole budget (a long paste) is cut down
+        if self.total_tokens > self.max_tokens and self.entries:
+            entry = self.entries[-1]
+            available = self.max_tokens - self._system_tokens - self._summary_tokens
+            entry["content"] = truncate_to_tokens(entry["content"], max(available, MESSAGE_OVERHEAD + 1))
+            self._tokens -= entry["tokens"]
+            entry["tokens"] = estimate_tokens(entry["content"])
+            self._tokens += entry["tokens"]
+
+    def _fold(self, entry: Dict[str, Any]):
+        self._tokens -= entry["tokens"]
+        self.summary_items.extend(entry["items"])
+        del self.summary_items[:-SUMMARY_MAX_ITEMS]
+
+    def _update_summary(self):
+        lines = []
+        for item in self.summary_items:
+            line = f"- {ITEM_LABELS.get(item.get('type'), item.get('type', ''))}: {item.get('title', '')}"
+            if item.get("time"):
+                line += f" ({item['time']})"
+            lines.append(line)
+        # The summary may take at most a quarter of the budget; the oldest items go first
+        limit = self.max_tokens // 4
+        while lines and estimate_tokens(SUMMARY_HEADER + "\n".join(lines)) > limit:
+            lines.pop(0)
+            self.summary_items.pop(0)
+        self.summary = SUMMARY_HEADER + "\n".join(lines) if lines else SUMMARY_FOLDED
+        self._summary_tokens = estimate_tokens(self.summary)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the history as a JSON-serializable dict."""
+        return {
+            "entries": self.entries,
+            "summary_items": self.summary_items,
+            "summary": self.summary
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], system_prompt: str, max_tokens: Optional[int] = None) -> "ChatHistory":
+        """
+        Restore a history saved with to_dict().
+
+        Args:
+            data: The saved history
+            system_prompt: The system message sent first in every request
+            max_tokens: Token budget of the whole prompt history
+
+        Returns:
+            The restored history
+        """
+        history = cls(system_prompt, max_tokens)
+        history.summary_items = list(data.get("summary_items", []))
+        history.summary = data.get("summary", "")
+        history._summary_tokens = estimate_tokens(history.summary) if history.summary else 0
+        for entry in data.get("entries", []):
+            history.entries.append(entry)
+            history._tokens += entry["tokens"]
+        history._compact()
+        return history
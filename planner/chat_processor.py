@@ -1,7 +1,61 @@
 import json
 import re
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, NamedTuple, Pattern
+
+class Rule(NamedTuple):
+    """A pattern that turns part of a message into a planner item.
+    
+    The pattern is matched against the lowercased message and must define a
+    'title' group; event rules also define a 'time' group.
+    """
+    name: str
+    type: str
+    pattern: str
+
+RULES = [
+    # Events with time
+    Rule('event_create', 'event',
+         r'(?:запланировать|добавить|запланируй|добавь|создать|создай)\s+(?:встречу|событие|мероприятие|звонок|созвон|совещание)\s+(?:с|по|на тему)?\s+(?P<title>[^в]+?)\s+(?:в|на)\s+(?P<time>\d{1,2}[:.]\d{2})'),
+    Rule('event_mention', 'event',
+         r'(?:встреча|событие|мероприятие|звонок|созвон|совещание)\s+(?:с|по|на тему)?\s+(?P<title>[^в]+?)\s+(?:в|на)\s+(?P<time>\d{1,2}[:.]\d{2})'),
+    # Tasks
+    Rule('task_create', 'task',
+         r'(?:добавить|добавь|создать|создай)\s+(?:задачу|задание|дело|пункт)\s*(?::|-)?\s*(?P<title>[^на]+?)(?:\s+на\s+|$)'),
+    Rule('task_remind', 'task',
+         r'(?:напомни(?:ть)?|не забыть)\s+(?:про|о|об|)?\s*(?P<title>[^на]+?)(?:\s+на\s+|$)'),
+    # Notes
+    Rule('note_create', 'note',
+         r'(?:добавить|добавь|создать|создай)\s+(?:заметку|запись|примечание)\s*(?::|-)?\s*(?P<title>[^на]+?)(?:\s+на\s+|$)'),
+]
+
+# Name reported when no rule matched and the whole message became a task
+FALLBACK_RULE = 'fallback_task'
+
+# Messages starting with these words are questions or greetings, not tasks
+NON_TASK_PREFIXES = ('что', 'как', 'почему', 'где', 'когда', 'кто', 'привет', 'здравствуй')
+
+def compile_rules(rules: List[Rule]) -> Pattern:
+    """
+    Combine rules into one regular expression.
+    
+    Each rule becomes a named alternative, and its 'title' and 'time' groups
+    are renamed to '<rule>__title' and '<rule>__time' so they stay unique.
+    
+    Args:
+        rules: Rules in order of precedence
+        
+    Returns:
+        The compiled pattern; match.lastgroup is the name of the rule that fired
+    """
+    alternatives = []
+    for rule in rules:
+        pattern = re.sub(r'\(\?P<(\w+)>', lambda m: f'(?P<{rule.name}__{m.group(1)}>', rule.pattern)
+        alternatives.append(f'(?P<{rule.name}>{pattern})')
+    return re.compile('|'.join(alternatives))
+
+RULES_BY_NAME = {rule.name: rule for rule in RULES}
+RULES_PATTERN = compile_rules(RULES)
 
 class ChatProcessor:
     """Processor for chat messages to extract planner items."""
@@ -40,76 +94,52 @@ class ChatProcessor:
         Returns:
             A list of planner items
         """
-        items = []
+        return [item for _, item in self.match_rules(message)]
+    
+    def match_rules(self, message: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Extract planner items from a message and report the rules that produced them.
         
-        # Extract events with time
-        event_patterns = [
-            r'(?:запланировать|добавить|запланируй|добавь|создать|создай)\s+(?:встречу|событие|мероприятие|звонок|созвон|совещание)\s+(?:с|по|на тему)?\s+([^в]+?)\s+(?:в|на)\s+(\d{1,2}[:.]\d{2})',
-            r'(?:встреча|событие|мероприятие|звонок|созвон|совещание)\s+(?:с|по|на тему)?\s+([^в]+?)\s+(?:в|на)\s+(\d{1,2}[:.]\d{2})',
-        ]
+        All rules are tried in a single pass over the lowercased message.
         
-        for pattern in event_patterns:
-            matches = re.finditer(pattern, message.lower())
-            for match in matches:
-                title = match.group(1).strip()
-                time_str = match.group(2).replace('.', ':')
+        Args:
+            message: The user message
+            
+        Returns:
+            A list of (rule name, planner item) tuples in message order
+        """
+        text = message.lower()
+        matches = []
+        
+        for match in RULES_PATTERN.finditer(text):
+            rule = RULES_BY_NAME[match.lastgroup]
+            title = match.group(f'{rule.name}__title').strip()
+            time_str = None
+            
+            if rule.type == 'event':
+                time_str = match.group(f'{rule.name}__time').replace('.', ':')
                 
                 # Add leading zero if needed
                 if ':' in time_str and len(time_str.split(':')[0]) == 1:
                     time_str = f"0{time_str}"
-                
-                items.append({
-                    'type': 'event',
-                    'title': title.capitalize(),
-                    'time': time_str,
-                    'description': ''
-                })
-        
-        # Extract tasks
-        task_patterns = [
-            r'(?:добавить|добавь|создать|создай)\s+(?:задачу|задание|дело|пункт)\s*(?::|-)?\s*([^на]+?)(?:\s+на\s+|$)',
-            r'(?:напомни(?:ть)?|не забыть)\s+(?:про|о|об|)?\s*([^на]+?)(?:\s+на\s+|$)',
-        ]
-        
-        for pattern in task_patterns:
-            matches = re.finditer(pattern, message.lower())
-            for match in matches:
-                title = match.group(1).strip()
-                
-                items.append({
-                    'type': 'task',
-                    'title': title.capitalize(),
-                    'time': None,
-                    'description': ''
-                })
-        
-        # Extract notes
-        note_patterns = [
-            r'(?:добавить|добавь|создать|создай)\s+(?:заметку|запись|примечание)\s*(?::|-)?\s*([^на]+?)(?:\s+на\s+|$)',
-        ]
-        
-        for pattern in note_patterns:
-            matches = re.finditer(pattern, message.lower())
-            for match in matches:
-                title = match.group(1).strip()
-                
-                items.append({
-                    'type': 'note',
-                    'title': title.capitalize(),
-                    'time': None,
-                    'description': ''
-                })
+            
+            matches.append((rule.name, {
+                'type': rule.type,
+                'title': title.capitalize(),
+                'time': time_str,
+                'description': ''
+            }))
         
         # If no items were extracted but the message seems like a task
-        if not items and len(message.split()) >= 2 and not message.lower().startswith(('что', 'как', 'почему', 'где', 'когда', 'кто', 'привет', 'здравствуй')):
-            items.append({
+        if not matches and len(message.split()) >= 2 and not text.startswith(NON_TASK_PREFIXES):
+            matches.append((FALLBACK_RULE, {
                 'type': 'task',
                 'title': message.capitalize(),
                 'time': None,
                 'description': ''
-            })
+            }))
         
-        return items
+        return matches
     
     def generate_response(self, message: str, items: List[Dict[str, Any]]) -> str:
         """
@@ -130,7 +160,7 @@ class ChatProcessor:
         for item in items:
             if item['type'] == 'event':
                 response += f"📅 **Событие**: {item['title']}"
-                if item['time']:
+                if item.get('time'):
                     response += f" в {item['time']}"
                 response += "\n"
             elif item['type'] == 'task':
@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Optional
+from .config import Config
+from .chat_history import ChatHistory
+from .lmstudio_chat import LMStudioChat, SYSTEM_PROMPT
+from .lmstudio_tools import LMStudioToolsClient
+
+# Seconds between sweeps of expired sessions from the database
+PURGE_INTERVAL = 60
+
+
+class ChatSessionStore:
+    """Conversation state of chat sessions, kept across requests.
+
+    The most recently used sessions stay in memory as live LMStudioChat
+    objects (an LRU bounded by max_active). Every finished turn is also
+    written to SQLite, so sessions evicted from memory, handled by another
+    worker process or surviving a restart are restored from there. Sessions
+    idle for longer than idle_ttl are dropped from both.
+    """
+
+    def __init__(self, path: str = None, max_active: int = None, idle_ttl: int = None,
+                 token_budget: int = None):
+        """
+        Initialize the store, creating the database if needed.
+
+        Args:
+            path: Location of the SQLite database
+            max_active: Number of sessions kept in memory
+            idle_ttl: Seconds of inactivity after which a session is dropped
+            token_budget: Estimated tokens of history kept per session
+        """
+        self.path = path or Config.CHAT_SESSION_DB_FILE
+        self.max_active = max_active or Config.CHAT_SESSION_MAX_ACTIVE
+        self.idle_ttl = idle_ttl or Config.CHAT_SESSION_IDLE_TTL
+        self.token_budget = token_budget or Config.CHAT_SESSION_TOKEN_BUDGET
+        # session id -> (chat, updated timestamp), least recently used first
+        self._active = OrderedDict()
+        # One lock per session, so a long streamed turn never blocks other sessions;
+        # a lock disappears once no request holds it
+        self._session_locks = weakref.WeakValueDictionary()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_purge = 0
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "id TEXT PRIMARY KEY, model TEXT, history TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections are not shareable by default
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _client(self, base_url: str, api_key: Optional[str]) -> LMStudioToolsClient:
+        # Clients are shared by all sessions talking to the same server
+        key = (base_url, api_key)
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = LMStudioToolsClient(base_url=base_url, api_key=api_key)
+        return client
+
+    def lock(self, session_id: str) -> threading.Lock:
+        """Get the lock serializing turns of one session.
+
+        The caller must keep a reference to the lock while holding it.
+        """
+        with self._lock:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = threading.Lock()
+            return lock
+
+    def get(self, session_id: str, base_url: str, api_key: Optional[str] = None,
+            model: Optional[str] = None) -> LMStudioChat:
+        """
+        Get the chat of a session, restoring or creating it as needed.
+
+        Callers should hold lock(session_id) from get() until save().
+
+        Args:
+            session_id: Chat session identifier
+            base_url: The base URL for the LM Studio API
+            api_key: Optional API key for authentication
+            model: Optional model name to use
+
+        Returns:
+            The session's LMStudioChat
+        """
+        now = time.time()
+        self._purge(now)
+        row = self._connect().execute(
+            "SELECT history, updated FROM chat_sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+
+        with self._lock:
+            client = self._client(base_url, api_key)
+            entry = self._active.pop(session_id, None)
+            # Reuse the live chat unless another process has written a newer turn
+            if entry is not None and (row is None or row[1] <= entry[1]) and now - entry[1] <= self.idle_ttl:
+                chat = entry[0]
+                chat.client = client
+                if model:
+                    chat.model = model
+            else:
+                chat = LMStudioChat(model=model, client=client, max_history_tokens=self.token_budget)
+                if row is not None and now - row[1] <= self.idle_ttl:
+                    chat.history = ChatHistory.from_dict(json.loads(row[0]), SYSTEM_PROMPT, self.token_budget)
+            self._active[session_id] = (chat, entry[1] if entry else (row[1] if row else now))
+            while len(self._active) > self.max_active:
+                self._active.popitem(last=False)
+            return chat
+
+    def save(self, session_id: str, chat: LMStudioChat):
+        """Persist the chat of a session after a turn."""
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO chat_sessions (id, model, history, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET model = excluded.model, history = excluded.history, "
+            "updated = excluded.updated",
+            (session_id, chat.model, json.dumps(chat.history.to_dict(), ensure_ascii=False), now)
+        )
+        with self._lock:
+            if session_id in self._active:
+                self._active[session_id] = (chat, now)
+
+    def delete(self, session_id: str):
+        """Forget a session."""
+        self._connect().execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+        with self._lock:
+            self._active.pop(session_id, None)
+
+    def _purge(self, now: float):
+        """Drop sessions that have been idle for longer than idle_ttl."""
+        with self._lock:
+            # The LRU order is also the order of last use, so expired sessions are at the front
+            while self._active:
+                session_id, (_, updated) = next(iter(self._active.items()))
+                if now - updated <= self.idle_ttl:
+                    break
+                del self._active[session_id]
+            if now - self._last_purge < PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        self._connect().execute("DELETE FROM chat_sessions WHERE updated < ?", (now - self.idle_ttl,))
+
+    def stats(self) -> dict:
+        """Return the number of sessions in memory and in the database."""
+        stored = self._connect().execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0]
+        with self._lock:
+            return {'active': len(self._active), 'stored': stored, 'max_active': self.max_active}
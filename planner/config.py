@@ -1,7 +1,8 @@
 import os
-import json
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
+from .settings_store import JsonSettingsStore, SqliteSettingsStore
 
 # Load environment variables from .env file if it exists
 load_dotenv()
@@ -20,14 +21,64 @@ class Config:
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
     TEMP_FOLDER = os.path.join(BASE_DIR, 'temp')
     OUTPUT_FOLDER = os.path.join(BASE_DIR, 'output')
+    GENERATED_FOLDER = os.path.join(BASE_DIR, 'generated')  # created on first use
     
     # Ensure directories exist
     for folder in [UPLOAD_FOLDER, TEMP_FOLDER, OUTPUT_FOLDER]:
         os.makedirs(folder, exist_ok=True)
     
+    # Background render queue
+    RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 2))
+    RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', 16))
+    RENDER_JOB_TTL = int(os.environ.get('RENDER_JOB_TTL', 3600))  # seconds
+    RENDER_RETRY_AFTER = 5  # seconds, fallback before any job has finished
+    
+    # How /generate delivers PDFs: 'file' writes to GENERATED_FOLDER and sends
+    # the file, 'stream' renders into a spooled buffer and streams it in chunks
+    PDF_OUTPUT_MODE = os.environ.get('PDF_OUTPUT_MODE', 'file').lower()
+    PDF_SPOOL_MAX_SIZE = int(os.environ.get('PDF_SPOOL_MAX_SIZE', 8 * 1024 * 1024))  # bytes kept in memory
+    PDF_STREAM_CHUNK_SIZE = 64 * 1024
+    
+    # PDF engine: 'platypus' (flowable layout) or 'canvas' (precomputed page layout)
+    PDF_RENDERER = os.environ.get('PDF_RENDERER', 'platypus').lower()
+    
+    # Batch generation
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 200))
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+    
+    # Extraction of planner items from imported text (planner.extraction)
+    EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', os.cpu_count() or 1))
+    EXTRACT_CHUNK_LINES = int(os.environ.get('EXTRACT_CHUNK_LINES', 2000))  # lines per worker task
+    
+    # Date spans: longest allowed planner, and days per chunk when long
+    # planners are rendered in parallel processes and merged
+    PLANNER_MAX_DAYS = int(os.environ.get('PLANNER_MAX_DAYS', 366))
+    PLANNER_SHARD_DAYS = int(os.environ.get('PLANNER_SHARD_DAYS', 62))
+    PLANNER_SHARD_WORKERS = int(os.environ.get('PLANNER_SHARD_WORKERS', os.cpu_count() or 1))
+    
+    # Cache of finished planner PDFs
+    PLANNER_CACHE_ENABLED = os.environ.get('PLANNER_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+    PLANNER_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache', 'planners')
+    PLANNER_CACHE_MAX_BYTES = int(os.environ.get('PLANNER_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+    PLANNER_CACHE_TTL = int(os.environ.get('PLANNER_CACHE_TTL', 24 * 3600))  # seconds
+    
+    # PDFs left in GENERATED_FOLDER (by /generate without the planner cache and by
+    # render jobs): a background sweeper deletes files older than GENERATED_MAX_AGE
+    # and, oldest first, files over GENERATED_MAX_BYTES
+    GENERATED_MAX_BYTES = int(os.environ.get('GENERATED_MAX_BYTES', 500 * 1024 * 1024))
+    GENERATED_MAX_AGE = int(os.environ.get('GENERATED_MAX_AGE', 24 * 3600))  # seconds
+    GENERATED_SWEEP_INTERVAL = int(os.environ.get('GENERATED_SWEEP_INTERVAL', 60))  # seconds
+    GENERATED_SWEEP_BATCH = 100  # files deleted per sweep step
+    GENERATED_GRACE_PERIOD = 60  # seconds a new file is safe from the size cap, so it can still be sent
+    
     # API Keys configuration file
     API_KEYS_FILE = os.path.join(BASE_DIR, 'api_keys.json')
     
+    # Where API keys are stored: 'json' (API_KEYS_FILE) or 'sqlite' (SETTINGS_DB_FILE,
+    # seeded from API_KEYS_FILE on first use)
+    SETTINGS_BACKEND = os.environ.get('SETTINGS_BACKEND', 'json').lower()
+    SETTINGS_DB_FILE = os.path.join(BASE_DIR, 'settings.db')
+    
     # Default language (en or ru)
     DEFAULT_LANGUAGE = 'en'
     
@@ -55,6 +106,7 @@ class Config:
             'color': '#6c63ff',
             'requires_key': True,
             'key_name': 'anthropic_api_key',
+            'default_base_url': 'https://api.anthropic.com/v1',
             'models': ['claude-3-opus-20240229', 'claude-3-sonnet-20240229', 'claude-3-haiku-20240307']
         },
         'google': {
@@ -63,6 +115,7 @@ class Config:
             'color': '#4285f4',
             'requires_key': True,
             'key_name': 'google_api_key',
+            'default_base_url': 'https://generativelanguage.googleapis.com/v1beta',
             'models': ['gemini-pro', 'gemini-ultra']
         },
         'lmstudio': {
@@ -77,6 +130,51 @@ class Config:
         }
     }
     
+    # HTTP client for model servers
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5))  # seconds
+    LLM_READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT', 120))  # seconds
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))  # on connection errors only
+    LLM_RETRY_BACKOFF = 0.5  # seconds, doubled per attempt and jittered
+    LLM_POOL_MAXSIZE = int(os.environ.get('LLM_POOL_MAXSIZE', 10))  # connections per server (sync clients)
+    
+    # Async AI endpoints of the ASGI entry point (asgi.py): open connections per
+    # model server, and the deadline of a whole request, streamed replies included
+    LLM_ASYNC_MAX_CONNECTIONS = int(os.environ.get('LLM_ASYNC_MAX_CONNECTIONS', 200))
+    AI_REQUEST_TIMEOUT = float(os.environ.get('AI_REQUEST_TIMEOUT', 180))  # seconds
+    
+    # Providers asked at the same time when a request may be answered by any of them
+    PROVIDER_FANOUT = int(os.environ.get('PROVIDER_FANOUT', 2))
+    
+    # Cache of parsed /api/ai-suggestions results; stale results are served
+    # for up to SUGGESTION_CACHE_STALE_TTL more seconds while being refreshed
+    SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', 256))
+    SUGGESTION_CACHE_TTL = int(os.environ.get('SUGGESTION_CACHE_TTL', 3600))  # seconds
+    SUGGESTION_CACHE_STALE_TTL = int(os.environ.get('SUGGESTION_CACHE_STALE_TTL', 24 * 3600))  # seconds, 0 disables
+    
+    # Cache of add_planner_items results for normalized chat messages
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+    LLM_CACHE_SIZE = int(os.environ.get('LLM_CACHE_SIZE', 1000))
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 24 * 3600))  # seconds
+    
+    # Server-side chat sessions: hot sessions are kept in memory, all of them
+    # are persisted to CHAT_SESSION_DB_FILE and dropped after CHAT_SESSION_IDLE_TTL
+    CHAT_SESSION_DB_FILE = os.path.join(BASE_DIR, 'cache', 'chat_sessions.db')
+    CHAT_SESSION_MAX_ACTIVE = int(os.environ.get('CHAT_SESSION_MAX_ACTIVE', 256))
+    CHAT_SESSION_IDLE_TTL = int(os.environ.get('CHAT_SESSION_IDLE_TTL', 2 * 3600))  # seconds
+    CHAT_SESSION_TOKEN_BUDGET = int(os.environ.get('CHAT_SESSION_TOKEN_BUDGET', 3000))  # estimated tokens of history
+    
+    # Prometheus text metrics (render stage timings, model calls, caches) at /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ('true', '1', 't')
+    
+    # Per-request profiling: with PROFILING_ENABLED, a request sent with an
+    # "X-Profile: 1" header or ?profile=1 ("memory" also traces allocations) runs
+    # under cProfile; the newest PROFILE_MAX_CAPTURES are listed at /admin/profiles.
+    # A capture still running after PROFILE_TIMEOUT seconds is given up
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() in ('true', '1', 't')
+    PROFILE_FOLDER = os.path.join(BASE_DIR, 'cache', 'profiles')
+    PROFILE_MAX_CAPTURES = int(os.environ.get('PROFILE_MAX_CAPTURES', 50))
+    PROFILE_TIMEOUT = int(os.environ.get('PROFILE_TIMEOUT', 300))  # seconds
+    
     # Planner styles
     STYLES = {
         'minimalist': {
@@ -104,51 +202,69 @@ class Config:
     
     # Quotable API for inspirational quotes
     QUOTABLE_API_URL = 'https://api.quotable.io/random'
+    QUOTE_POOL_FILE = os.path.join(BASE_DIR, 'cache', 'quotes.json')
+    QUOTE_POOL_SIZE = int(os.environ.get('QUOTE_POOL_SIZE', 20))
+    QUOTE_FETCH_TIMEOUT = float(os.environ.get('QUOTE_FETCH_TIMEOUT', 3))  # seconds
+    QUOTE_REFILL_INTERVAL = 300  # seconds between refills when idle
+    QUOTE_RETRY_DELAY = 30  # seconds to back off after the API fails
     
     # OpenWeatherMap API for weather forecasts
     OPENWEATHERMAP_API_URL = 'https://api.openweathermap.org/data/2.5/forecast'
     
+    # Cached settings store for API keys, created on first use
+    _key_store = None
+    _key_store_lock = threading.Lock()
+    
+    @classmethod
+    def key_store(cls):
+        """Get the shared settings store for API keys"""
+        path = cls.SETTINGS_DB_FILE if cls.SETTINGS_BACKEND == 'sqlite' else cls.API_KEYS_FILE
+        if cls._key_store is None or cls._key_store.path != path:
+            with cls._key_store_lock:
+                if cls._key_store is None or cls._key_store.path != path:
+                    if cls.SETTINGS_BACKEND == 'sqlite':
+                        cls._key_store = SqliteSettingsStore(path, import_from=cls.API_KEYS_FILE)
+                    else:
+                        cls._key_store = JsonSettingsStore(path)
+        return cls._key_store
+    
     @classmethod
     def get_api_keys(cls):
         """Get all stored API keys"""
-        if os.path.exists(cls.API_KEYS_FILE):
-            try:
-                with open(cls.API_KEYS_FILE, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-        return {}
+        return cls.key_store().get_all()
     
     @classmethod
-    def save_api_key(cls, provider, api_key, base_url=None, model=None):
-        """Save an API key for a provider"""
-        api_keys = cls.get_api_keys()
+    def save_api_key(cls, provider, api_key, base_url=None, model=None, expected_version=None):
+        """Save an API key for a provider
+        
+        Returns the settings version written by this save, or None if the
+        provider is unknown. Raises VersionConflictError if expected_version
+        is given and the settings were changed by someone else in the meantime.
+        """
+        updates = {}
         
         # Get the key name from the provider configuration
         provider_config = cls.AI_MODELS.get(provider, {})
         key_name = provider_config.get('key_name')
         
         if key_name:
-            api_keys[key_name] = api_key
+            updates[key_name] = api_key
             
             # Save base URL if provided and supported
             if base_url and 'base_url_name' in provider_config:
-                api_keys[provider_config['base_url_name']] = base_url
+                updates[provider_config['base_url_name']] = base_url
             
             # Save model if provided
             if model:
-                api_keys[f"{provider}_model"] = model
+                updates[f"{provider}_model"] = model
             
-            with open(cls.API_KEYS_FILE, 'w') as f:
-                json.dump(api_keys, f)
-            
-            return True
-        return False
+            return cls.key_store().update(updates, expected_version=expected_version)
+        return None
     
     @classmethod
     def get_api_key(cls, provider):
         """Get API key for a specific provider"""
-        api_keys = cls.get_api_keys()
+        api_keys = cls.key_store().snapshot()
         provider_config = cls.AI_MODELS.get(provider, {})
         key_name = provider_config.get('key_name')
         
@@ -159,7 +275,7 @@ class Config:
     @classmethod
     def get_model(cls, provider):
         """Get selected model for a specific provider"""
-        api_keys = cls.get_api_keys()
+        api_keys = cls.key_store().snapshot()
         model_key = f"{provider}_model"
         
         if model_key in api_keys:
@@ -175,7 +291,7 @@ class Config:
     @classmethod
     def get_base_url(cls, provider):
         """Get base URL for a specific provider"""
-        api_keys = cls.get_api_keys()
+        api_keys = cls.key_store().snapshot()
         provider_config = cls.AI_MODELS.get(provider, {})
         base_url_name = provider_config.get('base_url_name')
         
@@ -0,0 +1,133 @@
+import argparse
+import json
+import re
+import sys
+from collections import deque
+from itertools import chain, islice
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+from .chat_processor import ChatProcessor
+from .config import Config
+from .pools import WorkerPool
+
+# List markers and checkboxes of to-do lists: "- [ ] ", "* ", "1. ", "•"; a number
+# only counts as a marker when a space follows, so "9.30 созвон" keeps its time
+_LIST_MARKER = re.compile(r'^\s*(?:[-*•]|\d+[.)](?=\s))?\s*(?:\[[ xX]\]\s*)?')
+
+# One processor per process; ChatProcessor keeps no state between messages
+_processor = None
+
+# Extraction processes shared by all requests
+_pool = WorkerPool(Config.EXTRACT_WORKERS)
+
+
+def _extract_chunk(chunk: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """Extract the items of a chunk of (line number, text) pairs."""
+    global _processor
+    if _processor is None:
+        _processor = ChatProcessor()
+    records = []
+    for line_number, text in chunk:
+        for rule, item in _processor.match_rules(text):
+            records.append(dict(item, line=line_number, rule=rule))
+    return records
+
+
+def _numbered_lines(lines: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """Number the lines and strip list markers, skipping blank ones."""
+    for line_number, line in enumerate(lines, 1):
+        text = _LIST_MARKER.sub('', line.strip(), count=1)
+        if text:
+            yield line_number, text
+
+
+def iter_planner_items(lines: Iterable[str], workers: int = None,
+                       chunk_lines: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily extract planner items from lines of text.
+
+    Input that fits into one chunk is handled in this process. Larger inputs
+    are split into chunks that worker processes extract in parallel, with a
+    bounded number of chunks in flight, so memory use does not depend on the
+    input size. Items are yielded in input order either way.
+
+    Args:
+        lines: Lines of text, e.g. an open file
+        workers: Number of worker processes; other than Config.EXTRACT_WORKERS,
+            a pool of that size is started for this call only
+        chunk_lines: Lines per chunk (defaults to Config.EXTRACT_CHUNK_LINES)
+
+    Yields:
+        Planner items with the source 'line' number and the 'rule' that matched
+    """
+    pool = _pool if workers in (None, _pool.max_workers) else WorkerPool(workers)
+    workers = pool.max_workers
+    chunk_lines = chunk_lines or Config.EXTRACT_CHUNK_LINES
+    numbered = _numbered_lines(lines)
+
+    chunks = iter(lambda: list(islice(numbered, chunk_lines)), [])
+    head = list(islice(chunks, 2))
+    chunks = chain(head, chunks)
+    if len(head) < 2 or workers < 2:
+        for chunk in chunks:
+            yield from _extract_chunk(chunk)
+        return
+
+    pending = deque()
+    try:
+        for chunk in islice(chunks, workers * 2):
+            pending.append(pool.submit(_extract_chunk, chunk))
+        while pending:
+            records = pending.popleft().result()
+            # Keep the workers busy while the caller consumes this chunk
+            for chunk in islice(chunks, 1):
+                pending.append(pool.submit(_extract_chunk, chunk))
+            yield from records
+    finally:
+        # Also runs when the consumer stops early and the generator is closed
+        for future in pending:
+            future.cancel()
+        if pool is not _pool:
+            pool.shutdown()
+
+
+def write_jsonl(records: Iterable[Dict[str, Any]], output) -> int:
+    """
+    Write records to a text stream as JSON lines.
+
+    Returns:
+        Number of records written
+    """
+    count = 0
+    for record in records:
+        output.write(json.dumps(record, ensure_ascii=False))
+        output.write('\n')
+        count += 1
+    return count
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+        prog='python -m planner.extraction',
+        description='Extract planner items from a text file and print them as JSON lines.')
+    parser.add_argument('input', help="text file to read, or '-' for standard input")
+    parser.add_argument('-o', '--output', help='JSONL file to write (default: standard output)')
+    parser.add_argument('-w', '--workers', type=int, help='number of worker processes')
+    parser.add_argument('--chunk-lines', type=int, help='lines handed to a worker at a time')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8-sig')
+    target = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        count = write_jsonl(iter_planner_items(source, args.workers, args.chunk_lines), target)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    print(f"Extracted {count} items", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
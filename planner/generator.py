@@ -1,33 +1,27 @@
 import os
+import copy
 import datetime
+import time
 import requests
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm, mm
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
 from reportlab.pdfgen import canvas
 from reportlab.platypus import PageBreak, ListFlowable, ListItem
 from planner.config import Config
+from planner.styles import get_planner_styles
+from planner.quotes import quote_provider
+from planner.artifacts import generated_files
+from planner.metrics import render_stage_seconds, pages_rendered, upstream_errors
 
 def get_quote():
-    """Fetch a random inspirational quote from the Quotable API."""
-    try:
-        response = requests.get(Config.QUOTABLE_API_URL)
-        if response.status_code == 200:
-            data = response.json()
-            return f'"{data["content"]}" - {data["author"]}'
-    except Exception as e:
-        print(f"Error fetching quote: {e}")
+    """Return an inspirational quote from the prefetched pool.
     
-    # Default quotes if API fails
-    default_quotes = [
-        '"The future depends on what you do today." - Mahatma Gandhi',
-        '"The only way to do great work is to love what you do." - Steve Jobs',
-        '"Believe you can and you\'re halfway there." - Theodore Roosevelt'
-    ]
-    import random
-    return random.choice(default_quotes)
+    Never blocks on the Quotable API: a background thread keeps the pool
+    filled (see planner.quotes).
+    """
+    return quote_provider.get()
 
 def get_weather_forecast(city):
     """Fetch weather forecast from OpenWeatherMap API."""
@@ -46,75 +40,42 @@ def get_weather_forecast(city):
     except Exception as e:
         print(f"Error fetching weather: {e}")
     
+    upstream_errors.inc(upstream='weather')
     return None
 
-def generate_planner(name, time_range, quote, theme, style, components, habits=None):
-    """Generate a personalized planner PDF."""
-    # Create a unique filename
-    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    filename = f"{name.lower().replace(' ', '_')}_{time_range}_{timestamp}.pdf"
-    output_path = os.path.join(Config.GENERATED_FOLDER, filename)
-    
-    # Get style settings
-    style_settings = Config.STYLES.get(style, Config.STYLES['minimalist'])
-    
-    # Create the PDF document
-    doc = SimpleDocTemplate(
-        output_path,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
+def get_planner_days(time_range, start_date=None, end_date=None):
+    """Return the dates a planner covers.
     
-    # Get styles
-    styles = getSampleStyleSheet()
+    An explicit start_date/end_date span (inclusive) takes precedence over
+    time_range, which otherwise counts from today.
+    """
+    if start_date or end_date:
+        start_date = start_date or datetime.date.today()
+        end_date = end_date or start_date
+        if end_date < start_date:
+            raise ValueError("End date must not be before start date")
+        num_days = (end_date - start_date).days + 1
+        if num_days > Config.PLANNER_MAX_DAYS:
+            raise ValueError(f"A planner can cover at most {Config.PLANNER_MAX_DAYS} days")
+        return [start_date + datetime.timedelta(days=i) for i in range(num_days)]
     
-    # Add custom styles with unique names to avoid conflicts
-    styles.add(ParagraphStyle(
-        name='PlannerTitle',  # Changed from 'Title' to 'PlannerTitle'
-        fontName=style_settings['font'],
-        fontSize=24,
-        textColor=style_settings['primary_color'],
-        alignment=1,  # Center
-        spaceAfter=12
-    ))
-    styles.add(ParagraphStyle(
-        name='PlannerSubtitle',  # Changed from 'Subtitle' to 'PlannerSubtitle'
-        fontName=style_settings['font'],
-        fontSize=16,
-        textColor=style_settings['secondary_color'],
-        alignment=1,  # Center
-        spaceAfter=12
-    ))
-    styles.add(ParagraphStyle(
-        name='PlannerHeading',  # Changed from 'Heading' to 'PlannerHeading'
-        fontName=style_settings['font'],
-        fontSize=14,
-        textColor=style_settings['primary_color'],
-        spaceBefore=12,
-        spaceAfter=6
-    ))
-    styles.add(ParagraphStyle(
-        name='PlannerNormal',  # Changed from 'Normal' to 'PlannerNormal'
-        fontName=style_settings['font'],
-        fontSize=10,
-        textColor=style_settings['primary_color']
-    ))
-    
-    # Create content
-    content = []
-    
-    # Cover page
-    content.append(Paragraph(f"{name}'s Planner", styles['PlannerTitle']))
-    content.append(Spacer(1, 12))
-    
-    # Theme
-    content.append(Paragraph(theme, styles['PlannerSubtitle']))
-    content.append(Spacer(1, 12))
+    today = datetime.date.today()
+    if time_range == 'day':
+        return [today]
+    elif time_range == 'week':
+        return [today + datetime.timedelta(days=i) for i in range(7)]
+    else:  # month
+        num_days = (today.replace(month=today.month % 12 + 1, day=1) - datetime.timedelta(days=1)).day
+        return [today.replace(day=i+1) for i in range(num_days)]
+
+def get_date_range_text(time_range, start_date=None, end_date=None):
+    """Return the date line shown on the cover page."""
+    if start_date or end_date:
+        days = get_planner_days(time_range, start_date, end_date)
+        if len(days) == 1:
+            return days[0].strftime("%A, %B %d, %Y")
+        return f"{days[0].strftime('%B %d, %Y')} - {days[-1].strftime('%B %d, %Y')}"
     
-    # Date range
     today = datetime.date.today()
     if time_range == 'day':
         date_str = today.strftime("%A, %B %d, %Y")
@@ -123,135 +84,251 @@ def generate_planner(name, time_range, quote, theme, style, components, habits=N
         date_str = f"{today.strftime('%B %d')} - {end_date.strftime('%B %d, %Y')}"
     else:  # month
         date_str = today.strftime("%B %Y")
+    return date_str
+
+def generate_cover_page(styles, name, theme, date_str, quote):
+    """Generate the flowables of the cover page."""
+    content = []
+    content.append(Paragraph(f"{name}'s Planner", styles['PlannerTitle']))
+    content.append(Spacer(1, 12))
+    
+    # Theme
+    content.append(Paragraph(theme, styles['PlannerSubtitle']))
+    content.append(Spacer(1, 12))
     
+    # Date range
     content.append(Paragraph(date_str, styles['PlannerSubtitle']))
     content.append(Spacer(1, 24))
     
     # Quote
-    if not quote:
-        quote = get_quote()
     content.append(Paragraph(quote, styles['PlannerNormal']))
-    content.append(PageBreak())
+    return content
+
+def generate_planner(name, time_range, quote, theme, style, components, habits=None, output=None,
+                     renderer=None, start_date=None, end_date=None):
+    """Generate a personalized planner PDF.
     
-    # Generate pages based on time range
-    if time_range == 'day':
-        content.extend(generate_day_page(today, styles, components, habits))
-    elif time_range == 'week':
-        for i in range(7):
-            day = today + datetime.timedelta(days=i)
-            content.extend(generate_day_page(day, styles, components, habits))
-            if i < 6:  # Don't add page break after the last day
-                content.append(PageBreak())
-    else:  # month
-        num_days = (today.replace(month=today.month % 12 + 1, day=1) - datetime.timedelta(days=1)).day
-        for i in range(num_days):
-            day = today.replace(day=i+1)
-            content.extend(generate_day_page(day, styles, components, habits))
-            if i < num_days - 1:  # Don't add page break after the last day
-                content.append(PageBreak())
+    The PDF is written to a new file in Config.GENERATED_FOLDER and its path
+    is returned, unless a writable file object is passed as ``output``, in
+    which case the PDF is rendered into it and the same object is returned.
+    Callers that keep a generated file hand it to
+    planner.artifacts.generated_files.track so it is cleaned up.
+    ``renderer`` selects the engine: 'platypus' (default, see
+    Config.PDF_RENDERER) or the faster, visually equivalent 'canvas'.
+    ``start_date``/``end_date`` select an arbitrary span of days instead of
+    the time_range; spans longer than Config.PLANNER_SHARD_DAYS are rendered
+    in parallel chunks and merged.
+    """
+    renderer = renderer or Config.PDF_RENDERER
+    days = get_planner_days(time_range, start_date, end_date)
     
-    # Build the PDF
-    doc.build(content)
+    if output is None:
+        # Create a uniquely named file
+        output_path = generated_files.new_path(name, time_range)
+    else:
+        output_path = output
+    
+    # Quote
+    if not quote:
+        with render_stage_seconds.time(stage='quote'):
+            quote = get_quote()
+    
+    cover = {
+        'name': name,
+        'theme': theme,
+        'date_str': get_date_range_text(time_range, start_date, end_date),
+        'quote': quote
+    }
+    
+    try:
+        if len(days) > Config.PLANNER_SHARD_DAYS:
+            from .sharding import render_planner_sharded
+            pages = render_planner_sharded(output_path, cover, style, components, habits, days, renderer)
+        else:
+            pages = render_planner_pages(output_path, cover, style, components, habits, days, renderer)
+    except Exception:
+        # Do not leave a half-written file behind
+        if output is None:
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+        raise
+    pages_rendered.inc(pages)
     
     return output_path
 
-def generate_day_page(date, styles, components, habits=None):
-    """Generate a page for a single day."""
-    content = []
+def render_planner_pages(output, cover, style, components, habits, days, renderer):
+    """Render the cover (if given) and one day page per date into output.
     
-    # Day header
-    day_header = date.strftime("%A, %B %d, %Y")
-    content.append(Paragraph(day_header, styles['PlannerTitle']))
-    content.append(Spacer(1, 12))
+    Returns the number of pages rendered.
+    """
+    with render_stage_seconds.time(stage='styles'):
+        styles = get_planner_styles(style)
     
-    # Schedule section
-    if components.get('schedule', False):
-        content.append(Paragraph("Daily Schedule", styles['PlannerHeading']))
-        
-        # Create schedule table
-        schedule_data = []
-        schedule_data.append(['Time', 'Activity'])
-        
-        for hour in range(6, 23):  # 6 AM to 10 PM
-            am_pm = 'AM' if hour < 12 else 'PM'
-            display_hour = hour if hour <= 12 else hour - 12
-            if display_hour == 0:
-                display_hour = 12
-            
-            time_str = f"{display_hour} {am_pm}"
-            schedule_data.append([time_str, ''])
-        
-        schedule_table = Table(schedule_data, colWidths=[2*cm, 12*cm])
-        schedule_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, 0), styles['PlannerHeading'].fontName),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ]))
-        
-        content.append(schedule_table)
-        content.append(Spacer(1, 12))
+    flowables_start = time.perf_counter()
+    cover_content = generate_cover_page(styles, **cover) if cover else []
     
-    # To-do list section
-    if components.get('todo', False):
-        content.append(Paragraph("To-Do List", styles['PlannerHeading']))
-        
-        # Create to-do table
-        todo_data = []
-        for i in range(10):
-            todo_data.append(['□', ''])
-        
-        todo_table = Table(todo_data, colWidths=[1*cm, 13*cm])
-        todo_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, -1), styles['PlannerNormal'].fontName),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ]))
-        
-        content.append(todo_table)
-        content.append(Spacer(1, 12))
+    # Static day page parts are built once for every day in this document
+    template = DayPageTemplate(styles, components, habits)
+    
+    if renderer == 'canvas':
+        from .canvas_renderer import render_planner_canvas
+        render_stage_seconds.observe(time.perf_counter() - flowables_start, stage='flowables')
+        with render_stage_seconds.time(stage='layout'):
+            return render_planner_canvas(output, cover_content, days, template)
+    
+    # Create the PDF document
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        rightMargin=2*cm,
+        leftMargin=2*cm,
+        topMargin=2*cm,
+        bottomMargin=2*cm
+    )
+    
+    content = cover_content + [PageBreak()] if cover_content else []
+    for i, day in enumerate(days):
+        content.extend(generate_day_page(day, styles, components, habits, template))
+        if i < len(days) - 1:  # Don't add page break after the last day
+            content.append(PageBreak())
+    render_stage_seconds.observe(time.perf_counter() - flowables_start, stage='flowables')
     
-    # Habit tracker section
-    if components.get('habit_tracker', False) and habits:
-        content.append(Paragraph("Habit Tracker", styles['PlannerHeading']))
+    # Build the PDF
+    with render_stage_seconds.time(stage='layout'):
+        doc.build(content)
+    return doc.page
+
+class DayPageTemplate:
+    """Static part of a day page, built once per document and reused for every day.
+
+    Everything below the date header depends only on the styles, the selected
+    components and the habit list, so the tables, headings and their
+    TableStyle objects are created once. Platypus records layout state on
+    flowable instances, so each day gets a shallow copy that shares the
+    already styled cells but keeps its own layout attributes.
+    """
+    
+    def __init__(self, styles, components, habits=None):
+        self.styles = styles
+        self.sections = self._build_sections(styles, components, habits)
+    
+    def build(self, date):
+        """Return the flowables for one day; only the date header is new."""
+        return [self.build_header(date), Spacer(1, 12)] + self.build_sections()
+    
+    def build_header(self, date):
+        """Return the date header paragraph for one day."""
+        day_header = date.strftime("%A, %B %d, %Y")
+        return Paragraph(day_header, self.styles['PlannerTitle'])
+    
+    def build_sections(self):
+        """Return fresh copies of the static flowables below the header."""
+        content = []
+        for heading, table, spaced in self.sections:
+            content.append(copy.copy(heading))
+            content.append(copy.copy(table))
+            if spaced:
+                content.append(Spacer(1, 12))
+        return content
+    
+    @staticmethod
+    def _build_sections(styles, components, habits=None):
+        # (heading, table, followed by a spacer) for each enabled section
+        content = []
         
-        # Create habit tracker table
-        habit_data = [['Habit', 'Done']]
-        for habit in habits:
-            habit_data.append([habit, '□'])
+        # Schedule section
+        if components.get('schedule', False):
+            heading = Paragraph("Daily Schedule", styles['PlannerHeading'])
+            
+            # Create schedule table
+            schedule_data = []
+            schedule_data.append(['Time', 'Activity'])
+            
+            for hour in range(6, 23):  # 6 AM to 10 PM
+                am_pm = 'AM' if hour < 12 else 'PM'
+                display_hour = hour if hour <= 12 else hour - 12
+                if display_hour == 0:
+                    display_hour = 12
+                
+                time_str = f"{display_hour} {am_pm}"
+                schedule_data.append([time_str, ''])
+            
+            schedule_table = Table(schedule_data, colWidths=[2*cm, 12*cm])
+            schedule_table.setStyle(TableStyle([
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('FONTNAME', (0, 0), (-1, 0), styles['PlannerHeading'].fontName),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ]))
+            
+            content.append((heading, schedule_table, True))
         
-        habit_table = Table(habit_data, colWidths=[12*cm, 2*cm])
-        habit_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, 0), styles['PlannerHeading'].fontName),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ]))
+        # To-do list section
+        if components.get('todo', False):
+            heading = Paragraph("To-Do List", styles['PlannerHeading'])
+            
+            # Create to-do table
+            todo_data = []
+            for i in range(10):
+                todo_data.append(['□', ''])
+            
+            todo_table = Table(todo_data, colWidths=[1*cm, 13*cm])
+            todo_table.setStyle(TableStyle([
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('FONTNAME', (0, 0), (-1, -1), styles['PlannerNormal'].fontName),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ]))
+            
+            content.append((heading, todo_table, True))
         
-        content.append(habit_table)
-        content.append(Spacer(1, 12))
-    
-    # Notes section
-    if components.get('notes', False):
-        content.append(Paragraph("Notes", styles['PlannerHeading']))
+        # Habit tracker section
+        if components.get('habit_tracker', False) and habits:
+            heading = Paragraph("Habit Tracker", styles['PlannerHeading'])
+            
+            # Create habit tracker table
+            habit_data = [['Habit', 'Done']]
+            for habit in habits:
+                habit_data.append([habit, '□'])
+            
+            habit_table = Table(habit_data, colWidths=[12*cm, 2*cm])
+            habit_table.setStyle(TableStyle([
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('FONTNAME', (0, 0), (-1, 0), styles['PlannerHeading'].fontName),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ]))
+            
+            content.append((heading, habit_table, True))
         
-        # Create notes table (just a big empty box)
-        notes_data = [['']]
-        notes_table = Table(notes_data, colWidths=[14*cm], rowHeights=[8*cm])
-        notes_table.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+        # Notes section
+        if components.get('notes', False):
+            heading = Paragraph("Notes", styles['PlannerHeading'])
+            
+            # Create notes table (just a big empty box)
+            notes_data = [['']]
+            notes_table = Table(notes_data, colWidths=[14*cm], rowHeights=[8*cm])
+            notes_table.setStyle(TableStyle([
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ]))
+            
+            content.append((heading, notes_table, False))
         
-        content.append(notes_table)
-    
-    return content 
\ No newline at end of file
+        return content
+
+def generate_day_page(date, styles, components, habits=None, template=None):
+    """Generate a page for a single day."""
+    if template is None:
+        template = DayPageTemplate(styles, components, habits)
+    return template.build(date)
@@ -0,0 +1,163 @@
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple
+from .config import Config
+from .artifacts import generated_files
+from .pools import WorkerPool
+from .metrics import render_stage_seconds, worker_samples, merge_worker_samples
+from .quotes import quote_provider
+
+
+def _render_planner(options: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Render a planner in a worker process and return the PDF path and the render metrics."""
+    # Imported here so the worker only pays for ReportLab when it renders
+    from .generator import generate_planner
+    return generate_planner(**options), worker_samples()
+
+
+class QueueFullError(Exception):
+    """Raised when the render queue cannot accept any more jobs."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Render queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RenderJob:
+    """A single planner render submitted to the queue."""
+
+    def __init__(self, options: Dict[str, Any], download_name: str):
+        """
+        Initialize a render job.
+
+        Args:
+            options: Keyword arguments for generate_planner
+            download_name: File name offered to the client on download
+        """
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.download_name = download_name
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def status(self) -> str:
+        """Current job state: queued, running, done or failed."""
+        if self.future is None or not self.future.done():
+            if self.future is not None and self.future.running():
+                return 'running'
+            return 'queued'
+        return 'failed' if self.future.exception() else 'done'
+
+    @property
+    def path(self) -> Optional[str]:
+        """Path of the finished PDF, or None if it is not ready."""
+        if self.status == 'done':
+            return self.future.result()[0]
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the status API."""
+        data = {
+            'id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+        if data['status'] == 'failed':
+            data['error'] = str(self.future.exception())
+        return data
+
+
+class RenderQueue:
+    """Bounded queue of planners rendered in the background by a WorkerPool."""
+
+    def __init__(self, max_workers: int = None, max_pending: int = None, job_ttl: int = None):
+        """
+        Initialize the render queue.
+
+        Args:
+            max_workers: Number of render processes
+            max_pending: Maximum number of unfinished jobs before rejecting new ones
+            job_ttl: Seconds a finished job stays queryable
+        """
+        self.max_workers = max_workers or Config.RENDER_WORKERS
+        self.max_pending = max_pending or Config.RENDER_QUEUE_SIZE
+        self.job_ttl = job_ttl or Config.RENDER_JOB_TTL
+        self.jobs = {}
+        # Worker processes are started on the first submit, so importing the app never starts any
+        self._pool = WorkerPool(self.max_workers)
+        self._lock = threading.Lock()
+        self._avg_duration = None
+
+    def _pending(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status in ('queued', 'running'))
+
+    def _prune(self):
+        # Forget finished jobs older than the TTL; their files are left to the sweeper
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def retry_after(self) -> int:
+        """Estimate how many seconds a rejected client should wait."""
+        if self._avg_duration is None:
+            return Config.RENDER_RETRY_AFTER
+        return max(1, int(self._avg_duration * self._pending() / self.max_workers) + 1)
+
+    def submit(self, options: Dict[str, Any], download_name: str) -> RenderJob:
+        """
+        Queue a planner for rendering.
+
+        Args:
+            options: Keyword arguments for generate_planner
+            download_name: File name offered to the client on download
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: If max_pending jobs are already waiting
+        """
+        with self._lock:
+            self._prune()
+            if self._pending() >= self.max_pending:
+                raise QueueFullError(self.retry_after())
+
+            if not options.get('quote'):
+                # Picked here, from the live pool, rather than from a worker's copy of it
+                with render_stage_seconds.time(stage='quote'):
+                    options = dict(options, quote=quote_provider.get())
+            job = RenderJob(options, download_name)
+            job.future = self._pool.submit(_render_planner, options)
+            job.future.add_done_callback(lambda future, job=job: self._on_done(job))
+            self.jobs[job.id] = job
+            return job
+
+    def _on_done(self, job: RenderJob):
+        job.finished_at = time.time()
+        # The PDF was written by a worker process; its lifetime is managed here,
+        # and the worker's metrics are added to this process's
+        if not job.future.cancelled() and job.future.exception() is None:
+            path, samples = job.future.result()
+            generated_files.track(path)
+            merge_worker_samples(samples)
+        duration = job.finished_at - job.created_at
+        # Exponential moving average of end-to-end job time for Retry-After
+        if self._avg_duration is None:
+            self._avg_duration = duration
+        else:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        """Look up a job by id."""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        self._pool.shutdown()
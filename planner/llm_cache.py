@@ -0,0 +1,193 @@
+import copy
+import re
+from typing import Dict, List, Any, Optional, Tuple
+from .config import Config
+from .lru import LRUCache
+
+ITEM_TYPES = ('event', 'task', 'note')
+
+# Dates and times in one pass; a date wins over a time at the same position,
+# so "05.03.2025" is a date while "9.30" is a time
+_DATE_TIME = re.compile(
+    r'\b(?P<iso>(?P<iy>\d{4})-(?P<im>\d{1,2})-(?P<id>\d{1,2}))\b'
+    r'|\b(?P<dmy>(?P<dd>\d{1,2})[./](?P<dm>\d{1,2})[./](?P<dy>\d{4}|\d{2}))\b'
+    r'|\b(?P<time>(?P<h>\d{1,2})[:.](?P<min>\d{2}))\b'
+)
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER = re.compile(r'<<(\d+):([oc])>>')
+_ITEM_FIELDS = ('title', 'time', 'description')
+_WORD = re.compile(r'\w{3,}')
+
+
+def _canonical(match) -> Tuple[str, str]:
+    """Return the marker and canonical form of a date or time match."""
+    if match.group('iso'):
+        return '<date>', f"{int(match.group('iy')):04d}-{int(match.group('im')):02d}-{int(match.group('id')):02d}"
+    if match.group('dmy'):
+        year = match.group('dy')
+        year = f"20{year}" if len(year) == 2 else year
+        return '<date>', f"{int(year):04d}-{int(match.group('dm')):02d}-{int(match.group('dd')):02d}"
+    return '<time>', f"{int(match.group('h')):02d}:{match.group('min')}"
+
+
+def normalize_message(message: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Normalize a message into a cache key.
+
+    The message is lowercased and its whitespace collapsed, and every date
+    and time is replaced by a <date> or <time> marker, so "Встреча с Олегом
+    в 10:00" and "встреча  с олегом в 15.30" share one key.
+
+    Args:
+        message: The user message
+
+    Returns:
+        A tuple of the normalized text and the abstracted values as
+        (text as written, canonical form) pairs, in order of appearance
+    """
+    values = []
+
+    def abstract(match):
+        marker, canonical = _canonical(match)
+        values.append((match.group(0), canonical))
+        return marker
+
+    text = _WHITESPACE.sub(' ', message.lower()).strip(' .!?')
+    return _DATE_TIME.sub(abstract, text), values
+
+
+def validate_planner_items(items: Any) -> Optional[List[Dict[str, Any]]]:
+    """
+    Check add_planner_items output against the tool schema.
+
+    Args:
+        items: The "items" argument of the tool call
+
+    Returns:
+        The items with only the schema fields, or None if any item is invalid
+    """
+    if not isinstance(items, list) or not items:
+        return None
+    valid = []
+    for item in items:
+        if not isinstance(item, dict) or item.get('type') not in ITEM_TYPES:
+            return None
+        if not isinstance(item.get('title'), str) or not item['title'].strip():
+            return None
+        clean = {'type': item['type'], 'title': item['title']}
+        for field in ('time', 'description'):
+            if isinstance(item.get(field), str):
+                clean[field] = item[field]
+        valid.append(clean)
+    return valid
+
+
+def _grounded(items: List[Dict[str, Any]], text: str) -> bool:
+    """
+    Check that every item title shares a word stem with the message.
+
+    Replies to messages such as "да, добавь это" depend on the earlier
+    conversation rather than on the message and must not be cached.
+    """
+    stems = {word[:5] for word in _WORD.findall(text)}
+    return all(any(word[:5] in stems for word in _WORD.findall(item['title'].lower())) for item in items)
+
+
+def _template(items: List[Dict[str, Any]], values: List[Tuple[str, str]]) -> Optional[List[Dict[str, Any]]]:
+    """Replace the message's dates and times in item fields with placeholders."""
+    templated = copy.deepcopy(items)
+    for item in templated:
+        for field in _ITEM_FIELDS:
+            text = item.get(field)
+            if not text:
+                continue
+            # Longer values first, so a short value never matches inside a longer one
+            for index, (written, canonical) in sorted(enumerate(values), key=lambda v: -len(v[1][0])):
+                text = text.replace(canonical, f"<<{index}:c>>")
+                if written != canonical:
+                    text = text.replace(written, f"<<{index}:o>>")
+            # A date or time the placeholders do not cover came from somewhere else;
+            # reusing it for a different message would be wrong
+            if _DATE_TIME.search(_PLACEHOLDER.sub('', text)):
+                return None
+            item[field] = text
+    return templated
+
+
+def _fill(items: List[Dict[str, Any]], values: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """Put the current message's dates and times into templated items."""
+    filled = copy.deepcopy(items)
+    for item in filled:
+        for field in _ITEM_FIELDS:
+            if item.get(field):
+                item[field] = _PLACEHOLDER.sub(
+                    lambda m: values[int(m.group(1))][0 if m.group(2) == 'o' else 1], item[field])
+    return filled
+
+
+class LLMResultCache:
+    """Cache of add_planner_items results keyed by the normalized message.
+
+    Only validated tool output whose items are grounded in the message is
+    stored, with the message's dates and times turned into placeholders, so
+    a rephrasing that differs only in case, spacing or the actual date and
+    time is answered without a model call.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Number of cached results (defaults to Config.LLM_CACHE_SIZE)
+            ttl: Seconds a result stays valid (defaults to Config.LLM_CACHE_TTL)
+        """
+        self.entries = LRUCache(max_entries or Config.LLM_CACHE_SIZE, ttl or Config.LLM_CACHE_TTL)
+
+    def get(self, model: str, message: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Look up the planner items for a message.
+
+        Args:
+            model: The model that would answer the message
+            message: The user message
+
+        Returns:
+            The planner items with this message's dates and times, or None
+        """
+        text, values = normalize_message(message)
+        items = self.entries.get((model, text))
+        if items is None:
+            return None
+        return _fill(items, values)
+
+    def put(self, model: str, message: str, items: Any) -> bool:
+        """
+        Store the validated tool output for a message.
+
+        Args:
+            model: The model that produced the items
+            message: The user message
+            items: The "items" argument of the add_planner_items call
+
+        Returns:
+            True if the items were valid and cached
+        """
+        valid = validate_planner_items(items)
+        if valid is None:
+            return False
+        text, values = normalize_message(message)
+        if not _grounded(valid, text):
+            return False
+        templated = _template(valid, values)
+        if templated is None:
+            return False
+        self.entries.put((model, text), templated)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the hit rate and size of the cache."""
+        return self.entries.stats()
+
+
+llm_cache = LLMResultCache()
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import random
+import time
+import httpx
+from typing import Dict, List, Any, Optional, AsyncIterator
+from .config import Config
+from .metrics import llm_request_seconds, upstream_errors
+
+# Connection pools shared by every async client on an event loop, one per base URL
+_clients = {}
+
+def get_async_client(base_url: str) -> httpx.AsyncClient:
+    """
+    Get the pooled async HTTP client for a model server.
+
+    Connections belong to the event loop that opened them, so a client is
+    only reused on the loop it was created on.
+
+    Args:
+        base_url: The base URL of the API
+
+    Returns:
+        An httpx client that reuses connections to that server
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(base_url)
+    if entry is None or entry[0] is not loop:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(Config.LLM_READ_TIMEOUT, connect=Config.LLM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=Config.LLM_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=Config.LLM_POOL_MAXSIZE))
+        entry = _clients[base_url] = (loop, client)
+    return entry[1]
+
+async def close_async_clients():
+    """Close the pooled clients of the running event loop, e.g. on server shutdown."""
+    loop = asyncio.get_running_loop()
+    for base_url, (client_loop, client) in list(_clients.items()):
+        if client_loop is loop:
+            del _clients[base_url]
+            await client.aclose()
+
+class AsyncLMStudioToolsClient:
+    """Asyncio variant of LMStudioToolsClient.
+
+    Requests run on the event loop instead of blocking a thread, so one
+    process can wait on many model calls at once. Cancelling the awaiting
+    task closes the connection, which stops generation on the server.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:1234/v1", api_key: Optional[str] = None,
+                 upstream: str = "lmstudio"):
+        """
+        Initialize the client.
+
+        Args:
+            base_url: The base URL for the LM Studio API
+            api_key: Optional API key for authentication
+            upstream: Name the server's calls and errors are reported under in metrics
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.upstream = upstream
+        # Seconds the last chat_completion spent waiting on the server
+        self.last_latency = None
+        self.headers = {
+            "Content-Type": "application/json"
+        }
+        if api_key and api_key.strip():
+            self.headers["Authorization"] = f"Bearer {api_key}"
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return get_async_client(self.base_url)
+
+    async def chat_completion(self,
+                              messages: List[Dict[str, str]],
+                              model: str = "local-model",
+                              tools: Optional[List[Dict[str, Any]]] = None,
+                              temperature: float = 0.7,
+                              max_tokens: int = 1024) -> Dict[str, Any]:
+        """
+        Send a chat completion request to LM Studio.
+
+        Args:
+            messages: List of message objects with role and content
+            model: The model to use
+            tools: Optional list of tools to make available to the model
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+
+        Returns:
+            The response from the API, or {"error": True, "message": ...}
+        """
+        endpoint = f"{self.base_url}/chat/completions"
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+        if tools:
+            payload["tools"] = tools
+
+        call_start = time.perf_counter()
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                response = await self.client.post(endpoint, headers=self.headers, json=payload)
+                self.last_latency = time.perf_counter() - start
+                response.raise_for_status()
+                result = response.json()
+                self._record_call(call_start, "ok")
+                return result
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Same policy as the sync client: only connection failures are retried
+                self.last_latency = time.perf_counter() - start
+                if attempt < Config.LLM_MAX_RETRIES:
+                    await asyncio.sleep(Config.LLM_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+                    continue
+                error = e
+            except (httpx.HTTPError, ValueError) as e:
+                self.last_latency = time.perf_counter() - start
+                error = e
+            break
+
+        self._record_call(call_start, "error")
+        return {
+            "error": True,
+            "message": str(error) or type(error).__name__
+        }
+
+    def _record_call(self, start: float, outcome: str):
+        """Record the duration of a chat completion, retries included, and count failures."""
+        llm_request_seconds.observe(time.perf_counter() - start, upstream=self.upstream, outcome=outcome)
+        if outcome == "error":
+            upstream_errors.inc(upstream=self.upstream)
+
+    async def stream_chat_completion(self,
+                                     messages: List[Dict[str, str]],
+                                     model: str = "local-model",
+                                     tools: Optional[List[Dict[str, Any]]] = None,
+                                     temperature: float = 0.7,
+                                     max_tokens: int = 1024) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a streaming chat completion request to LM Studio.
+
+        Closing the generator (or cancelling the task iterating it) closes
+        the connection, which stops generation on the server.
+
+        Args:
+            messages: List of message objects with role and content
+            model: The model to use
+            tools: Optional list of tools to make available to the model
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+
+        Yields:
+            Completion chunks from the API, or a single
+            {"error": True, "message": ...} dict if the request fails
+        """
+        endpoint = f"{self.base_url}/chat/completions"
+
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+
+        if tools:
+            payload["tools"] = tools
+
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            response = None
+            try:
+                request = self.client.build_request("POST", endpoint, headers=self.headers, json=payload)
+                response = await self.client.send(request, stream=True)
+                response.raise_for_status()
+                break
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Only the connection is retried; once tokens flow the stream is not replayed
+                if attempt < Config.LLM_MAX_RETRIES:
+                    await asyncio.sleep(Config.LLM_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+                    continue
+                upstream_errors.inc(upstream=self.upstream)
+                yield {"error": True, "message": str(e) or type(e).__name__}
+                return
+            except httpx.HTTPError as e:
+                if response is not None:
+                    await response.aclose()
+                upstream_errors.inc(upstream=self.upstream)
+                yield {"error": True, "message": str(e) or type(e).__name__}
+                return
+
+        try:
+            async for line in response.aiter_lines():
+                # SSE: "data: {...}" lines separated by blank lines, ended by "data: [DONE]"
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    yield json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+        except httpx.HTTPError as e:
+            upstream_errors.inc(upstream=self.upstream)
+            yield {"error": True, "message": str(e) or type(e).__name__}
+        finally:
+            await response.aclose()
@@ -1,14 +1,188 @@
 import json
 import re
-from typing import Dict, List, Any, Optional, Tuple
+import time
+from typing import Dict, List, Any, Optional, Tuple, Iterator, AsyncIterator
 from .lmstudio_tools import LMStudioToolsClient
 from .chat_processor import ChatProcessor
+from .chat_history import ChatHistory
+from .llm_cache import llm_cache
 from .config import Config
 
+SYSTEM_PROMPT = (
+    "Ты - помощник для планирования задач и событий в ежедневнике. "
+    "Твоя задача - помогать пользователю заполнять ежедневник, извлекая информацию из его сообщений. "
+    "Отвечай кратко и по делу, фокусируясь на задачах планирования. "
+    "Если пользователь просит добавить что-то в ежедневник, подтверди добавление и спроси, нужно ли добавить что-то еще. "
+    "Если пользователь задает вопрос не связанный с планированием, вежливо напомни, что твоя основная задача - помогать с ежедневником."
+)
+
+# Tool the model calls to add items to the planner
+PLANNER_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "add_planner_items",
+            "description": "Add items to the planner based on user request",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "type": {
+                                    "type": "string",
+                                    "enum": ["event", "task", "note"],
+                                    "description": "Type of planner item"
+                                },
+                                "title": {
+                                    "type": "string",
+                                    "description": "Title of the planner item"
+                                },
+                                "time": {
+                                    "type": "string",
+                                    "description": "Time of the event in HH:MM format (only for events)"
+                                },
+                                "description": {
+                                    "type": "string",
+                                    "description": "Optional description of the planner item"
+                                }
+                            },
+                            "required": ["type", "title"]
+                        }
+                    }
+                },
+                "required": ["items"]
+            }
+        }
+    }
+]
+
+_ITEMS_ARRAY = re.compile(r'"items"\s*:\s*\[')
+
+class ToolArgumentStream:
+    """Incremental parser for streamed add_planner_items arguments.
+    
+    The arguments JSON arrives in arbitrary fragments. Each complete object in
+    the "items" array is decoded as soon as its closing brace arrives, so
+    items can be shown before the model has finished the call.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.items = []
+        self._pos = None
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+    
+    def feed(self, fragment: str) -> List[Dict[str, Any]]:
+        """
+        Add a fragment of the arguments string.
+        
+        Args:
+            fragment: Next piece of the arguments JSON
+            
+        Returns:
+            Items completed by this fragment
+        """
+        self.text += fragment
+        if self._pos is None:
+            match = _ITEMS_ARRAY.search(self.text)
+            if not match:
+                return []
+            self._pos = match.end()
+        
+        completed = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        item = json.loads(text[self._start:self._pos + 1])
+                    except json.JSONDecodeError:
+                        item = None
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        completed.append(item)
+            self._pos += 1
+        return completed
+
+class StreamedReply:
+    """Accumulates the chunks of a streamed completion.
+    
+    Shared by the sync and async streaming paths, which only differ in how
+    they iterate over the chunks.
+    """
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        # Seconds to the first streamed token, or None
+        self.ttft = None
+        self.content = []
+        self.tool_name = None
+        self.arguments = ToolArgumentStream()
+        self.error = None
+    
+    def feed(self, chunk: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Add a completion chunk.
+        
+        Args:
+            chunk: A chunk from stream_chat_completion
+            
+        Returns:
+            The token and item events of this chunk; error is set instead
+            if the chunk reports a failed request
+        """
+        if "error" in chunk:
+            self.error = chunk["message"]
+            return []
+        if not chunk.get("choices"):
+            return []
+        delta = chunk["choices"][0].get("delta") or {}
+        events = []
+        
+        if self.ttft is None and (delta.get("content") or delta.get("tool_calls")):
+            self.ttft = time.perf_counter() - self.start
+        
+        if delta.get("content"):
+            self.content.append(delta["content"])
+            events.append({"type": "token", "content": delta["content"]})
+        
+        # Tool calls arrive as fragments: the name first, then pieces of the arguments JSON
+        for tool_call in delta.get("tool_calls") or []:
+            if tool_call.get("index", 0) != 0:
+                continue
+            function = tool_call.get("function") or {}
+            self.tool_name = function.get("name") or self.tool_name
+            if self.tool_name == "add_planner_items" and function.get("arguments"):
+                for item in self.arguments.feed(function["arguments"]):
+                    events.append({"type": "item", "item": item})
+        return events
+
 class LMStudioChat:
     """Chat interface for LM Studio."""
     
-    def __init__(self, base_url: str = "http://localhost:1234/v1", api_key: Optional[str] = None, model: Optional[str] = None):
+    def __init__(self, base_url: str = "http://localhost:1234/v1", api_key: Optional[str] = None, model: Optional[str] = None,
+                 client: Optional[LMStudioToolsClient] = None, max_history_tokens: Optional[int] = None):
         """
         Initialize the LM Studio chat interface.
         
@@ -16,23 +190,20 @@ class LMStudioChat:
             base_url: The base URL for the LM Studio API
             api_key: Optional API key for authentication
             model: Optional model name to use
+            client: Existing client to reuse instead of creating one
+            max_history_tokens: Optional token budget of the conversation
+                history (defaults to Config.CHAT_SESSION_TOKEN_BUDGET)
         """
-        self.client = LMStudioToolsClient(base_url=base_url, api_key=api_key)
+        self.client = client or LMStudioToolsClient(base_url=base_url, api_key=api_key)
         self.processor = ChatProcessor()
-        self.conversation_history = []
+        self.history = ChatHistory(SYSTEM_PROMPT, max_history_tokens)
         self.model = model or Config.get_model('lmstudio') or 'local-model'
-        
-        # Add system message
-        self.conversation_history.append({
-            "role": "system",
-            "content": (
-                "Ты - помощник для планирования задач и событий в ежедневнике. "
-                "Твоя задача - помогать пользователю заполнять ежедневник, извлекая информацию из его сообщений. "
-                "Отвечай кратко и по делу, фокусируясь на задачах планирования. "
-                "Если пользователь просит добавить что-то в ежедневник, подтверди добавление и спроси, нужно ли добавить что-то еще. "
-                "Если пользователь задает вопрос не связанный с планированием, вежливо напомни, что твоя основная задача - помогать с ежедневником."
-            )
-        })
+        self.cache = llm_cache if Config.LLM_CACHE_ENABLED else None
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """The messages sent to the model: system prompt, summary and recent turns."""
+        return self.history.messages()
     
     def process_message(self, message: str) -> Tuple[List[Dict[str, Any]], str]:
         """
@@ -46,27 +217,36 @@ class LMStudioChat:
             - A list of extracted planner items
             - A response message
         """
-        # First try to extract planner items using pattern matching
-        items, pattern_response = self.processor.process_message(message)
-        
-        # If items were extracted, use the pattern-based response
-        if items:
-            # Add the message to conversation history
-            self.conversation_history.append({
-                "role": "user",
-                "content": message
-            })
-            
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": pattern_response
-            })
-            
-            return items, pattern_response
+        local = self._answer_locally(message)
+        if local:
+            return local
         
         # If no items were extracted, use LM Studio to generate a response
         return self.process_with_lmstudio(message)
     
+    async def process_message_async(self, message: str, client) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Asyncio variant of process_message.
+        
+        Args:
+            message: The user message
+            client: AsyncLMStudioToolsClient used for the model call
+            
+        Returns:
+            The same tuple as process_message
+        """
+        local = self._answer_locally(message)
+        if local:
+            return local
+        
+        self.history.add("user", message)
+        response = await client.chat_completion(
+            messages=self.conversation_history,
+            tools=PLANNER_TOOLS,
+            model=self.model
+        )
+        return self._complete_turn(message, response)
+    
     def process_with_lmstudio(self, message: str) -> Tuple[List[Dict[str, Any]], str]:
         """
         Process a message using LM Studio.
@@ -80,62 +260,40 @@ class LMStudioChat:
             - A response message
         """
         # Add the message to conversation history
-        self.conversation_history.append({
-            "role": "user",
-            "content": message
-        })
-        
-        # Define the tools for planner items
-        planner_tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "add_planner_items",
-                    "description": "Add items to the planner based on user request",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "items": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "type": {
-                                            "type": "string",
-                                            "enum": ["event", "task", "note"],
-                                            "description": "Type of planner item"
-                                        },
-                                        "title": {
-                                            "type": "string",
-                                            "description": "Title of the planner item"
-                                        },
-                                        "time": {
-                                            "type": "string",
-                                            "description": "Time of the event in HH:MM format (only for events)"
-                                        },
-                                        "description": {
-                                            "type": "string",
-                                            "description": "Optional description of the planner item"
-                                        }
-                                    },
-                                    "required": ["type", "title"]
-                                }
-                            }
-                        },
-                        "required": ["items"]
-                    }
-                }
-            }
-        ]
+        self.history.add("user", message)
         
         # Send the request to LM Studio
         response = self.client.chat_completion(
             messages=self.conversation_history,
-            tools=planner_tools,
+            tools=PLANNER_TOOLS,
             model=self.model
         )
+        return self._complete_turn(message, response)
+    
+    def _answer_locally(self, message: str) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """
+        Answer a message without a model call, if possible.
         
-        # Process the response
+        Returns:
+            The planner items and response, already added to the history,
+            or None if the model has to be asked
+        """
+        # First try to extract planner items using pattern matching
+        items, response = self.processor.process_message(message)
+        
+        # Then reuse the model's answer to an equivalent earlier message
+        if not items:
+            items = self._cached_items(message)
+            if not items:
+                return None
+            response = self.processor.generate_response(message, items)
+        
+        self.history.add("user", message)
+        self.history.add("assistant", response, items)
+        return items, response
+    
+    def _complete_turn(self, user_message: str, response: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], str]:
+        """Turn the model's completion into planner items and a reply, and record them."""
         items = []
         response_text = ""
         
@@ -149,6 +307,7 @@ class LMStudioChat:
                     try:
                         tool_args = json.loads(tool_call["function"]["arguments"])
                         items = tool_args.get("items", [])
+                        self._cache_items(user_message, items)
                         
                         # Generate a response based on the items
                         response_text = self.processor.generate_response("", items)
@@ -163,14 +322,129 @@ class LMStudioChat:
         if not response_text:
             response_text = "Извините, я не смог обработать ваш запрос. Пожалуйста, попробуйте сформулировать его иначе."
         
-        # Add the response to conversation history
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": response_text
-        })
+        self.history.add("assistant", response_text, items)
         
-        # Keep conversation history manageable (last 10 messages)
-        if len(self.conversation_history) > 12:  # system message + 10 exchanges
-            self.conversation_history = [self.conversation_history[0]] + self.conversation_history[-10:]
+        return items, response_text
+    
+    def stream_message(self, message: str) -> Iterator[Dict[str, Any]]:
+        """
+        Process a user message, streaming the response as it is generated.
+        
+        Pattern matches and cached results are answered at once; everything
+        else goes to LM Studio in streaming mode. Planner items are yielded as
+        soon as their part of the add_planner_items arguments is complete.
+        
+        Args:
+            message: The user message
+            
+        Yields:
+            Events as dicts with a "type" key:
+            - {"type": "token", "content": ...} for each piece of reply text
+            - {"type": "item", "item": ...} for each extracted planner item
+            - {"type": "done", "response": ..., "planner_items": [...],
+              "ttft": ...} once the reply is complete; ttft is the time to the
+              first streamed token in seconds, or None
+        """
+        local = self._answer_locally(message)
+        if local:
+            yield from self._local_events(*local)
+            return
+        
+        self.history.add("user", message)
+        reply = StreamedReply()
+        for chunk in self.client.stream_chat_completion(
+            messages=self.conversation_history,
+            tools=PLANNER_TOOLS,
+            model=self.model
+        ):
+            yield from reply.feed(chunk)
+            if reply.error:
+                break
         
-        return items, response_text 
\ No newline at end of file
+        yield from self._finish_stream(message, reply)
+    
+    async def stream_message_async(self, message: str, client) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Asyncio variant of stream_message.
+        
+        Args:
+            message: The user message
+            client: AsyncLMStudioToolsClient used for the model call
+            
+        Yields:
+            The same events as stream_message
+        """
+        local = self._answer_locally(message)
+        if local:
+            for event in self._local_events(*local):
+                yield event
+            return
+        
+        self.history.add("user", message)
+        reply = StreamedReply()
+        chunks = client.stream_chat_completion(
+            messages=self.conversation_history,
+            tools=PLANNER_TOOLS,
+            model=self.model
+        )
+        try:
+            async for chunk in chunks:
+                for event in reply.feed(chunk):
+                    yield event
+                if reply.error:
+                    break
+        finally:
+            # Also closes the upstream connection when this task is cancelled
+            await chunks.aclose()
+        
+        for event in self._finish_stream(message, reply):
+            yield event
+    
+    def _local_events(self, items: List[Dict[str, Any]], response: str) -> List[Dict[str, Any]]:
+        """Events of a reply that did not need the model."""
+        events = [{"type": "item", "item": item} for item in items]
+        events.append({"type": "done", "response": response, "planner_items": items, "ttft": None})
+        return events
+    
+    def _finish_stream(self, user_message: str, reply: "StreamedReply") -> List[Dict[str, Any]]:
+        """Complete a streamed turn: the items still missing, then the done event."""
+        events = []
+        items = reply.arguments.items
+        response_text = ""
+        if reply.tool_name == "add_planner_items":
+            try:
+                items = json.loads(reply.arguments.text).get("items", [])
+                # Anything the incremental parser could not pick out on the way
+                for item in items[len(reply.arguments.items):]:
+                    events.append({"type": "item", "item": item})
+                self._cache_items(user_message, items)
+                response_text = self.processor.generate_response("", items)
+            except (json.JSONDecodeError, AttributeError):
+                if items:
+                    response_text = self.processor.generate_response("", items)
+                else:
+                    response_text = "Извините, произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте еще раз."
+        
+        if not response_text:
+            response_text = "".join(reply.content)
+        
+        if not response_text:
+            if reply.error:
+                print(f"Error streaming from LM Studio: {reply.error}")
+            response_text = "Извините, я не смог обработать ваш запрос. Пожалуйста, попробуйте сформулировать его иначе."
+        
+        self.history.add("assistant", response_text, items)
+        
+        events.append({"type": "done", "response": response_text, "planner_items": items, "ttft": reply.ttft})
+        return events
+    
+    def _cached_items(self, message: str) -> Optional[List[Dict[str, Any]]]:
+        """Look up the model's earlier answer to an equivalent message."""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.model, message)
+    
+    def _cache_items(self, message: str, items: Any):
+        """Remember valid add_planner_items output for equivalent messages."""
+        if self.cache is not None:
+            self.cache.put(self.model, message, items)
@@ -1,20 +1,57 @@
 import json
+import random
+import threading
+import time
 import requests
-from typing import Dict, List, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Optional, Iterator
+from .config import Config
+from .metrics import llm_request_seconds, upstream_errors
+
+# Keep-alive sessions shared by every client in the process, one per base URL
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(base_url: str) -> requests.Session:
+    """
+    Get the pooled HTTP session for a model server.
+    
+    Args:
+        base_url: The base URL of the API
+        
+    Returns:
+        A requests session that reuses connections to that server
+    """
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            # pool_block caps the open connections; further requests wait for a free one
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.LLM_POOL_MAXSIZE, pool_block=True)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[base_url] = session
+        return session
 
 class LMStudioToolsClient:
     """Client for interacting with LM Studio API with tool use functionality."""
     
-    def __init__(self, base_url: str = "http://localhost:1234/v1", api_key: Optional[str] = None):
+    def __init__(self, base_url: str = "http://localhost:1234/v1", api_key: Optional[str] = None,
+                 upstream: str = "lmstudio"):
         """
         Initialize the LM Studio client.
         
         Args:
             base_url: The base URL for the LM Studio API
             api_key: Optional API key for authentication
+            upstream: Name the server's calls and errors are reported under in metrics
         """
         self.base_url = base_url
         self.api_key = api_key
+        self.upstream = upstream
+        self.session = get_session(base_url)
+        # Seconds the last chat_completion spent waiting on the server
+        self.last_latency = None
         self.headers = {
             "Content-Type": "application/json"
         }
@@ -52,15 +89,119 @@ class LMStudioToolsClient:
         if tools:
             payload["tools"] = tools
         
+        timeout = (Config.LLM_CONNECT_TIMEOUT, Config.LLM_READ_TIMEOUT)
+        call_start = time.perf_counter()
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(endpoint, headers=self.headers, json=payload, timeout=timeout)
+                self.last_latency = time.perf_counter() - start
+                response.raise_for_status()
+                result = response.json()
+                self._record_call(call_start, "ok")
+                return result
+            except requests.exceptions.ConnectionError as e:
+                # Connection failures are retried with jittered exponential backoff;
+                # read timeouts are not, since the server may still be generating
+                self.last_latency = time.perf_counter() - start
+                if attempt < Config.LLM_MAX_RETRIES:
+                    time.sleep(Config.LLM_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+                    continue
+                error = e
+            except requests.exceptions.RequestException as e:
+                self.last_latency = time.perf_counter() - start
+                error = e
+            break
+        
+        self._record_call(call_start, "error")
+        return {
+            "error": True,
+            "message": str(error)
+        }
+    
+    def _record_call(self, start: float, outcome: str):
+        """Record the duration of a chat completion, retries included, and count failures."""
+        llm_request_seconds.observe(time.perf_counter() - start, upstream=self.upstream, outcome=outcome)
+        if outcome == "error":
+            upstream_errors.inc(upstream=self.upstream)
+    
+    def stream_chat_completion(self,
+                               messages: List[Dict[str, str]],
+                               model: str = "local-model",
+                               tools: Optional[List[Dict[str, Any]]] = None,
+                               temperature: float = 0.7,
+                               max_tokens: int = 1024) -> Iterator[Dict[str, Any]]:
+        """
+        Send a streaming chat completion request to LM Studio.
+        
+        Uses the OpenAI-compatible "stream": true mode and decodes the
+        server-sent events as they arrive. Closing the generator closes the
+        connection, which stops generation on the server.
+        
+        Args:
+            messages: List of message objects with role and content
+            model: The model to use
+            tools: Optional list of tools to make available to the model
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            
+        Yields:
+            Completion chunks from the API, or a single
+            {"error": True, "message": ...} dict if the request fails
+        """
+        endpoint = f"{self.base_url}/chat/completions"
+        
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        
+        if tools:
+            payload["tools"] = tools
+        
+        timeout = (Config.LLM_CONNECT_TIMEOUT, Config.LLM_READ_TIMEOUT)
+        response = None
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            try:
+                response = self.session.post(endpoint, headers=self.headers, json=payload,
+                                             timeout=timeout, stream=True)
+                response.raise_for_status()
+                break
+            except requests.exceptions.ConnectionError as e:
+                # Only the connection is retried; once tokens flow the stream is not replayed
+                if attempt < Config.LLM_MAX_RETRIES:
+                    time.sleep(Config.LLM_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+                    continue
+                upstream_errors.inc(upstream=self.upstream)
+                yield {"error": True, "message": str(e)}
+                return
+            except requests.exceptions.RequestException as e:
+                if response is not None:
+                    response.close()
+                upstream_errors.inc(upstream=self.upstream)
+                yield {"error": True, "message": str(e)}
+                return
+        
         try:
-            response = requests.post(endpoint, headers=self.headers, json=payload)
-            response.raise_for_status()
-            return response.json()
+            for line in response.iter_lines():
+                # SSE: "data: {...}" lines separated by blank lines, ended by "data: [DONE]"
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    yield json.loads(data)
+                except json.JSONDecodeError:
+                    continue
         except requests.exceptions.RequestException as e:
-            return {
-                "error": True,
-                "message": str(e)
-            }
+            upstream_errors.inc(upstream=self.upstream)
+            yield {"error": True, "message": str(e)}
+        finally:
+            response.close()
     
     def get_planner_suggestions(self, prompt: str, model: str = "local-model") -> Dict[str, Any]:
         """
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """Thread-safe in-memory cache with a size bound and a time to live.
+
+    Entries are evicted least recently used first once max_entries is
+    reached, and are treated as missing once they are older than ttl.
+    Hits and misses are counted so callers can report the hit rate.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Number of entries kept
+            ttl: Seconds an entry stays valid, or None to keep it until evicted
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (value, stored timestamp), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if it is missing or expired."""
+        value, _ = self.get_with_age(key)
+        return default if value is None else value
+
+    def get_with_age(self, key: Hashable, max_age: Optional[float] = None):
+        """
+        Return the cached value together with its age in seconds.
+
+        Args:
+            key: The cache key
+            max_age: Accept entries up to this age instead of ttl, e.g. to
+                serve stale values while they are refreshed
+
+        Returns:
+            A (value, age) tuple, or (None, None) on a miss
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[1]
+                if max_age is None or age <= max_age:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], age
+                # Drop entries nobody can use any more
+                if age > max(self.ttl or 0, max_age):
+                    del self._entries[key]
+            self.misses += 1
+            return None, None
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        """Remove an entry if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit and miss counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
@@ -0,0 +1,238 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Sequence, Tuple
+
+# Histogram buckets in seconds: rendering stages take milliseconds to seconds,
+# model calls up to the read timeout
+RENDER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(str(value))}"' for name, value in labels.items()) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Yield (sample name, labels, value) for the text format."""
+        raise NotImplementedError
+
+    def drain(self) -> Dict[Tuple[str, ...], Any]:
+        """Return the recorded values and start over from zero."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[Tuple[str, ...], Any]):
+        """Add values returned by drain(), e.g. in another process."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets, optionally split by labels."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Count per bucket (the last one is +Inf) and the sum of all values
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format.
+
+    Besides the metrics it owns, the registry renders counters read from
+    stats() callbacks at scrape time, so caches that already count their
+    hits and misses do not need to count twice.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        # (metric name, help, label name, {label value: stats callback}, stats key)
+        self._stats_collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float],
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def stats_counter(self, name: str, documentation: str, labelname: str, stats_key: str) -> Dict[str, Callable]:
+        """
+        Add a counter whose values are read from stats() callbacks.
+
+        Returns:
+            A dict to register callbacks in, keyed by label value
+        """
+        sources = {}
+        self._stats_collectors.append((name, documentation, labelname, sources, stats_key))
+        return sources
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, documentation, labelname, sources, stats_key in self._stats_collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} counter")
+            for label, stats in sorted(sources.items()):
+                try:
+                    value = stats()[stats_key]
+                except Exception as e:
+                    print(f"Error reading {label} stats for metrics: {e}")
+                    continue
+                lines.append(f"{name}{_format_labels({labelname: label})} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+render_stage_seconds = registry.histogram(
+    'planner_render_stage_seconds', 'Time spent in each stage of producing a planner PDF.',
+    RENDER_BUCKETS, ('stage',))
+llm_request_seconds = registry.histogram(
+    'planner_llm_request_seconds', 'Duration of chat completion calls to model servers, retries included.',
+    LLM_BUCKETS, ('upstream', 'outcome'))
+pages_rendered = registry.counter(
+    'planner_pages_rendered_total', 'PDF pages rendered by this process.')
+bytes_emitted = registry.counter(
+    'planner_bytes_emitted_total', 'Bytes of PDF and ZIP responses sent to clients.', ('kind',))
+upstream_errors = registry.counter(
+    'planner_upstream_errors_total', 'Failed calls to external services.', ('upstream',))
+
+# Caches register their stats() here under a cache name, see register_cache
+_cache_hits = registry.stats_counter(
+    'planner_cache_hits_total', 'Lookups answered from a cache.', 'cache', 'hits')
+_cache_misses = registry.stats_counter(
+    'planner_cache_misses_total', 'Lookups a cache could not answer.', 'cache', 'misses')
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, Any]]):
+    """Export the 'hits' and 'misses' of a cache's stats() as counters labelled cache=name."""
+    _cache_hits[name] = stats
+    _cache_misses[name] = stats
+
+
+def count_bytes(chunks: Iterable[bytes], kind: str) -> Iterator[bytes]:
+    """Pass chunks of a streamed response through, adding their size to bytes_emitted."""
+    for chunk in chunks:
+        bytes_emitted.inc(len(chunk), kind=kind)
+        yield chunk
+
+
+# Recorded by render workers too; worker processes hand them back to the app process
+_WORKER_METRICS = (render_stage_seconds, pages_rendered)
+
+
+def worker_samples() -> Dict[str, Any]:
+    """Take the render metrics this worker process recorded since the last call."""
+    return {metric.name: metric.drain() for metric in _WORKER_METRICS}
+
+
+def merge_worker_samples(samples: Dict[str, Any]):
+    """Add render metrics returned by worker_samples() in a worker process."""
+    for metric in _WORKER_METRICS:
+        metric.merge(samples.get(metric.name, {}))
@@ -0,0 +1,59 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def process_context():
+    """
+    Get the multiprocessing context render and extraction workers start from.
+
+    A forked child inherits every lock held by another thread at the moment
+    of the fork (metrics, cache indexes, the sweeper and refill threads) and
+    would wait on it forever, so workers are started by a fork server, or
+    spawned on platforms without one.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class WorkerPool:
+    """Process pool created on first use and shared by all requests.
+
+    Starting worker processes is expensive, so a pool lives as long as the
+    app. If a worker dies (e.g. killed by the OOM killer) the pool breaks;
+    the next submit starts a fresh one.
+    """
+
+    def __init__(self, max_workers: int):
+        """
+        Initialize the pool; no process is started until the first submit.
+
+        Args:
+            max_workers: Number of worker processes
+        """
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=process_context())
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Run fn(*args, **kwargs) in a worker process."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            try:
+                return self._executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                self._executor.shutdown(wait=False)
+                self._executor = self._new_executor()
+                return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
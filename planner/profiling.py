@@ -0,0 +1,331 @@
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from .config import Config
+
+# Entries of the summary shown on the admin page
+SUMMARY_FUNCTIONS = 25
+SUMMARY_ALLOCATIONS = 15
+
+# Files written per capture besides the JSON summary: pstats dump and folded stacks
+CAPTURE_FILES = ('prof', 'folded')
+
+_CAPTURE_ID = re.compile(r'^\d{8}-\d{6}-\d{6}-[0-9a-f]{6}$')
+
+
+def profile_mode(value: Optional[str]) -> Optional[str]:
+    """
+    Interpret the X-Profile header or the profile query parameter.
+
+    Returns:
+        'memory' to profile with allocation tracing, 'cpu' for cProfile
+        only, or None if the request does not ask to be profiled
+    """
+    value = (value or '').strip().lower()
+    if value == 'memory':
+        return 'memory'
+    if value in ('1', 'true', 'yes', 'cpu'):
+        return 'cpu'
+    return None
+
+
+def _frame_label(func) -> str:
+    filename, line, name = func
+    if filename == '~':
+        # Built-ins have no source location
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    # ';' separates frames in the folded format
+    return label.replace(';', ',')
+
+
+def collapsed_stacks(stats: pstats.Stats, min_seconds: float = 1e-5, max_depth: int = 64) -> Dict[str, int]:
+    """
+    Approximate flamegraph stacks from cProfile's caller/callee table.
+
+    cProfile records time per caller/callee pair rather than whole stacks,
+    so the time of a function is split over the paths leading to it in
+    proportion to the time each caller spent in it. Recursion is cut off,
+    and paths worth less than min_seconds are dropped.
+
+    Returns:
+        Microseconds of own time per ';'-joined stack, outermost frame first,
+        as read by flamegraph.pl and speedscope
+    """
+    entries = stats.stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, caller_stats in callers.items():
+            # caller_stats is (primitive calls, calls, own time, cumulative time)
+            callees[caller][func] = caller_stats[3]
+
+    stacks = defaultdict(float)
+
+    def walk(func, path, labels, share):
+        own, cumulative = entries[func][2], entries[func][3]
+        labels = labels + (_frame_label(func),)
+        if own * share > 0:
+            stacks[';'.join(labels)] += own * share
+        if len(labels) >= max_depth:
+            return
+        for callee, edge_seconds in callees[func].items():
+            callee_cumulative = entries[callee][3]
+            if callee in path or not callee_cumulative or edge_seconds * share < min_seconds:
+                continue
+            walk(callee, path | {callee}, labels, share * edge_seconds / callee_cumulative)
+
+    for func, (_, _, _, cumulative, callers) in entries.items():
+        if not callers and cumulative >= min_seconds:
+            walk(func, frozenset((func,)), (), 1.0)
+
+    return {stack: round(seconds * 1e6) for stack, seconds in stacks.items() if round(seconds * 1e6)}
+
+
+class ProfileCapture:
+    """cProfile (and optionally tracemalloc) running for one request."""
+
+    def __init__(self, memory: bool = False):
+        self.id = f"{datetime.datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"
+        self.memory = memory
+        self.profiler = cProfile.Profile()
+        self.seconds = None
+        self.peak_memory = None
+        self.snapshot = None
+        self.thread = None
+        self._start = None
+        self._stop_tracing = False
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            # Leave tracing alone if someone else started it (e.g. PYTHONTRACEMALLOC)
+            tracemalloc.start()
+            self._stop_tracing = True
+        self.thread = threading.get_ident()
+        self._start = time.perf_counter()
+        self.profiler.enable()
+
+    def running_for(self) -> float:
+        """Seconds since the capture was started."""
+        return time.perf_counter() - self._start
+
+    def discard(self):
+        """Stop the allocation tracing of a capture that is given up without results."""
+        if self._stop_tracing:
+            tracemalloc.stop()
+            self._stop_tracing = False
+
+    def stop(self):
+        # Before Python 3.12 cProfile hooks only the thread that enabled it,
+        # so this has to run on that thread
+        self.profiler.disable()
+        self.seconds = time.perf_counter() - self._start
+        if self.memory:
+            _, self.peak_memory = tracemalloc.get_traced_memory()
+            self.snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            if self._stop_tracing:
+                tracemalloc.stop()
+
+
+class ProfileStore:
+    """Profiles of single requests, kept in a bounded directory.
+
+    Only one request is profiled at a time: cProfile and tracemalloc hook
+    the whole interpreter, so overlapping captures would disturb each other
+    (and on Python 3.12+ a second cProfile cannot be enabled at all).
+    Requests asking for a profile while one is running are served normally.
+    A capture still running after timeout seconds (a response the server
+    never finished sending) is given up, so it cannot block profiling for
+    good; its profiler is switched off by the thread that started it, the
+    next time that thread serves a request.
+    Each capture is stored as a pstats dump (.prof), folded stacks for
+    flamegraphs (.folded) and a JSON summary; only the newest max_captures
+    are kept.
+    """
+
+    def __init__(self, folder: str = None, max_captures: int = None, timeout: int = None):
+        """
+        Initialize the store.
+
+        Args:
+            folder: Directory for the captures (defaults to Config.PROFILE_FOLDER)
+            max_captures: Captures to keep (defaults to Config.PROFILE_MAX_CAPTURES)
+            timeout: Seconds after which a running capture is given up
+                (defaults to Config.PROFILE_TIMEOUT)
+        """
+        self.folder = folder or Config.PROFILE_FOLDER
+        self.max_captures = max_captures or Config.PROFILE_MAX_CAPTURES
+        self.timeout = timeout or Config.PROFILE_TIMEOUT
+        self._busy = threading.Lock()
+        # The capture holding _busy, and given-up captures by the thread that still has to disable them
+        self._current = None
+        self._abandoned = {}
+        self._lock = threading.Lock()
+
+    def begin(self, memory: bool = False) -> Optional[ProfileCapture]:
+        """
+        Start profiling the calling thread.
+
+        Returns:
+            The running capture, or None if another capture is in progress
+        """
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                current = self._current
+            if current is None or current.running_for() < self.timeout:
+                return None
+            print(f"Profile {current.id} did not finish within {self.timeout} s, giving it up")
+            self._abandon(current)
+            if not self._busy.acquire(blocking=False):
+                return None
+        capture = ProfileCapture(memory)
+        try:
+            capture.start()
+        except Exception:
+            self._busy.release()
+            raise
+        with self._lock:
+            self._current = capture
+        return capture
+
+    def _abandon(self, capture: ProfileCapture):
+        with self._lock:
+            if self._current is not capture:
+                return
+            self._current = None
+            if sys.version_info < (3, 12):
+                self._abandoned[capture.thread] = capture
+        if sys.version_info >= (3, 12):
+            # cProfile uses sys.monitoring, which any thread can switch off
+            capture.profiler.disable()
+        capture.discard()
+        self._busy.release()
+
+    def release_abandoned(self):
+        """Switch off the profiler of a given-up capture started on the calling thread, if any."""
+        if not self._abandoned:
+            return
+        with self._lock:
+            capture = self._abandoned.pop(threading.get_ident(), None)
+        if capture is not None:
+            capture.profiler.disable()
+
+    def finish(self, capture: ProfileCapture, info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Stop a capture and write it to the store.
+
+        Must be called on the thread that started the capture; called on
+        another thread, the capture is given up instead.
+
+        Args:
+            capture: Capture returned by begin
+            info: Request details stored in the summary (method, path, status, ...)
+
+        Returns:
+            The summary of the capture, or None if it was given up or could not be written
+        """
+        if threading.get_ident() != capture.thread:
+            self._abandon(capture)
+            return None
+        with self._lock:
+            owned = self._current is capture
+            if owned:
+                self._current = None
+            else:
+                self._abandoned.pop(capture.thread, None)
+        if not owned:
+            # Given up after the timeout; only the profiler is left to switch off
+            capture.profiler.disable()
+            return None
+        try:
+            capture.stop()
+        finally:
+            self._busy.release()
+
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            base = os.path.join(self.folder, capture.id)
+            stats = pstats.Stats(capture.profiler)
+            stats.dump_stats(base + '.prof')
+            with open(base + '.folded', 'w', encoding='utf-8') as f:
+                for stack, microseconds in sorted(collapsed_stacks(stats).items()):
+                    f.write(f"{stack} {microseconds}\n")
+            summary = self._summarize(capture, stats, info)
+            with open(base + '.json', 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error saving profile {capture.id}: {e}")
+            return None
+
+        self._prune()
+        return summary
+
+    def _summarize(self, capture: ProfileCapture, stats: pstats.Stats, info: Dict[str, Any]) -> Dict[str, Any]:
+        by_cumulative = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        summary = dict(info,
+                       id=capture.id,
+                       created=datetime.datetime.now().isoformat(timespec='seconds'),
+                       seconds=round(capture.seconds, 6),
+                       memory=capture.memory,
+                       functions=[{'function': _frame_label(func), 'calls': calls,
+                                   'own': round(own, 6), 'cumulative': round(cumulative, 6)}
+                                  for func, (_, calls, own, cumulative, _) in by_cumulative[:SUMMARY_FUNCTIONS]])
+        if capture.snapshot is not None:
+            summary['peak_memory'] = capture.peak_memory
+            summary['allocations'] = [{'location': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+                                      for stat in capture.snapshot.statistics('lineno')[:SUMMARY_ALLOCATIONS]]
+        return summary
+
+    def _capture_ids(self) -> List[str]:
+        """Ids of the stored captures, oldest first (ids start with their timestamp)."""
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith('.json') and _CAPTURE_ID.match(name[:-5]))
+
+    def _prune(self):
+        ids = self._capture_ids()
+        for capture_id in ids[:max(0, len(ids) - self.max_captures)]:
+            for extension in CAPTURE_FILES + ('json',):
+                try:
+                    os.remove(os.path.join(self.folder, f"{capture_id}.{extension}"))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Error removing profile {capture_id}: {e}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return the summaries of the stored captures, newest first."""
+        summaries = []
+        for capture_id in reversed(self._capture_ids()):
+            try:
+                with open(os.path.join(self.folder, f"{capture_id}.json"), 'r', encoding='utf-8') as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                # Pruned or still being written by another process
+                continue
+        return summaries
+
+    def file_path(self, capture_id: str, kind: str) -> Optional[str]:
+        """Return the path of a stored capture file, or None if there is none."""
+        if kind not in CAPTURE_FILES or not _CAPTURE_ID.match(capture_id):
+            return None
+        path = os.path.join(self.folder, f"{capture_id}.{kind}")
+        return path if os.path.isfile(path) else None
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,414 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Optional, Callable, Tuple
+import requests
+from .config import Config
+from .lmstudio_tools import LMStudioToolsClient, get_session
+from .metrics import llm_request_seconds, upstream_errors
+
+# Weight of the newest call in the moving average of a provider's latency
+LATENCY_SMOOTHING = 0.3
+
+# Latency charged for a failed call, so failing providers sink in the order
+FAILURE_PENALTY = 30.0  # seconds
+
+
+class ProviderError(Exception):
+    """Raised when a provider call fails or no provider gave a valid answer."""
+
+    def __init__(self, message: str, responses: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        # Provider name -> normalized reply or error message, for fallbacks
+        self.responses = responses or {}
+
+
+class Provider:
+    """A chat model backend with a normalized request and reply format.
+
+    Replies are dicts with 'content' (text or None) and 'tool_calls' (a list
+    of {'name': ..., 'arguments': JSON string}), whatever the wire format of
+    the backend.
+    """
+
+    name = None
+
+    def __init__(self, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        """
+        Initialize the provider.
+
+        Args:
+            model: The model to use
+            api_key: API key, if the backend needs one
+            base_url: Base URL of the API (defaults to the one in Config.AI_MODELS)
+        """
+        self.model = model
+        self.api_key = api_key
+        self.base_url = (base_url or Config.AI_MODELS[self.name].get('default_base_url', '')).rstrip('/')
+        self.session = get_session(self.base_url)
+
+    def chat(self, messages: List[Dict[str, str]], tools: Optional[List[Dict[str, Any]]] = None,
+             temperature: float = 0.7, max_tokens: int = 1024) -> Dict[str, Any]:
+        """
+        Send a chat request.
+
+        Args:
+            messages: OpenAI-style messages with role and content
+            tools: Optional OpenAI-style function tools
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+
+        Returns:
+            The normalized reply
+
+        Raises:
+            ProviderError: If the request fails
+        """
+        url, payload, headers = self._build_request(messages, tools, temperature, max_tokens)
+        return self._parse_reply(self._post(url, payload, headers))
+
+    async def chat_async(self, messages: List[Dict[str, str]], tools: Optional[List[Dict[str, Any]]] = None,
+                         temperature: float = 0.7, max_tokens: int = 1024) -> Dict[str, Any]:
+        """Asyncio variant of chat; cancelling it aborts the HTTP request."""
+        url, payload, headers = self._build_request(messages, tools, temperature, max_tokens)
+        return self._parse_reply(await self._post_async(url, payload, headers))
+
+    def _build_request(self, messages, tools, temperature, max_tokens) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+        """Return the URL, JSON payload and headers of a chat request."""
+        raise NotImplementedError
+
+    def _parse_reply(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn the backend's JSON reply into the normalized reply."""
+        raise NotImplementedError
+
+    def _post(self, url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            response = self.session.post(url, json=payload, headers=headers,
+                                         timeout=(Config.LLM_CONNECT_TIMEOUT, Config.LLM_READ_TIMEOUT))
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._record_call(start, 'error')
+            raise ProviderError(f"{self.name}: {e}")
+        self._record_call(start, 'ok')
+        return data
+
+    async def _post_async(self, url: str, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        # Imported here so the WSGI app does not need httpx
+        import httpx
+        from .lmstudio_async import get_async_client
+        start = time.perf_counter()
+        try:
+            response = await get_async_client(self.base_url).post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self._record_call(start, 'error')
+            raise ProviderError(f"{self.name}: {str(e) or type(e).__name__}")
+        self._record_call(start, 'ok')
+        return data
+
+    def _record_call(self, start: float, outcome: str):
+        # Calls cancelled because another provider answered first are not recorded
+        llm_request_seconds.observe(time.perf_counter() - start, upstream=self.name, outcome=outcome)
+        if outcome == 'error':
+            upstream_errors.inc(upstream=self.name)
+
+
+class OpenAIProvider(Provider):
+    """OpenAI chat completions API, also spoken by LM Studio."""
+
+    name = 'openai'
+
+    def chat(self, messages, tools=None, temperature=0.7, max_tokens=1024):
+        client = LMStudioToolsClient(base_url=self.base_url, api_key=self.api_key, upstream=self.name)
+        return self._parse_completion(client.chat_completion(messages=messages, model=self.model, tools=tools,
+                                                             temperature=temperature, max_tokens=max_tokens))
+
+    async def chat_async(self, messages, tools=None, temperature=0.7, max_tokens=1024):
+        from .lmstudio_async import AsyncLMStudioToolsClient
+        client = AsyncLMStudioToolsClient(base_url=self.base_url, api_key=self.api_key, upstream=self.name)
+        return self._parse_completion(await client.chat_completion(messages=messages, model=self.model, tools=tools,
+                                                                   temperature=temperature, max_tokens=max_tokens))
+
+    def _parse_completion(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        if "error" in response:
+            raise ProviderError(f"{self.name}: {response['message']}")
+        try:
+            message = response["choices"][0]["message"]
+        except (KeyError, IndexError, TypeError):
+            raise ProviderError(f"{self.name}: unexpected response")
+        return {
+            'content': message.get('content'),
+            'tool_calls': [{'name': call['function']['name'], 'arguments': call['function'].get('arguments') or '{}'}
+                           for call in message.get('tool_calls') or []]
+        }
+
+
+class LMStudioProvider(OpenAIProvider):
+    """Local models served by LM Studio."""
+
+    name = 'lmstudio'
+
+
+class AnthropicProvider(Provider):
+    """Anthropic messages API."""
+
+    name = 'anthropic'
+    api_version = '2023-06-01'
+
+    def _build_request(self, messages, tools, temperature, max_tokens):
+        # System prompts are a separate field, not a message role
+        system = "\n\n".join(m['content'] for m in messages if m['role'] == 'system')
+        payload = {
+            'model': self.model,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'messages': [{'role': m['role'], 'content': m['content']} for m in messages if m['role'] != 'system']
+        }
+        if system:
+            payload['system'] = system
+        if tools:
+            payload['tools'] = [{'name': t['function']['name'],
+                                 'description': t['function'].get('description', ''),
+                                 'input_schema': t['function']['parameters']} for t in tools]
+        headers = {'x-api-key': self.api_key or '', 'anthropic-version': self.api_version}
+        return f"{self.base_url}/messages", payload, headers
+
+    def _parse_reply(self, data):
+        text = [block.get('text', '') for block in data.get('content', []) if block.get('type') == 'text']
+        return {
+            'content': ''.join(text) or None,
+            'tool_calls': [{'name': block['name'], 'arguments': json.dumps(block.get('input', {}))}
+                           for block in data.get('content', []) if block.get('type') == 'tool_use']
+        }
+
+
+class GoogleProvider(Provider):
+    """Google Gemini generateContent API."""
+
+    name = 'google'
+
+    def _build_request(self, messages, tools, temperature, max_tokens):
+        system = "\n\n".join(m['content'] for m in messages if m['role'] == 'system')
+        payload = {
+            'contents': [{'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [{'text': m['content']}]}
+                         for m in messages if m['role'] != 'system'],
+            'generationConfig': {'temperature': temperature, 'maxOutputTokens': max_tokens}
+        }
+        if system:
+            payload['systemInstruction'] = {'parts': [{'text': system}]}
+        if tools:
+            payload['tools'] = [{'functionDeclarations': [
+                {'name': t['function']['name'], 'description': t['function'].get('description', ''),
+                 'parameters': t['function']['parameters']} for t in tools]}]
+        headers = {'x-goog-api-key': self.api_key or ''}
+        return f"{self.base_url}/models/{self.model}:generateContent", payload, headers
+
+    def _parse_reply(self, data):
+        try:
+            parts = data['candidates'][0]['content']['parts']
+        except (KeyError, IndexError, TypeError):
+            raise ProviderError(f"{self.name}: unexpected response")
+        text = [part['text'] for part in parts if 'text' in part]
+        return {
+            'content': ''.join(text) or None,
+            'tool_calls': [{'name': part['functionCall']['name'],
+                            'arguments': json.dumps(part['functionCall'].get('args', {}))}
+                           for part in parts if 'functionCall' in part]
+        }
+
+
+PROVIDER_CLASSES = {cls.name: cls for cls in (OpenAIProvider, AnthropicProvider, GoogleProvider, LMStudioProvider)}
+
+
+def get_provider(name: str, model: Optional[str] = None, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None) -> Provider:
+    """
+    Create a provider from its name, filling unset options from the saved settings.
+
+    Raises:
+        ValueError: If the provider is unknown
+    """
+    if name not in PROVIDER_CLASSES:
+        raise ValueError(f"Unknown provider: {name}")
+    return PROVIDER_CLASSES[name](model=model or Config.get_model(name),
+                                  api_key=api_key or Config.get_api_key(name),
+                                  base_url=base_url or Config.get_base_url(name))
+
+
+def configured_providers() -> List[Provider]:
+    """Return a provider for every backend that has its API key set."""
+    return [get_provider(name) for name in Config.AI_MODELS if name in PROVIDER_CLASSES and Config.is_api_key_set(name)]
+
+
+class LatencyTracker:
+    """Moving average of each provider's latency, used to order providers."""
+
+    def __init__(self):
+        self._latency = {}
+        self._calls = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        """Record the duration of a call; failures count as FAILURE_PENALTY."""
+        sample = seconds if ok else max(seconds, FAILURE_PENALTY)
+        with self._lock:
+            previous = self._latency.get(name)
+            self._latency[name] = sample if previous is None else (
+                LATENCY_SMOOTHING * sample + (1 - LATENCY_SMOOTHING) * previous)
+            self._calls[name] = self._calls.get(name, 0) + 1
+            if not ok:
+                self._failures[name] = self._failures.get(name, 0) + 1
+
+    def order(self, providers: List[Provider]) -> List[Provider]:
+        """Sort providers fastest first; providers without samples go first so they get measured."""
+        with self._lock:
+            return sorted(providers, key=lambda p: self._latency.get(p.name, 0.0))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the average latency, call and failure count per provider."""
+        with self._lock:
+            return {name: {'latency': round(latency, 3), 'calls': self._calls.get(name, 0),
+                           'failures': self._failures.get(name, 0)}
+                    for name, latency in self._latency.items()}
+
+
+latency_tracker = LatencyTracker()
+
+
+class ProviderRouter:
+    """Query several providers concurrently and keep the first valid answer.
+
+    The fastest providers by recent latency are asked first, fanout at a
+    time; as soon as one reply passes validation the others are cancelled
+    (calls not yet started never run, running ones are abandoned and end at
+    their timeout). If all of them fail, the next providers are tried.
+    """
+
+    def __init__(self, providers: List[Provider], fanout: int = None, tracker: LatencyTracker = None):
+        """
+        Initialize the router.
+
+        Args:
+            providers: Providers to choose from
+            fanout: Number of providers queried at the same time
+                (defaults to Config.PROVIDER_FANOUT)
+            tracker: Latency statistics (defaults to the shared latency_tracker)
+        """
+        self.providers = providers
+        self.fanout = max(1, fanout or Config.PROVIDER_FANOUT)
+        self.tracker = tracker or latency_tracker
+
+    def _call(self, provider: Provider, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            reply = provider.chat(**kwargs)
+        except Exception:
+            self.tracker.record(provider.name, time.perf_counter() - start, ok=False)
+            raise
+        self.tracker.record(provider.name, time.perf_counter() - start)
+        return reply
+
+    async def _call_async(self, provider: Provider, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            reply = await provider.chat_async(**kwargs)
+        except Exception:
+            # Cancellation is not an Exception, so abandoned calls are not counted as failures
+            self.tracker.record(provider.name, time.perf_counter() - start, ok=False)
+            raise
+        self.tracker.record(provider.name, time.perf_counter() - start)
+        return reply
+
+    def first_valid(self, messages: List[Dict[str, str]], validate: Callable[[Dict[str, Any]], Any],
+                    **kwargs) -> Tuple[Any, str]:
+        """
+        Return the first reply that passes validation.
+
+        Args:
+            messages: OpenAI-style messages with role and content
+            validate: Turns a normalized reply into the structured result, or
+                returns None if the reply is not usable
+            **kwargs: tools, temperature and max_tokens for Provider.chat
+
+        Returns:
+            A tuple of the structured result and the name of the provider
+
+        Raises:
+            ProviderError: If no provider gave a valid reply; its responses
+                attribute holds what each provider returned
+        """
+        if not self.providers:
+            raise ProviderError("No providers configured")
+        kwargs['messages'] = messages
+        queue = self.tracker.order(self.providers)
+        responses = {}
+        executor = ThreadPoolExecutor(max_workers=min(self.fanout, len(queue)), thread_name_prefix='provider')
+        pending = {}
+        try:
+            while queue or pending:
+                while queue and len(pending) < self.fanout:
+                    provider = queue.pop(0)
+                    pending[executor.submit(self._call, provider, kwargs)] = provider
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = pending.pop(future)
+                    try:
+                        reply = future.result()
+                    except Exception as e:
+                        responses[provider.name] = str(e)
+                        continue
+                    responses[provider.name] = reply
+                    result = validate(reply)
+                    if result is not None:
+                        return result, provider.name
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        raise ProviderError("No provider returned a valid answer", responses)
+
+    async def first_valid_async(self, messages: List[Dict[str, str]], validate: Callable[[Dict[str, Any]], Any],
+                                **kwargs) -> Tuple[Any, str]:
+        """
+        Asyncio variant of first_valid.
+
+        The losing calls are cancelled as tasks, which closes their
+        connections instead of leaving them to run until their timeout.
+        """
+        if not self.providers:
+            raise ProviderError("No providers configured")
+        kwargs['messages'] = messages
+        queue = self.tracker.order(self.providers)
+        responses = {}
+        pending = {}
+        try:
+            while queue or pending:
+                while queue and len(pending) < self.fanout:
+                    provider = queue.pop(0)
+                    pending[asyncio.ensure_future(self._call_async(provider, kwargs))] = provider
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        reply = task.result()
+                    except Exception as e:
+                        responses[provider.name] = str(e)
+                        continue
+                    responses[provider.name] = reply
+                    result = validate(reply)
+                    if result is not None:
+                        return result, provider.name
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise ProviderError("No provider returned a valid answer", responses)
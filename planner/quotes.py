@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+import requests
+from .config import Config
+from .metrics import upstream_errors
+
+# Used when the pool is empty and the quote API has not been reachable
+DEFAULT_QUOTES = [
+    '"The future depends on what you do today." - Mahatma Gandhi',
+    '"The only way to do great work is to love what you do." - Steve Jobs',
+    '"Believe you can and you\'re halfway there." - Theodore Roosevelt'
+]
+
+
+class QuoteProvider:
+    """Pool of prefetched quotes refilled by a background thread."""
+
+    def __init__(self, api_url: str = None, pool_file: str = None, pool_size: int = None,
+                 timeout: float = None, refill_interval: float = None, retry_delay: float = None):
+        """
+        Initialize the provider and load any quotes saved by a previous run.
+
+        Args:
+            api_url: Quote API returning {"content": ..., "author": ...}
+            pool_file: JSON file the pool is persisted to
+            pool_size: Number of quotes to keep prefetched
+            timeout: Connect and read timeout of a single API call, in seconds
+            refill_interval: Seconds between refill attempts when nothing wakes the thread
+            retry_delay: Seconds to wait after a failed refill
+        """
+        self.api_url = api_url or Config.QUOTABLE_API_URL
+        self.pool_file = pool_file or Config.QUOTE_POOL_FILE
+        self.pool_size = pool_size or Config.QUOTE_POOL_SIZE
+        self.timeout = timeout or Config.QUOTE_FETCH_TIMEOUT
+        self.refill_interval = refill_interval or Config.QUOTE_REFILL_INTERVAL
+        self.retry_delay = retry_delay or Config.QUOTE_RETRY_DELAY
+        self._pool = deque(self._load(), maxlen=self.pool_size)
+        self._dirty = False
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _load(self) -> List[str]:
+        try:
+            with open(self.pool_file, 'r', encoding='utf-8') as f:
+                quotes = json.load(f)
+            return [quote for quote in quotes if isinstance(quote, str)]
+        except (OSError, ValueError):
+            return []
+
+    def _save(self):
+        # Write to a temp file of its own and rename, so neither a crash nor
+        # another process saving at the same time leaves a truncated pool
+        directory = os.path.dirname(self.pool_file) or '.'
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.quotes-', suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(list(self._pool), f, ensure_ascii=False)
+            os.replace(tmp_path, self.pool_file)
+        except OSError as e:
+            print(f"Error saving quote pool: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _fetch(self) -> Optional[str]:
+        response = requests.get(self.api_url, timeout=self.timeout)
+        if response.status_code == 200:
+            data = response.json()
+            return f'"{data["content"]}" - {data["author"]}'
+        return None
+
+    def refill(self) -> int:
+        """
+        Top the pool up from the API, stopping at the first failure.
+
+        Returns:
+            Number of quotes added
+        """
+        added = 0
+        while len(self._pool) < self.pool_size:
+            try:
+                quote = self._fetch()
+            except Exception as e:
+                print(f"Error fetching quote: {e}")
+                quote = None
+            if not quote:
+                upstream_errors.inc(upstream='quotes')
+                break
+            self._pool.append(quote)
+            added += 1
+        # Persist both new quotes and the ones handed out since the last save
+        if added or self._dirty:
+            self._dirty = False
+            self._save()
+        return added
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            self.refill()
+            if len(self._pool) < self.pool_size:
+                # The API is failing; back off rather than retrying on every request
+                time.sleep(self.retry_delay)
+            self._wake.wait(self.refill_interval)
+
+    def start(self):
+        """Start the background refill thread if it is not running yet."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='quote-refill', daemon=True)
+                self._thread.start()
+
+    def get(self) -> str:
+        """Take a quote from the pool without touching the network."""
+        # Started lazily so forked render workers do not inherit a dead thread
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            quote = self._pool.popleft()
+            self._dirty = True
+        except IndexError:
+            quote = random.choice(DEFAULT_QUOTES)
+        self._wake.set()
+        return quote
+
+
+quote_provider = QuoteProvider()
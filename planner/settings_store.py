@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Reserved key holding the write counter inside the JSON file
+VERSION_KEY = '_version'
+
+
+class VersionConflictError(Exception):
+    """Raised when settings changed since the version the caller read."""
+
+    def __init__(self, expected: int, actual: int):
+        super().__init__(f"Settings were modified (expected version {expected}, found {actual})")
+        self.expected = expected
+        self.actual = actual
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive cross-process lock on path for the duration of the block."""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class JsonSettingsStore:
+    """Thread-safe, cached view of a JSON settings file such as api_keys.json.
+
+    The file is parsed once and served from memory until its modification
+    time or size changes, or until invalidate() is called. Writes take a
+    cross-process lock, bump a version counter and replace the file
+    atomically, so concurrent workers never lose updates and readers never
+    see a partially written file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the store.
+
+        Args:
+            path: Location of the JSON file
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.version = 0
+        self._data = {}
+        self._signature = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # Every write is an os.replace, which gives the file a new inode, so a
+        # replace is noticed even when timestamps are too coarse to change
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self):
+        """Return (settings, version) as stored on disk."""
+        if not os.path.exists(self.path):
+            return {}, 0
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            return {}, 0
+        if not isinstance(data, dict):
+            return {}, 0
+        version = data.pop(VERSION_KEY, 0)
+        return data, version
+
+    def _write(self, data: Dict[str, Any], version: int):
+        # Temp file in the same directory so the rename is atomic
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.settings-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(data, **{VERSION_KEY: version}), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the current settings, reloading the file only if it changed.
+
+        The returned dict is shared between callers and must not be modified;
+        use get_all() for a private copy.
+        """
+        signature = self._stat_signature()
+        with self._lock:
+            if not self._loaded or signature != self._signature:
+                self._data, self.version = self._read()
+                self._signature = signature
+                self._loaded = True
+            return self._data
+
+    def get_all(self) -> Dict[str, Any]:
+        """Return a copy of all settings that the caller may modify."""
+        return dict(self.snapshot())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a single setting."""
+        return self.snapshot().get(key, default)
+
+    def get_version(self) -> int:
+        """Return the version of the current settings."""
+        with self._lock:
+            self.snapshot()
+            return self.version
+
+    def invalidate(self):
+        """Force the next read to parse the file again."""
+        with self._lock:
+            self._loaded = False
+
+    def update(self, values: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        """
+        Merge values into the stored settings and write the file.
+
+        Args:
+            values: Settings to add or replace
+            expected_version: If given, only write when the stored version
+                still matches (optimistic concurrency)
+
+        Returns:
+            The new version
+
+        Raises:
+            VersionConflictError: If expected_version is stale
+        """
+        with self._lock, file_lock(self.lock_path):
+            # Re-read under the lock so updates from other processes are kept
+            data, version = self._read()
+            if expected_version is not None and expected_version != version:
+                raise VersionConflictError(expected_version, version)
+            data.update(values)
+            self._write(data, version + 1)
+            self._data, self.version = data, version + 1
+            self._signature = self._stat_signature()
+            self._loaded = True
+            return self.version
+
+
+class SqliteSettingsStore:
+    """Settings store backed by SQLite, for several workers sharing settings.
+
+    Reads are served from memory and reloaded only when the version row
+    changes; writes run in an IMMEDIATE transaction, which serializes
+    writers across processes.
+    """
+
+    def __init__(self, path: str, import_from: Optional[str] = None):
+        """
+        Initialize the store, creating the database if needed.
+
+        Args:
+            path: Location of the SQLite database
+            import_from: JSON settings file copied in when the database is empty
+        """
+        self.path = path
+        self.version = 0
+        self._data = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+
+        if import_from and self.get_version() == 0 and os.path.exists(import_from):
+            data, _ = JsonSettingsStore(import_from)._read()
+            if data:
+                self.update(data, expected_version=0)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections are not shareable by default
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly in update()
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _stored_version(self, conn) -> int:
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current settings, reloading only after a write."""
+        conn = self._connect()
+        version = self._stored_version(conn)
+        with self._lock:
+            if not self._loaded or version != self.version:
+                rows = conn.execute("SELECT key, value FROM settings").fetchall()
+                self._data = {key: json.loads(value) for key, value in rows}
+                self.version = version
+                self._loaded = True
+            return self._data
+
+    def get_all(self) -> Dict[str, Any]:
+        """Return a copy of all settings that the caller may modify."""
+        return dict(self.snapshot())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a single setting."""
+        return self.snapshot().get(key, default)
+
+    def get_version(self) -> int:
+        """Return the version of the current settings."""
+        return self._stored_version(self._connect())
+
+    def invalidate(self):
+        """Force the next read to reload from the database."""
+        with self._lock:
+            self._loaded = False
+
+    def update(self, values: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        """
+        Merge values into the stored settings.
+
+        Args:
+            values: Settings to add or replace
+            expected_version: If given, only write when the stored version
+                still matches (optimistic concurrency)
+
+        Returns:
+            The new version
+
+        Raises:
+            VersionConflictError: If expected_version is stale
+        """
+        conn = self._connect()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._stored_version(conn)
+                if expected_version is not None and expected_version != version:
+                    raise VersionConflictError(expected_version, version)
+                conn.executemany(
+                    "INSERT INTO settings (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    [(key, json.dumps(value)) for key, value in values.items()]
+                )
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version + 1,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._loaded = False
+            return version + 1
@@ -0,0 +1,109 @@
+import io
+import multiprocessing
+from typing import Dict, Any, List, Optional, Tuple
+from .config import Config
+from .metrics import render_stage_seconds, worker_samples, merge_worker_samples
+from .pools import WorkerPool
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pragma: no cover - merging needs the optional pypdf package
+    PdfReader = PdfWriter = None
+
+# Chunk render processes shared by all long planners
+_pool = WorkerPool(Config.PLANNER_SHARD_WORKERS)
+
+
+def _render_chunk(cover: Optional[Dict[str, Any]], style: str, components: Dict[str, bool],
+                  habits: Optional[List[str]], days: list, renderer: str) -> Tuple[bytes, Dict[str, Any]]:
+    """Render one chunk of a planner in a worker process and return the PDF bytes and the render metrics."""
+    from .generator import render_planner_pages
+    buffer = io.BytesIO()
+    render_planner_pages(buffer, cover, style, components, habits, days, renderer)
+    return buffer.getvalue(), worker_samples()
+
+
+def split_days(days: list, chunk_days: int) -> List[list]:
+    """Split a list of dates into consecutive chunks of at most chunk_days."""
+    return [days[i:i + chunk_days] for i in range(0, len(days), chunk_days)]
+
+
+def merge_pdfs(parts: List[bytes], output):
+    """
+    Concatenate partial PDFs into one document.
+
+    Identical objects (fonts, the day page forms of the canvas renderer) are
+    stored once in the merged file.
+
+    Args:
+        parts: PDF documents in page order
+        output: File path or writable file object
+
+    Returns:
+        The number of pages of the merged document
+    """
+    writer = PdfWriter()
+    for data in parts:
+        writer.append(PdfReader(io.BytesIO(data)))
+    writer.compress_identical_objects(remove_orphans=True)
+    if hasattr(output, 'write'):
+        writer.write(output)
+    else:
+        with open(output, 'wb') as f:
+            writer.write(f)
+    return len(writer.pages)
+
+
+def render_planner_sharded(output, cover: Dict[str, Any], style: str, components: Dict[str, bool],
+                           habits: Optional[List[str]], days: list, renderer: str,
+                           chunk_days: int = None, workers: int = None):
+    """
+    Render a long planner as chunks in separate processes and merge them.
+
+    Falls back to rendering in this process when pypdf is not installed or
+    when called from a daemonic worker (which may not start processes).
+
+    Args:
+        output: File path or writable file object
+        cover: Cover page fields for generate_cover_page
+        style: Style name from Config.STYLES
+        components: Enabled planner components
+        habits: Habits for the habit tracker
+        days: Dates to generate day pages for
+        renderer: 'platypus' or 'canvas'
+        chunk_days: Days per chunk (defaults to Config.PLANNER_SHARD_DAYS)
+        workers: Number of processes; other than Config.PLANNER_SHARD_WORKERS,
+            a pool of that size is started for this planner only
+
+    Returns:
+        The number of pages rendered
+    """
+    from .generator import render_planner_pages
+
+    chunks = split_days(days, chunk_days or Config.PLANNER_SHARD_DAYS)
+    pool = _pool if workers in (None, _pool.max_workers) else WorkerPool(workers)
+    if PdfWriter is None or min(pool.max_workers, len(chunks)) < 2 or multiprocessing.current_process().daemon:
+        return render_planner_pages(output, cover, style, components, habits, days, renderer)
+
+    # Only the first chunk carries the cover page
+    covers = [cover] + [None] * (len(chunks) - 1)
+    # The chunks are timed as a whole here; the stages inside them come back
+    # from the workers with each part
+    with render_stage_seconds.time(stage='shards'):
+        futures = [pool.submit(_render_chunk, chunk_cover, style, components, habits, chunk, renderer)
+                   for chunk_cover, chunk in zip(covers, chunks)]
+        try:
+            results = [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+            if pool is not _pool:
+                pool.shutdown()
+
+    parts = []
+    for data, samples in results:
+        merge_worker_samples(samples)
+        parts.append(data)
+
+    with render_stage_seconds.time(stage='merge'):
+        return merge_pdfs(parts, output)
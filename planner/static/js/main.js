@@ -94,6 +94,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 payload.model = model;
             }
             
+            // Version of the settings this page was rendered with, so a save
+            // made elsewhere in the meantime is not silently overwritten
+            const settingsCard = document.querySelector('.settings-card');
+            if (settingsCard && settingsCard.dataset.settingsVersion) {
+                payload.version = parseInt(settingsCard.dataset.settingsVersion, 10);
+            }
+            
             // Save API key
             fetch('/api/settings/save-key', {
                 method: 'POST',
@@ -103,12 +110,18 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify(payload)
             })
             .then(response => {
+                if (response.status === 409) {
+                    throw new Error('Settings were changed elsewhere. Reload the page and try again.');
+                }
                 if (!response.ok) {
                     throw new Error(`HTTP error! Status: ${response.status}`);
                 }
                 return response.json();
             })
             .then(data => {
+                if (settingsCard && data.version !== undefined) {
+                    settingsCard.dataset.settingsVersion = data.version;
+                }
                 showFormSuccess(statusElement, data.message || 'API key saved successfully');
                 
                 // Reset form state
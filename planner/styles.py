@@ -0,0 +1,61 @@
+from types import MappingProxyType
+from typing import Dict, Any, Mapping
+from reportlab.lib.styles import ParagraphStyle
+from .config import Config
+
+
+def build_planner_styles(style_settings: Dict[str, Any]) -> Mapping[str, ParagraphStyle]:
+    """
+    Build the Planner* paragraph styles for one entry of Config.STYLES.
+
+    Args:
+        style_settings: Font and colour settings of a planner style
+
+    Returns:
+        A read-only mapping from style name to ParagraphStyle
+    """
+    styles = {
+        'PlannerTitle': ParagraphStyle(
+            name='PlannerTitle',
+            fontName=style_settings['font'],
+            fontSize=24,
+            textColor=style_settings['primary_color'],
+            alignment=1,  # Center
+            spaceAfter=12
+        ),
+        'PlannerSubtitle': ParagraphStyle(
+            name='PlannerSubtitle',
+            fontName=style_settings['font'],
+            fontSize=16,
+            textColor=style_settings['secondary_color'],
+            alignment=1,  # Center
+            spaceAfter=12
+        ),
+        'PlannerHeading': ParagraphStyle(
+            name='PlannerHeading',
+            fontName=style_settings['font'],
+            fontSize=14,
+            textColor=style_settings['primary_color'],
+            spaceBefore=12,
+            spaceAfter=6
+        ),
+        'PlannerNormal': ParagraphStyle(
+            name='PlannerNormal',
+            fontName=style_settings['font'],
+            fontSize=10,
+            textColor=style_settings['primary_color']
+        )
+    }
+    return MappingProxyType(styles)
+
+
+# Built once at import for every configured style and shared by all requests.
+# Page builders only read from it; ParagraphStyle objects must not be modified.
+STYLE_REGISTRY = MappingProxyType({
+    name: build_planner_styles(settings) for name, settings in Config.STYLES.items()
+})
+
+
+def get_planner_styles(style: str) -> Mapping[str, ParagraphStyle]:
+    """Return the shared paragraph styles for a style name, falling back to minimalist."""
+    return STYLE_REGISTRY.get(style, STYLE_REGISTRY['minimalist'])
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+from .config import Config
+from .lru import LRUCache
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def make_suggestion_key(provider: str, model: Optional[str], prompt: str) -> str:
+    """Hash (provider, model, prompt) with the prompt lowercased and its whitespace collapsed."""
+    normalized = _WHITESPACE.sub(' ', prompt.lower()).strip()
+    payload = json.dumps([provider, model, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SuggestionCache:
+    """Parsed /api/ai-suggestions results, reused for repeated prompts.
+
+    Results younger than ttl are returned as they are. With stale_ttl set,
+    results up to ttl + stale_ttl old are still returned at once while a
+    background thread fetches a fresh copy (stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, stale_ttl: float = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Number of cached prompts (defaults to Config.SUGGESTION_CACHE_SIZE)
+            ttl: Seconds a result is fresh (defaults to Config.SUGGESTION_CACHE_TTL)
+            stale_ttl: Seconds a result may be served stale after that while
+                it is refreshed, 0 to disable (defaults to Config.SUGGESTION_CACHE_STALE_TTL)
+        """
+        self.ttl = ttl or Config.SUGGESTION_CACHE_TTL
+        self.stale_ttl = Config.SUGGESTION_CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.entries = LRUCache(max_entries or Config.SUGGESTION_CACHE_SIZE, self.ttl)
+        self._refreshing = set()
+        # Background refreshes of the async variant, referenced until they finish
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.stale_hits = 0
+
+    def get_or_fetch(self, provider: str, model: Optional[str], prompt: str,
+                     fetch: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+        """
+        Return the cached result for a prompt, fetching it on a miss.
+
+        Args:
+            provider: Provider name the result is for
+            model: Model name, or None when any model may answer
+            prompt: The user's prompt
+            fetch: Produces a fresh result; exceptions propagate on a miss
+
+        Returns:
+            A tuple of the result and 'hit', 'stale' or 'miss'
+        """
+        key = make_suggestion_key(provider, model, prompt)
+        value, status = self._lookup(key)
+        if status == 'stale':
+            self._refresh(key, fetch)
+        if value is not None:
+            return value, status
+
+        value = fetch()
+        self.entries.put(key, value)
+        return value, 'miss'
+
+    async def get_or_fetch_async(self, provider: str, model: Optional[str], prompt: str,
+                                 fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], str]:
+        """
+        Asyncio variant of get_or_fetch.
+
+        Args:
+            provider: Provider name the result is for
+            model: Model name, or None when any model may answer
+            prompt: The user's prompt
+            fetch: Coroutine function producing a fresh result; stale results
+                are refreshed in a task on the running loop that outlives the request
+
+        Returns:
+            A tuple of the result and 'hit', 'stale' or 'miss'
+        """
+        key = make_suggestion_key(provider, model, prompt)
+        value, status = self._lookup(key)
+        if status == 'stale' and self._claim(key):
+            task = asyncio.ensure_future(self._refresh_async(key, fetch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if value is not None:
+            return value, status
+
+        value = await fetch()
+        self.entries.put(key, value)
+        return value, 'miss'
+
+    def _lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Return a cached result with 'hit' or 'stale', or (None, None)."""
+        value, age = self.entries.get_with_age(key, max_age=self.ttl + self.stale_ttl)
+        if value is None:
+            return None, None
+        if age <= self.ttl:
+            return value, 'hit'
+        self.stale_hits += 1
+        return value, 'stale'
+
+    def _claim(self, key: str) -> bool:
+        """Mark a key as being refreshed; False if a refresh is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _refresh(self, key: str, fetch: Callable[[], Dict[str, Any]]):
+        """Fetch a fresh result in the background, once per key at a time."""
+        if not self._claim(key):
+            return
+
+        def run():
+            try:
+                self.entries.put(key, fetch())
+            except Exception as e:
+                # Keep serving the stale result; the next request tries again
+                print(f"Error refreshing AI suggestions: {e}")
+            finally:
+                self._release(key)
+
+        threading.Thread(target=run, name='suggestion-refresh', daemon=True).start()
+
+    async def _refresh_async(self, key: str, fetch: Callable[[], Awaitable[Dict[str, Any]]]):
+        try:
+            self.entries.put(key, await fetch())
+        except Exception as e:
+            print(f"Error refreshing AI suggestions: {e}")
+        finally:
+            self._release(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit and miss counters, including stale hits."""
+        stats = self.entries.stats()
+        stats.update(stale_hits=self.stale_hits, stale_ttl=self.stale_ttl)
+        return stats
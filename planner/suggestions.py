@@ -0,0 +1,246 @@
+import json
+import re
+from typing import Dict, List, Any, Optional
+from .config import Config
+from .providers import Provider, ProviderError, ProviderRouter, get_provider, configured_providers
+
+SUGGESTIONS_SYSTEM_MESSAGE = """You are an AI assistant that helps users create personalized planners. 
+            Your task is to suggest additional components or features that would enhance their planner.
+            Provide 3-5 specific suggestions based on the user's current planner configuration.
+            Each suggestion should have a clear title and a brief description explaining its benefits.
+            Format your response as a JSON array of objects with 'title' and 'description' fields."""
+
+def parse_suggestions_json(reply):
+    """Get the suggestions from a model reply holding a JSON array, or None if it has none."""
+    message_content = reply.get('content') or ''
+    try:
+        # Try to find JSON array in the text
+        json_match = re.search(r'\[\s*\{.*\}\s*\]', message_content, re.DOTALL)
+        
+        if json_match:
+            suggestions = json.loads(json_match.group(0))
+        else:
+            # If no JSON array found, try to parse the entire response as JSON
+            suggestions = json.loads(message_content)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    
+    # Ensure we have the expected format
+    if not isinstance(suggestions, list):
+        return None
+    formatted_suggestions = []
+    for suggestion in suggestions:
+        if isinstance(suggestion, dict) and 'title' in suggestion and 'description' in suggestion:
+            formatted_suggestions.append({
+                'title': suggestion['title'],
+                'description': suggestion['description']
+            })
+    return formatted_suggestions or None
+
+def parse_suggestions_text(message_content):
+    """Build suggestions from a free-text model reply."""
+    lines = message_content.split('\n')
+    suggestions = []
+    
+    current_title = None
+    current_description = []
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+            
+        # Check if this line looks like a title (numbered or with a special prefix)
+        if re.match(r'^(\d+[\.\):]|[\-\*]|\*\*|#)', line) or line.isupper():
+            # If we have a previous title and description, add it to suggestions
+            if current_title and current_description:
+                suggestions.append({
+                    'title': current_title,
+                    'description': ' '.join(current_description)
+                })
+                current_description = []
+            
+            # Extract the new title
+            current_title = re.sub(r'^(\d+[\.\):]|[\-\*]|\*\*|#)\s*', '', line)
+            current_title = current_title.strip('*').strip()
+        else:
+            # This is part of the description
+            if current_title:
+                current_description.append(line)
+    
+    # Add the last suggestion if there is one
+    if current_title and current_description:
+        suggestions.append({
+            'title': current_title,
+            'description': ' '.join(current_description)
+        })
+    
+    # If we couldn't parse structured suggestions, create a generic one
+    if not suggestions:
+        suggestions = [{
+            'title': 'AI Recommendation',
+            'description': message_content
+        }]
+    
+    return suggestions
+
+class SuggestionRequestError(Exception):
+    """Raised when a suggestions request names a provider that cannot be used."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        # HTTP status of the error response
+        self.status = status
+
+def select_providers(provider_name: str, model_name: Optional[str] = None) -> List[Provider]:
+    """
+    Return the providers that may answer a suggestions request.
+
+    Raises:
+        SuggestionRequestError: If the provider is unknown or has no API key
+    """
+    # 'auto' asks every configured provider at once and keeps the first good answer
+    if provider_name == 'auto':
+        return configured_providers()
+    
+    if provider_name not in Config.AI_MODELS:
+        raise SuggestionRequestError(f'Unknown provider {provider_name}', 400)
+    
+    # Check if API key is set for the provider
+    if not Config.is_api_key_set(provider_name) and provider_name != 'lmstudio':
+        raise SuggestionRequestError(f'API key not set for {provider_name}', 401)
+    
+    if model_name not in Config.AI_MODELS[provider_name].get('models', []):
+        model_name = None
+    return [get_provider(provider_name, model=model_name)]
+
+def suggestion_messages(prompt: str) -> List[Dict[str, str]]:
+    """Return the chat messages asking for suggestions."""
+    return [
+        {"role": "system", "content": SUGGESTIONS_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+def suggestions_from_text(error: ProviderError) -> Dict[str, Any]:
+    """
+    Build suggestions from the text of the first reply when none was valid JSON.
+
+    Raises:
+        ProviderError: The given error, if no provider returned any text
+    """
+    for provider, reply in error.responses.items():
+        if isinstance(reply, dict) and reply.get('content'):
+            return {'suggestions': parse_suggestions_text(reply['content']), 'provider': provider}
+    raise error
+
+def fetch_suggestions(router: ProviderRouter, prompt: str) -> Dict[str, Any]:
+    """
+    Ask the router's providers for suggestions.
+
+    Returns:
+        A dict with the 'suggestions' and the 'provider' that gave them
+
+    Raises:
+        ProviderError: If no provider returned a usable reply
+    """
+    try:
+        suggestions, provider = router.first_valid(suggestion_messages(prompt), validate=parse_suggestions_json,
+                                                   temperature=0.7, max_tokens=500)
+        return {'suggestions': suggestions, 'provider': provider}
+    except ProviderError as e:
+        return suggestions_from_text(e)
+
+async def fetch_suggestions_async(router: ProviderRouter, prompt: str) -> Dict[str, Any]:
+    """Asyncio variant of fetch_suggestions."""
+    try:
+        suggestions, provider = await router.first_valid_async(suggestion_messages(prompt),
+                                                               validate=parse_suggestions_json,
+                                                               temperature=0.7, max_tokens=500)
+        return {'suggestions': suggestions, 'provider': provider}
+    except ProviderError as e:
+        return suggestions_from_text(e)
+
+def keyword_suggestions(prompt: str) -> List[Dict[str, str]]:
+    """Suggestions picked by keywords of the prompt, for when no provider could answer."""
+    suggestions = []
+    
+    # Check for keywords and add relevant suggestions
+    if any(keyword in prompt.lower() for keyword in ['student', 'class', 'study', 'school', 'college']):
+        suggestions.append({
+            'title': 'Add Class Schedule Component',
+            'description': 'Include a dedicated section for tracking classes with time slots and locations.'
+        })
+        suggestions.append({
+            'title': 'Add Assignment Tracker',
+            'description': 'Include a special to-do section specifically for tracking assignments and due dates.'
+        })
+        suggestions.append({
+            'title': 'Add Study Timer',
+            'description': 'Include a Pomodoro-style study timer section to track focused study sessions.'
+        })
+    
+    if any(keyword in prompt.lower() for keyword in ['work', 'job', 'professional', 'career', 'business']):
+        suggestions.append({
+            'title': 'Add Meeting Notes Section',
+            'description': 'Include a dedicated area for taking notes during meetings.'
+        })
+        suggestions.append({
+            'title': 'Add Project Timeline',
+            'description': 'Include a project tracking section with milestones and deadlines.'
+        })
+        suggestions.append({
+            'title': 'Add Work/Life Balance Tracker',
+            'description': 'Track overtime hours and ensure you maintain a healthy work/life balance.'
+        })
+    
+    if any(keyword in prompt.lower() for keyword in ['fitness', 'workout', 'exercise', 'gym', 'health']):
+        suggestions.append({
+            'title': 'Add Workout Log',
+            'description': 'Include a section to track exercises, sets, reps, and weights.'
+        })
+        suggestions.append({
+            'title': 'Add Nutrition Tracker',
+            'description': 'Track daily water intake, meals, and calories.'
+        })
+        suggestions.append({
+            'title': 'Add Body Measurements Log',
+            'description': 'Track progress with weight, measurements, and other fitness metrics.'
+        })
+    
+    # Add some general suggestions if we don't have enough specific ones
+    if len(suggestions) < 3:
+        general_suggestions = [
+            {
+                'title': 'Enhanced Habit Tracker',
+                'description': 'Track multiple habits with color coding and streak counting.'
+            },
+            {
+                'title': 'Goal Setting Framework',
+                'description': 'Include a structured approach to setting and tracking weekly and monthly goals.'
+            },
+            {
+                'title': 'Daily Reflection Prompts',
+                'description': 'Add guided reflection questions for end-of-day journaling.'
+            },
+            {
+                'title': 'Priority Matrix',
+                'description': 'Include a quadrant-based priority system for tasks (urgent/important matrix).'
+            },
+            {
+                'title': 'Mood Tracker',
+                'description': 'Track your daily mood and emotional well-being.'
+            },
+            {
+                'title': 'Gratitude Journal',
+                'description': 'Include a section to write down things you\'re grateful for each day.'
+            }
+        ]
+        
+        # Add general suggestions until we have at least 3
+        for suggestion in general_suggestions:
+            if len(suggestions) >= 3:
+                break
+            if not any(s['title'] == suggestion['title'] for s in suggestions):
+                suggestions.append(suggestion)
+    
+    return suggestions